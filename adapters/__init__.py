@@ -1,5 +1,5 @@
 # adapters/__init__.py
-from .base_bot import BaseBot
+from .base_bot import BaseBot, GenerationCancelled
 from .kimi_bot import KimiBot
 from .lmarena_bot import LMArenaBot
 from .yuanbao_bot import YuanbaoBot
@@ -7,6 +7,7 @@ from .deepseek_bot import DeepSeekBot
 
 __all__ = [
     "BaseBot",
+    "GenerationCancelled",
     "KimiBot", 
     "LMArenaBot",
     "YuanbaoBot",
@@ -1,5 +1,72 @@
 # adapters/base_bot.py
+import json
+import time
 from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from .completion_signal import CompletionSignal
+from .network_capture import NetworkCapture
+from .selector_cache import SelectorCache
+from config import (USE_COMPLETION_SIGNAL, SIGNAL_DEBOUNCE_MS, ANSWER_START_GRACE, FOCUS_FREE,
+                    CAPTURE_MODE, CAPTURE_START_TIMEOUT, CHECK_INTERVAL, MAX_WAIT_TIME)
+
+# 调用已安装的提取函数；未安装（首次或页面跳转后）返回 null
+_CALL_EXTRACTOR_JS = """
+const f = (window.__webllmExtractors || {})[arguments[0]];
+return f ? JSON.stringify(f()) : null;
+"""
+
+# 安装提取函数并立即调用一次（函数体由 EXTRACT_JS 拼入，避免页面 CSP 禁用 eval）
+# 提取函数中用 latest(selector) 取最新一条消息容器：记住上次找到的容器，之后只在它的子节点和后面的节点中
+# 查找更新的，轮询开销与页面中的历史消息数无关；容器已被移除（页面重新渲染、新对话）时才查找整个页面
+_INSTALL_EXTRACTOR_JS = """
+const w = window;
+w.__webllmExtractors = w.__webllmExtractors || {};
+const cache = w.__webllmLatest = w.__webllmLatest || {};
+const latest = function (sel) {
+    let last = cache[sel];
+    if (last && last.isConnected) {
+        const inner = last.querySelectorAll(sel);
+        if (inner.length) last = inner[inner.length - 1];
+        for (let node = last; node && node !== document.body; node = node.parentElement) {
+            for (let s = node.nextElementSibling; s; s = s.nextElementSibling) {
+                if (s.matches(sel)) last = s;
+                const found = s.querySelectorAll(sel);
+                if (found.length) last = found[found.length - 1];
+            }
+        }
+    } else {
+        const all = document.querySelectorAll(sel);
+        last = all.length ? all[all.length - 1] : null;
+    }
+    cache[sel] = last;
+    return last;
+};
+const f = w.__webllmExtractors[arguments[0]] = function () {
+%s
+};
+return JSON.stringify(f());
+"""
+
+# 点击第一个存在的停止生成按钮，返回命中的选择器
+_STOP_JS = """
+const __webllmStop = arguments[0];
+for (const sel of __webllmStop) {
+    const el = document.querySelector(sel);
+    if (el) { el.click(); return sel; }
+}
+return null;
+"""
+
+# 健康探测：页面是否可响应、输入框是否存在（一次 run_js，不改动页面）
+_PROBE_JS = """
+const __webllmProbe = arguments[0];
+const input = __webllmProbe.some(sel => document.querySelector(sel));
+return JSON.stringify({ready: document.readyState, input: input, url: location.href});
+"""
+
+
+class GenerationCancelled(Exception):
+    """调用方已取消（如客户端断开），生成已停止"""
 
 
 class BaseBot(ABC):
@@ -10,6 +77,31 @@ class BaseBot(ABC):
     2. 多例模式: 传入 tab，使用外部提供的标签页
     """
     
+    # 生成状态选择器（CSS），子类按站点覆盖，见 CompletionSignal
+    # {"busy": [生成中才存在的元素], "done": [回答完成后出现的元素]}
+    COMPLETION_SIGNAL = None
+    
+    # 回答提取脚本（JS 函数体，返回 {thought, answer}），子类覆盖
+    # 每个标签页只安装一次，之后每次轮询只需一次 run_js
+    EXTRACT_JS = None
+    
+    # 停止生成按钮（CSS），取消请求时点击，子类覆盖
+    STOP_SELECTORS = []
+    
+    # 输入框（CSS），健康探测用，子类覆盖；找不到说明已退出登录或被验证码页面拦截
+    INPUT_SELECTORS = []
+    
+    # 网络捕获（CAPTURE_MODE="network"）：补全接口的 URL 模式和流式响应解析器（StreamParser 子类），子类覆盖
+    STREAM_URLS = []
+    STREAM_PARSER = None
+    
+    # 选择器命中缓存，每个子类一份（见 __init_subclass__）
+    selector_cache = SelectorCache("BaseBot")
+    
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.selector_cache = SelectorCache(cls.__name__)
+    
     def __init__(self, page=None, tab=None):
         """
         初始化 Bot
@@ -22,6 +114,14 @@ class BaseBot(ABC):
         self.tab = tab
         self.name = "BaseBot"
         self.url = ""
+        self.on_progress = None  # 流式回调: on_progress(thought, answer)，传入当前累计文本
+        self._signal = None      # 本轮提问的完成信号
+        self.timings = {}        # 各阶段耗时（秒）: activate / new_chat / select_model / input / ttft / generation
+        self.timed_out = False   # 本轮是否等待回答超时
+        self._sent_at = None     # 本轮问题发送时间，用于计算首字延迟
+        self.deadline = None     # 请求截止时间（time.time()），等待回答不超过该时间
+        self.cancel_event = None # threading.Event，设置后等待循环停止生成并抛出 GenerationCancelled
+        self._capture = None     # 本轮使用的网络捕获（CAPTURE_MODE="network"，每个标签页一个）
 
     @abstractmethod
     def activate(self) -> bool:
@@ -40,4 +140,241 @@ class BaseBot(ABC):
     
     def set_tab(self, tab):
         """设置外部标签页"""
-        self.tab = tab
\ No newline at end of file
+        self.tab = tab
+
+    def _find_element(self, key: str, selectors: list, timeout: float = 2):
+        """按用途查找元素，优先使用上次命中的选择器"""
+        if not self.tab:
+            return None
+        return self.selector_cache.find(self.tab, key, selectors, timeout)
+
+    @contextmanager
+    def timed(self, phase: str):
+        """记录一个阶段的耗时到 self.timings（同名阶段累加）"""
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.timings[phase] = self.timings.get(phase, 0.0) + time.time() - start
+
+    def _notify_progress(self, thought: str, answer: str):
+        """把轮询到的生成进度推送给流式回调"""
+        if not self.on_progress:
+            return
+        try:
+            self.on_progress(thought, answer)
+        except Exception as e:
+            print(f"[{self.name}] 推送进度失败: {e}")
+
+    def _arm_completion_signal(self) -> bool:
+        """发送问题前调用：注入完成信号观察器，网络捕获模式下同时开始截获本轮的流式响应"""
+        self._signal = None
+        self._sent_at = time.time()
+        self.timed_out = False
+        self._arm_capture()
+        if not (USE_COMPLETION_SIGNAL and self.tab and self.COMPLETION_SIGNAL):
+            return False
+        
+        signal = CompletionSignal(
+            self.tab,
+            busy=self.COMPLETION_SIGNAL.get("busy", []),
+            done=self.COMPLETION_SIGNAL.get("done", []),
+            name=self.name,
+            debounce_ms=SIGNAL_DEBOUNCE_MS
+        )
+        if signal.arm():
+            self._signal = signal
+        return self._signal is not None
+
+    def _arm_capture(self) -> bool:
+        """开始截获补全接口的流式响应（未启用或站点未配置时不做任何事）"""
+        self._capture = None
+        if not (CAPTURE_MODE == "network" and self.tab and self.STREAM_URLS and self.STREAM_PARSER):
+            return False
+        self._capture = NetworkCapture.of(self.tab, self.STREAM_URLS, self.STREAM_PARSER, name=self.name)
+        return self._capture.arm()
+
+    def _wait_for_capture(self):
+        """
+        网络捕获模式下等待回答：每个数据块到达即推送，站点的结束标记或响应结束即完成，
+        思考过程和回答按接口字段区分
+        
+        Returns:
+            {"thought", "answer"}；未启用、CAPTURE_START_TIMEOUT 内未截获到补全响应或解析不出内容时返回 None，
+            由调用方退回 DOM 轮询
+        
+        Raises:
+            GenerationCancelled: 请求已取消（已点击停止生成）
+        """
+        capture = self._capture
+        if not (capture and capture.armed):
+            return None
+        try:
+            return self._follow_capture(capture)
+        finally:
+            capture.disarm()
+
+    def _follow_capture(self, capture):
+        """跟随本轮的补全响应直到结束，返回值同 _wait_for_capture"""
+        start = time.time()
+        max_wait = self._max_wait(MAX_WAIT_TIME)
+        prev = {"thought": "", "answer": ""}
+        while True:
+            self.check_cancelled()
+            elapsed = time.time() - start
+            if not capture.matched and elapsed >= min(CAPTURE_START_TIMEOUT, max_wait):
+                print(f"[{self.name}] 未截获到补全响应，改为读取页面")
+                return None
+            if elapsed >= max_wait:
+                print(f"[{self.name}] ⚠️ 超时")
+                self.timed_out = True
+                break
+            
+            finished = capture.wait(min(CHECK_INTERVAL, max_wait - elapsed))
+            self.check_cancelled()
+            current = capture.snapshot()
+            if current != prev and (current["thought"] or current["answer"]):
+                if "ttft" not in self.timings and self._sent_at:
+                    self.timings["ttft"] = time.time() - self._sent_at
+                self._notify_progress(current["thought"], current["answer"])
+                prev = current
+            if finished:
+                print(f"[{self.name}] ✅ 完成 (网络捕获, {time.time() - start:.1f}s)")
+                break
+        
+        if self.timed_out:
+            return prev
+        if capture.failed or not prev["answer"]:
+            print(f"[{self.name}] 补全响应中没有回答，改为读取页面")
+            return None
+        return prev
+
+    def _activate_tab(self):
+        """
+        请求前唤醒标签页
+        
+        FOCUS_FREE 时只确保页面处于 active 生命周期（未被冻结），不切换前台，并行的标签页互不抢焦点；
+        否则切换到前台
+        """
+        if FOCUS_FREE:
+            try:
+                self.tab.run_cdp("Page.setWebLifecycleState", state="active")
+            except Exception as e:
+                print(f"[{self.name}] 设置页面生命周期失败: {e}")
+            return
+        self.tab.set.activate()
+
+    def _sleep(self, seconds: float):
+        """可被取消打断的 sleep"""
+        if self.cancel_event is not None:
+            self.cancel_event.wait(seconds)
+        else:
+            time.sleep(seconds)
+
+    def stop_generation(self) -> bool:
+        """点击站点的停止生成按钮，返回是否点到"""
+        if not self.tab or not self.STOP_SELECTORS:
+            return False
+        try:
+            clicked = self.tab.run_js(_STOP_JS, list(self.STOP_SELECTORS))
+        except Exception as e:
+            print(f"[{self.name}] 停止生成失败: {e}")
+            return False
+        if clicked:
+            print(f"[{self.name}] ⏹ 已停止生成")
+        return bool(clicked)
+
+    def probe(self):
+        """
+        健康探测（标签页池后台巡检调用）
+        
+        Returns:
+            None 表示健康，否则为问题描述
+        """
+        if not self.tab:
+            return "标签页不存在"
+        try:
+            raw = self.tab.run_js(_PROBE_JS, list(self.INPUT_SELECTORS))
+            state = json.loads(raw) if raw else {}
+        except Exception as e:
+            return f"页面无响应: {e}"
+        if state.get("ready") not in ("interactive", "complete"):
+            return f"页面未加载完成 ({state.get('ready')})"
+        if self.INPUT_SELECTORS and not state.get("input"):
+            return f"找不到输入框，可能已退出登录或出现验证码 ({state.get('url', '')})"
+        return None
+
+    def check_cancelled(self):
+        """
+        已取消时停止生成并抛出 GenerationCancelled
+        
+        Raises:
+            GenerationCancelled: cancel_event 已设置
+        """
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            self.stop_generation()
+            raise GenerationCancelled("请求已取消")
+
+    def _wait_for_start(self):
+        """未启用完成信号时，沿用固定的起始等待"""
+        if not self._signal:
+            self._sleep(2)
+
+    def _max_wait(self, limit: float) -> float:
+        """本轮等待回答的最长时间：limit 与距截止时间的剩余时间中较小者"""
+        if self.deadline is None:
+            return limit
+        return max(0.0, min(limit, self.deadline - time.time()))
+
+    def _wait_tick(self, interval: float) -> bool:
+        """
+        等待一个检测间隔，完成信号触发时提前返回
+        
+        Returns:
+            完成信号是否已触发
+        
+        Raises:
+            GenerationCancelled: 请求已取消（已点击停止生成）
+        """
+        self.check_cancelled()
+        if self._signal:
+            finished = self._signal.wait(interval)
+        else:
+            self._sleep(interval)
+            finished = False
+        self.check_cancelled()
+        return finished
+
+    def _stability_allowed(self, elapsed: float) -> bool:
+        """文本稳定判定是否可用：页面仍在生成时，短暂停顿不算完成"""
+        signal = self._signal
+        if not signal:
+            return True
+        if signal.busy:
+            return False
+        return signal.started or elapsed >= ANSWER_START_GRACE
+
+    def _run_extractor(self) -> dict:
+        """
+        单次 run_js 取回 {"thought", "answer"} 快照
+        
+        提取函数首次调用时安装到页面的 window.__webllmExtractors，
+        之后每次轮询只发送一条调用语句
+        """
+        result = {"thought": "", "answer": ""}
+        if not self.tab or not self.EXTRACT_JS:
+            return result
+        
+        key = type(self).__name__
+        try:
+            raw = self.tab.run_js(_CALL_EXTRACTOR_JS, key)
+            if raw is None:
+                raw = self.tab.run_js(_INSTALL_EXTRACTOR_JS % self.EXTRACT_JS, key)
+            snapshot = json.loads(raw) if raw else {}
+            result["thought"] = (snapshot.get("thought") or "").strip()
+            result["answer"] = (snapshot.get("answer") or "").strip()
+            if self._sent_at and "ttft" not in self.timings and (result["thought"] or result["answer"]):
+                self.timings["ttft"] = time.time() - self._sent_at
+        except Exception as e:
+            print(f"[{self.name}] 提取回答失败: {e}")
+        return result
\ No newline at end of file
@@ -0,0 +1,48 @@
+# adapters/cdp_events.py
+"""
+CDP 事件分发
+
+DrissionPage 的 tab.driver.set_callback 每个事件只保存一个回调，
+标签页池（资源统计）和网络捕获都要监听 Network 事件，完成信号监听 Runtime.bindingCalled，
+统一经这里登记，按登记顺序依次回调
+"""
+
+import threading
+
+_lock = threading.Lock()
+
+
+def listen(tab, event: str, callback):
+    """
+    登记事件回调（同一标签页上可以有多个）
+
+    Raises:
+        设置 CDP 回调失败时抛出原异常
+    """
+    driver = tab.driver
+    with _lock:
+        listeners = getattr(driver, "_webllm_listeners", None)
+        if listeners is None:
+            listeners = {}
+            setattr(driver, "_webllm_listeners", listeners)
+        if event not in listeners:
+            callbacks = []
+
+            def dispatch(**params):
+                for func in list(callbacks):
+                    try:
+                        func(**params)
+                    except Exception as e:
+                        print(f"[CDP] 事件回调异常: {event}: {e}")
+
+            driver.set_callback(event, dispatch)
+            listeners[event] = callbacks
+        listeners[event].append(callback)
+
+
+def unlisten(tab, event: str, callback):
+    """取消登记（未登记过时忽略）"""
+    with _lock:
+        callbacks = getattr(tab.driver, "_webllm_listeners", {}).get(event, [])
+        if callback in callbacks:
+            callbacks.remove(callback)
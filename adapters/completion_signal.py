@@ -0,0 +1,184 @@
+# adapters/completion_signal.py
+"""
+生成完成信号引擎
+
+向标签页注入 MutationObserver 和站点特定的"生成结束"判定：
+- busy: 生成过程中才存在的元素（如停止按钮）
+- done: 每条回答完成后出现的元素（如复制 / 重新生成工具栏）
+
+看到 busy 出现后，busy 消失或 done 数量增加即判定完成，
+通过 CDP Runtime binding 立即唤醒 Python 端的等待线程；binding 不可用时退化为轮询页面状态
+"""
+
+import json
+import threading
+import time
+
+from .cdp_events import listen
+
+BINDING_NAME = "__webllmSignal"
+
+_OBSERVER_JS = """
+const cfg = arguments[0];
+const w = window;
+if (w.__webllmObserver) w.__webllmObserver.disconnect();
+const count = (sels) => sels.reduce((n, s) => n + document.querySelectorAll(s).length, 0);
+const isBusy = () => cfg.busy.some((s) => document.querySelector(s));
+// 布防时 busy 元素已存在说明选择器不可靠，本轮不使用
+const busyUsable = !isBusy();
+const base = count(cfg.done);
+const state = w.__webllmState = {round: cfg.round, busy: false, started: false, done: false};
+const report = () => {
+    // 已被下一轮的观察器取代
+    if (w.__webllmState !== state || typeof w[cfg.binding] !== 'function') return;
+    try { w[cfg.binding](JSON.stringify(state)); } catch (e) {}
+};
+let timer = null;
+const check = () => {
+    timer = null;
+    if (state.done) return;
+    const busy = busyUsable && isBusy();
+    const changed = busy !== state.busy;
+    state.busy = busy;
+    if (busy) state.started = true;
+    if (state.started && (!busy || count(cfg.done) > base)) state.done = true;
+    if (changed || state.done) report();
+    if (state.done) observer.disconnect();
+};
+const observer = w.__webllmObserver = new MutationObserver(() => {
+    if (!timer) timer = setTimeout(check, cfg.debounce);
+});
+observer.observe(document.body, {childList: true, subtree: true, characterData: true, attributes: true});
+return true;
+"""
+
+_STATE_JS = "return window.__webllmState ? JSON.stringify(window.__webllmState) : null;"
+
+
+class CompletionSignal:
+    """
+    单个标签页上的生成完成信号
+
+    用法:
+        signal = CompletionSignal(tab, busy=[...], done=[...])
+        signal.arm()               # 发送问题前调用，记录基线
+        while ...:
+            if signal.wait(0.5):   # 完成时立即返回 True
+                break
+    """
+
+    def __init__(self, tab, busy: list, done: list, name: str = "Signal", debounce_ms: int = 100):
+        self.tab = tab
+        self.busy_selectors = list(busy)
+        self.done_selectors = list(done)
+        self.name = name
+        self.debounce_ms = debounce_ms
+
+        self.armed = False
+        self.busy = False       # 页面当前是否处于生成中
+        self.started = False    # 本轮是否观察到生成开始
+        self.done = False       # 本轮是否已判定生成结束
+
+        self._round = 0         # 本轮轮次（标签页级计数，见 arm）
+        self._pushed = False    # 是否通过 binding 推送状态
+        self._event = threading.Event()
+
+    def _register_binding(self) -> bool:
+        """
+        注册 CDP binding，页面调用 window.__webllmSignal(...) 时回调 Python
+
+        适配器每次提问都新建 CompletionSignal：binding 和事件回调每个标签页只登记一次，
+        回调转给标签页上当前的完成信号（见 arm）
+        """
+        tab = self.tab
+        if getattr(tab, "_webllm_signal_binding", False):
+            return True
+        try:
+            tab.run_cdp('Runtime.addBinding', name=BINDING_NAME)
+
+            def dispatch(**params):
+                signal = getattr(tab, "_webllm_signal", None)
+                if signal is not None:
+                    signal._on_binding(**params)
+
+            listen(tab, 'Runtime.bindingCalled', dispatch)
+            setattr(tab, "_webllm_signal_binding", True)
+            return True
+        except Exception as e:
+            print(f"[{self.name}] 完成信号 binding 不可用，改为轮询: {e}")
+            return False
+
+    def _on_binding(self, name=None, payload=None, **kwargs):
+        """binding 回调（在 DrissionPage 事件线程中执行）"""
+        if name != BINDING_NAME or not payload:
+            return
+        try:
+            self._apply(json.loads(payload))
+        except ValueError:
+            pass
+
+    def _apply(self, state: dict):
+        """更新本地状态，完成时唤醒等待线程"""
+        if state.get("round") != self._round:
+            return  # 上一轮的迟到消息
+        self.busy = bool(state.get("busy"))
+        self.started = self.started or bool(state.get("started"))
+        if state.get("done"):
+            self.done = True
+            self._event.set()
+
+    def arm(self) -> bool:
+        """
+        注入观察器并记录基线（每轮提问发送前调用）
+
+        适配器每次提问都新建 CompletionSignal，轮次计数和当前信号放在标签页上：
+        binding 回调只交给本轮的信号，上一轮迟到的消息按轮次识别出来
+        """
+        self._round = getattr(self.tab, "_webllm_signal_round", 0) + 1
+        setattr(self.tab, "_webllm_signal_round", self._round)
+        setattr(self.tab, "_webllm_signal", self)
+        self.busy = self.started = self.done = False
+        self._event.clear()
+
+        if not self._pushed:
+            self._pushed = self._register_binding()
+
+        try:
+            self.armed = bool(self.tab.run_js(_OBSERVER_JS, {
+                "round": self._round,
+                "busy": self.busy_selectors,
+                "done": self.done_selectors,
+                "binding": BINDING_NAME,
+                "debounce": self.debounce_ms,
+            }))
+        except Exception as e:
+            print(f"[{self.name}] 注入完成信号失败: {e}")
+            self.armed = False
+        return self.armed
+
+    def poll(self):
+        """主动读取页面状态（binding 不可用时使用）"""
+        try:
+            raw = self.tab.run_js(_STATE_JS)
+            if raw:
+                self._apply(json.loads(raw))
+        except Exception:
+            pass
+
+    def wait(self, timeout: float) -> bool:
+        """
+        最多等待 timeout 秒
+
+        Returns:
+            是否已判定生成结束
+        """
+        if not self.armed:
+            time.sleep(timeout)
+            return False
+
+        if self._pushed:
+            self._event.wait(timeout)
+        else:
+            time.sleep(timeout)
+            self.poll()
+        return self.done
@@ -1,17 +1,112 @@
 # adapters/deepseek_bot.py
 import time
-from .base_bot import BaseBot
+from .base_bot import BaseBot, GenerationCancelled
+from .network_capture import SSEParser
 from config import STABLE_WAIT_TIME, CHECK_INTERVAL, MAX_WAIT_TIME
 
 DEEPSEEK_URL = "https://chat.deepseek.com"
 
 
+class DeepSeekStream(SSEParser):
+    """
+    /api/v0/chat/completion 的 SSE 增量
+    
+    {"p": 路径, "o": 操作, "v": 值}，省略 p 时沿用上一条的路径；
+    回答由 fragments 组成（type 为 THINK 的是思考过程），新 fragment 以列表 APPEND 到 response/fragments，
+    之后的字符串追加到最后一个 fragment；旧版直接追加到 response/thinking_content / response/content；
+    response/status 变为 FINISHED 即结束
+    """
+    
+    def __init__(self):
+        super().__init__()
+        self.path = ""
+        self.kind = "answer"  # 最后一个 fragment 的类型
+    
+    def _append(self, path: str, text: str):
+        if not path.endswith("content"):
+            return
+        if "thinking" in path or (path.startswith("response/fragments") and self.kind == "thought"):
+            self.thought += text
+        else:
+            self.answer += text
+    
+    def _fragments(self, fragments: list):
+        for fragment in fragments:
+            if isinstance(fragment, dict):
+                self.kind = "thought" if fragment.get("type") == "THINK" else "answer"
+                self._append("response/fragments/-1/content", fragment.get("content") or "")
+    
+    def on_event(self, payload):
+        if not isinstance(payload, dict):
+            return
+        self.path = payload.get("p", self.path)
+        value = payload.get("v")
+        if isinstance(value, str):
+            if self.path.endswith("status"):
+                self.done = self.done or value == "FINISHED"
+            else:
+                self._append(self.path, value)
+        elif isinstance(value, dict) and isinstance(value.get("response"), dict):
+            response = value["response"]  # 首条消息: 完整的初始状态
+            self._append("response/thinking_content", response.get("thinking_content") or "")
+            self._append("response/content", response.get("content") or "")
+            self._fragments(response.get("fragments") or [])
+        elif isinstance(value, list):
+            if self.path.endswith("fragments"):
+                self._fragments(value)
+            else:  # BATCH: 多个 {"p", "v"}
+                for item in value:
+                    if isinstance(item, dict) and str(item.get("p", "")).endswith("status"):
+                        self.done = self.done or item.get("v") == "FINISHED"
+
+
 class DeepSeekBot(BaseBot):
     """
     DeepSeek (chat.deepseek.com) 网页机器人
     支持深度思考模式
     """
     
+    COMPLETION_SIGNAL = {
+        "busy": [
+            'div.ds-message div.ds-loading',
+            'div[role="button"][aria-label*="停止"]',
+            'div[role="button"][aria-label*="Stop"]',
+        ],
+        "done": ['div.ds-message-feedback-container', 'div[class*="message-actions"]'],
+    }
+    
+    STOP_SELECTORS = ['div[role="button"][aria-label*="停止"]', 'div[role="button"][aria-label*="Stop"]']
+    INPUT_SELECTORS = ['textarea[placeholder*="DeepSeek"]', 'textarea[placeholder*="发送消息"]', 'textarea']
+    
+    STREAM_URLS = ['*chat.deepseek.com/api/v0/chat/completion*']
+    STREAM_PARSER = DeepSeekStream
+    
+    EXTRACT_JS = """
+    const result = {thought: "", answer: ""};
+    const last = latest('div.ds-message');
+    if (!last) return result;
+    
+    // 思考部分
+    const think = last.querySelector('div.ds-think-content div.ds-markdown');
+    if (think) result.thought = think.innerText.trim();
+    
+    // 回答部分：父节点不属于思考区域的 markdown
+    for (const md of last.querySelectorAll('div.ds-markdown')) {
+        const parentClass = String((md.parentElement && md.parentElement.className) || "");
+        if (!parentClass.toLowerCase().includes('think')) {
+            result.answer = md.innerText.trim();
+            break;
+        }
+    }
+    
+    // 最后的备用方案
+    if (!result.answer) {
+        const full = last.innerText.trim();
+        result.answer = result.thought ? full.replace(result.thought, "").trim() : full;
+    }
+    return result;
+    """
+    
     def __init__(self, page=None, tab=None):
         super().__init__(page, tab)
         self.name = "DeepSeek"
@@ -21,7 +116,7 @@ class DeepSeekBot(BaseBot):
         """激活标签页"""
         try:
             if self.tab:
-                self.tab.set.activate()
+                self._activate_tab()
                 if "deepseek.com" not in self.tab.url:
                     self.tab.get(self.url)
                     time.sleep(2)
@@ -31,7 +126,7 @@ class DeepSeekBot(BaseBot):
                 for tab in self.page.get_tabs():
                     if "deepseek.com" in tab.url:
                         self.tab = tab
-                        self.tab.set.activate()
+                        self._activate_tab()
                         return True
                 
                 self.tab = self.page.latest_tab
@@ -56,92 +151,52 @@ class DeepSeekBot(BaseBot):
             'tag:textarea',
         ]
         
-        for sel in selectors:
-            try:
-                ele = self.tab.ele(sel, timeout=2)
-                if ele:
-                    return ele
-            except:
-                continue
-        return None
+        return self._find_element("input", selectors, timeout=2)
 
     def _get_last_answer(self) -> dict:
-        """获取最后回答（区分思考和回答）"""
-        result = {"thought": "", "answer": ""}
-        if not self.tab:
-            return result
-        
-        try:
-            messages = self.tab.eles('css:div.ds-message')
-            if not messages:
-                return result
-            
-            last = messages[-1]
-            
-            # 思考部分
-            try:
-                think = last.ele('css:div.ds-think-content div.ds-markdown', timeout=1)
-                if think:
-                    result["thought"] = think.text.strip()
-            except:
-                pass
-            
-            # 回答部分
-            try:
-                all_md = last.eles('css:div.ds-markdown')
-                for md in all_md:
-                    parent_class = ""
-                    try:
-                        parent_class = md.parent().attr('class') or ""
-                    except:
-                        pass
-                    
-                    if "think" not in parent_class.lower():
-                        result["answer"] = md.text.strip()
-                        break
-            except:
-                pass
-            
-            # 最后的备用方案
-            if not result["answer"]:
-                full = last.text.strip()
-                if result["thought"]:
-                    result["answer"] = full.replace(result["thought"], "").strip()
-                else:
-                    result["answer"] = full
-                    
-        except Exception as e:
-            print(f"[{self.name}] 获取回答失败: {e}")
-        
-        return result
+        """获取最后回答（区分思考和回答），每次轮询一次 run_js"""
+        return self._run_extractor()
 
     def _wait_for_response(self) -> dict:
         """等待回答完成"""
         print(f"[{self.name}] ⏳ 等待回答...")
-        time.sleep(2)
+        captured = self._wait_for_capture()
+        if captured is not None:
+            return captured
+        self._wait_for_start()
         
         prev = ""
         stable = 0
+        start = time.time()
         elapsed = 0
         required = int(STABLE_WAIT_TIME / CHECK_INTERVAL)
         
-        while elapsed < MAX_WAIT_TIME:
-            time.sleep(CHECK_INTERVAL)
-            elapsed += CHECK_INTERVAL
+        max_wait = self._max_wait(MAX_WAIT_TIME)
+        while elapsed < max_wait:
+            finished = self._wait_tick(CHECK_INTERVAL)
+            elapsed = time.time() - start
             
             current = self._get_last_answer()
             text = current.get("answer", "") + current.get("thought", "")
             
+            if finished and current.get("answer"):
+                print(f"[{self.name}] ✅ 完成信号 ({elapsed:.1f}s)")
+                return current
+            
             if text and text == prev:
-                stable += 1
-                if stable >= required:
-                    print(f"[{self.name}] ✅ 完成 ({elapsed:.1f}s)")
-                    return current
+                if self._stability_allowed(elapsed):
+                    stable += 1
+                    if stable >= required:
+                        print(f"[{self.name}] ✅ 完成 ({elapsed:.1f}s)")
+                        return current
             else:
                 stable = 0
+                if text:
+                    self._notify_progress(current.get("thought", ""), current.get("answer", ""))
             prev = text
         
         print(f"[{self.name}] ⚠️ 超时")
+        self.timed_out = True
         return self._get_last_answer()
 
     def ask(self, query: str) -> dict:
@@ -152,21 +207,26 @@ class DeepSeekBot(BaseBot):
         print(f"[{self.name}] 📝 提问: {query[:50]}...")
 
         try:
-            input_box = self._find_input_box()
-            if not input_box:
-                return {"thought": "", "answer": "Error: 找不到输入框"}
+            with self.timed("input"):
+                input_box = self._find_input_box()
+                if not input_box:
+                    return {"thought": "", "answer": "Error: 找不到输入框"}
             
-            input_box.click()
-            time.sleep(0.2)
-            input_box.clear()
-            input_box.input(query)
-            time.sleep(0.5)
+                input_box.click()
+                time.sleep(0.2)
+                input_box.clear()
+                input_box.input(query)
+                time.sleep(0.5)
             
+            self._arm_completion_signal()
             self.tab.actions.key_down('Enter').key_up('Enter')
             print(f"[{self.name}] 📤 已发送")
             
-            return self._wait_for_response()
+            with self.timed("generation"):
+                return self._wait_for_response()
 
+        except GenerationCancelled:
+            raise
         except Exception as e:
             import traceback
             traceback.print_exc()
@@ -192,15 +252,14 @@ class DeepSeekBot(BaseBot):
                 'css:button[class*="create"]',
             ]
             
-            for sel in selectors:
+            btn = self._find_element("new_chat", selectors, timeout=1)
+            if btn:
                 try:
-                    btn = self.tab.ele(sel, timeout=1)
-                    if btn:
-                        btn.click()
-                        time.sleep(1)
-                        return True
+                    btn.click()
+                    time.sleep(1)
+                    return True
                 except:
-                    continue
+                    pass
             
             self.tab.refresh()
             time.sleep(2)
@@ -1,12 +1,56 @@
 # adapters/kimi_bot.py
 import time
-from .base_bot import BaseBot
+from .base_bot import BaseBot, GenerationCancelled
+from .network_capture import SSEParser
 from config import KIMI_URL, STABLE_WAIT_TIME, CHECK_INTERVAL, MAX_WAIT_TIME
 
 
+class KimiStream(SSEParser):
+    """
+    /api/chat/<会话 ID>/completion/stream 的 SSE
+    
+    {"event": "cmpl", "text": 回答增量} / {"event": "k1", "text": 思考增量}，{"event": "all_done"} 结束
+    """
+    
+    def on_event(self, payload):
+        if not isinstance(payload, dict):
+            return
+        event = payload.get("event")
+        if event == "cmpl":
+            self.answer += payload.get("text") or ""
+        elif event == "k1":
+            self.thought += payload.get("text") or ""
+        elif event == "all_done":
+            self.done = True
+
+
 class KimiBot(BaseBot):
     """Kimi 网页机器人 - 支持多标签页并行"""
     
+    COMPLETION_SIGNAL = {
+        "busy": ['div.send-button-container.stop', 'div.stop-message-btn'],
+        "done": ['div.segment-assistant-actions'],
+    }
+    
+    STOP_SELECTORS = ['div.send-button-container.stop', 'div.stop-message-btn']
+    INPUT_SELECTORS = ['div[contenteditable="true"]', '[data-testid="chat-input"]']
+    
+    STREAM_URLS = ['*kimi.com/api/chat/*/completion/stream*', '*kimi.moonshot.cn/api/chat/*/completion/stream*']
+    STREAM_PARSER = KimiStream
+    
+    EXTRACT_JS = """
+    const selectors = [
+        'div[class*="markdown"]',
+        'div[data-testid="message-content"]',
+        'div[class*="message-content"]',
+    ];
+    for (const sel of selectors) {
+        const answer = latest(sel);
+        if (answer) return {thought: "", answer: answer.innerText};
+    }
+    return {thought: "", answer: ""};
+    """
+    
     def __init__(self, page=None, tab=None):
         super().__init__(page, tab)
         self.name = "Kimi"
@@ -17,7 +61,7 @@ class KimiBot(BaseBot):
         try:
             # 如果已有 tab，直接激活
             if self.tab:
-                self.tab.set.activate()
+                self._activate_tab()
                 
                 # 检查 URL 是否正确
                 if self.url not in self.tab.url:
@@ -33,7 +77,7 @@ class KimiBot(BaseBot):
                 for tab in tabs:
                     if self.url in tab.url:
                         self.tab = tab
-                        self.tab.set.activate()
+                        self._activate_tab()
                         return True
                 
                 # 未找到，打开新页面
@@ -62,63 +106,54 @@ class KimiBot(BaseBot):
             'css:div[placeholder]@@contenteditable=true',
         ]
         
-        for selector in selectors:
-            try:
-                ele = self.tab.ele(selector, timeout=2)
-                if ele:
-                    return ele
-            except:
-                continue
-        return None
+        return self._find_element("input", selectors, timeout=2)
 
     def _get_last_answer(self) -> str:
         """获取最后一条回答的文本"""
         if not self.tab:
             return ""
-            
-        selectors = [
-            'css:div[class*="markdown"]',
-            'css:div[data-testid="message-content"]',
-            'css:div[class*="message-content"]',
-        ]
-        
-        for selector in selectors:
-            try:
-                answers = self.tab.eles(selector)
-                if answers:
-                    return answers[-1].text.strip()
-            except:
-                continue
-        
-        return ""
+        return self._run_extractor()["answer"]
 
     def _wait_for_response(self) -> str:
         """等待回答生成完成"""
         print(f"[{self.name}] ⏳ 等待回答...")
-        time.sleep(2)
+        captured = self._wait_for_capture()
+        if captured is not None:
+            return captured["answer"]
+        self._wait_for_start()
         
         prev_text = ""
         stable_count = 0
+        start = time.time()
         elapsed = 0
         required = int(STABLE_WAIT_TIME / CHECK_INTERVAL)
         
-        while elapsed < MAX_WAIT_TIME:
-            time.sleep(CHECK_INTERVAL)
-            elapsed += CHECK_INTERVAL
+        max_wait = self._max_wait(MAX_WAIT_TIME)
+        while elapsed < max_wait:
+            finished = self._wait_tick(CHECK_INTERVAL)
+            elapsed = time.time() - start
             
             current = self._get_last_answer()
             
+            if finished and current:
+                print(f"[{self.name}] ✅ 完成信号 ({elapsed:.1f}s)")
+                return current
+            
             if current and current == prev_text:
-                stable_count += 1
-                if stable_count >= required:
-                    print(f"[{self.name}] ✅ 完成 ({elapsed:.1f}s)")
-                    return current
+                if self._stability_allowed(elapsed):
+                    stable_count += 1
+                    if stable_count >= required:
+                        print(f"[{self.name}] ✅ 完成 ({elapsed:.1f}s)")
+                        return current
             else:
                 stable_count = 0
+                if current:
+                    self._notify_progress("", current)
             
             prev_text = current
         
         print(f"[{self.name}] ⚠️ 超时")
+        self.timed_out = True
         return prev_text
 
     def ask(self, query: str) -> str:
@@ -129,24 +164,29 @@ class KimiBot(BaseBot):
         print(f"[{self.name}] 📝 提问: {query[:50]}...")
 
         try:
-            # 1. 定位输入框
-            input_box = self._find_input_box()
-            if not input_box:
-                return "Error: 找不到输入框"
+            with self.timed("input"):
+                # 1. 定位输入框
+                input_box = self._find_input_box()
+                if not input_box:
+                    return "Error: 找不到输入框"
             
-            # 2. 清空并输入问题
-            input_box.clear()
-            input_box.input(query)
-            time.sleep(0.5)
+                # 2. 清空并输入问题
+                input_box.clear()
+                input_box.input(query)
+                time.sleep(0.5)
             
             # 3. 按回车发送
+            self._arm_completion_signal()
             self.tab.actions.key_down('Enter').key_up('Enter')
             print(f"[{self.name}] 📤 已发送")
             
             # 4. 等待并获取回答
-            answer = self._wait_for_response()
+            with self.timed("generation"):
+                answer = self._wait_for_response()
             return answer if answer else "Error: 未获取到回答"
 
+        except GenerationCancelled:
+            raise
         except Exception as e:
             import traceback
             traceback.print_exc()
@@ -163,15 +203,14 @@ class KimiBot(BaseBot):
                 'tag:button@@text():新对话',
             ]
             
-            for selector in selectors:
+            btn = self._find_element("new_chat", selectors, timeout=1)
+            if btn:
                 try:
-                    btn = self.tab.ele(selector, timeout=1)
-                    if btn:
-                        btn.click()
-                        time.sleep(1)
-                        return True
+                    btn.click()
+                    time.sleep(1)
+                    return True
                 except:
-                    continue
+                    pass
             
             # 刷新页面作为备选
             self.tab.refresh()
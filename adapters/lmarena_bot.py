@@ -3,10 +3,41 @@
 LMArena 适配器 - 支持多标签页并发
 """
 
+import json
 import time
-from .base_bot import BaseBot
+from .base_bot import BaseBot, GenerationCancelled
+from .network_capture import StreamParser
 from config import LMARENA_URL, STABLE_WAIT_TIME, CHECK_INTERVAL, MAX_WAIT_TIME
 
+
+class LMArenaStream(StreamParser):
+    """
+    /nextjs-api/stream/... 的数据流（每行 "<位置><类型>:<JSON>"，不是 SSE）
+    
+    位置 a / b 为对战中的两个模型，直接模式只有 a；类型 0 为回答增量，g 为思考增量，d 为结束
+    """
+    
+    def parse_line(self, line: str):
+        prefix, sep, data = line.partition(":")
+        if not sep or prefix[:-1] not in ("", "a"):
+            return
+        kind = prefix[-1:]
+        if kind == "d":
+            self.done = True
+            return
+        if kind not in ("0", "g"):
+            return
+        try:
+            text = json.loads(data)
+        except ValueError:
+            return
+        if not isinstance(text, str):
+            return
+        if kind == "g":
+            self.thought += text
+        else:
+            self.answer += text
+
 class LMArenaBot(BaseBot):
     """
     LMArena (lmarena.ai) 网页机器人
@@ -14,6 +45,35 @@ class LMArenaBot(BaseBot):
     支持多标签页并发
     """
     
+    COMPLETION_SIGNAL = {
+        "busy": ['button[aria-label*="stop" i]'],
+        "done": ['button[aria-label*="copy" i]'],
+    }
+    
+    STOP_SELECTORS = ['button[aria-label*="stop" i]']
+    INPUT_SELECTORS = ['textarea[name="message"]', 'textarea']
+    
+    STREAM_URLS = ['*lmarena.ai/nextjs-api/stream/*']
+    STREAM_PARSER = LMArenaStream
+    
+    EXTRACT_JS = """
+    const result = {thought: "", answer: ""};
+    
+    // 回答容器: <div class="no-scrollbar relative flex w-full flex-1 flex-col overflow-x-auto...">
+    const last = latest('div.no-scrollbar.relative.flex') || latest('div[class*="no-scrollbar"][class*="flex-col"]');
+    if (!last) return result;
+    
+    // 思考过程: <div data-state="open" class="not-prose mb-4"> 内的 div.space-y-4
+    const thoughtDiv = last.querySelector('div.not-prose');
+    const thoughtContent = thoughtDiv && thoughtDiv.querySelector('div.space-y-4');
+    if (thoughtContent) result.thought = thoughtContent.innerText.trim();
+    
+    // 实际回答: <div class="prose prose-sm prose-pre:bg-transparent prose-pre:p-0 text-wrap break-words">
+    const answerDiv = last.querySelector('div.prose');
+    if (answerDiv) result.answer = answerDiv.innerText.trim();
+    return result;
+    """
+    
     def __init__(self, page=None, tab=None, model_name: str = None):
         """
         初始化 LMArena Bot
@@ -34,7 +94,7 @@ class LMArenaBot(BaseBot):
         try:
             # 多例模式：使用外部提供的 tab
             if self.tab:
-                self.tab.set.activate()
+                self._activate_tab()
                 
                 # 检查 URL 是否正确，不正确则跳转
                 if "lmarena.ai" not in self.tab.url:
@@ -54,7 +114,7 @@ class LMArenaBot(BaseBot):
                 for tab in tabs:
                     if "lmarena.ai" in tab.url:
                         self.tab = tab
-                        self.tab.set.activate()
+                        self._activate_tab()
                         print(f"[{self.name}] ✅ 已激活现有标签页")
                         return True
                 
@@ -98,15 +158,7 @@ class LMArenaBot(BaseBot):
                 'css:button[aria-haspopup="dialog"]',
             ]
             
-            button = None
-            for selector in combobox_selectors:
-                try:
-                    button = self.tab.ele(selector, timeout=2)
-                    if button:
-                        print(f"[{self.name}] 找到模型选择按钮")
-                        break
-                except:
-                    continue
+            button = self._find_element("model_button", combobox_selectors, timeout=2)
             
             if not button:
                 print(f"[{self.name}] ⚠️ 未找到模型选择按钮")
@@ -193,113 +245,65 @@ class LMArenaBot(BaseBot):
             'tag:textarea',
         ]
         
-        for selector in selectors:
-            try:
-                ele = self.tab.ele(selector, timeout=2)
-                if ele:
-                    return ele
-            except:
-                continue
-        
-        return None
+        return self._find_element("input", selectors, timeout=2)
 
     def _get_last_answer(self) -> dict:
         """
-        获取最后一条回答
+        获取最后一条回答（单次 run_js 取回快照）
         
         Returns:
             {"thought": "思考过程", "answer": "实际回答"}
         """
-        if not self.tab:
-            return {"thought": "", "answer": ""}
-        
-        try:
-            # 查找回答容器
-            # 根据 HTML 结构：<div class="no-scrollbar relative flex w-full flex-1 flex-col overflow-x-auto...">
-            container_selectors = [
-                'css:div.no-scrollbar.relative.flex',
-                'css:div[class*="no-scrollbar"][class*="flex-col"]',
-            ]
-            
-            containers = None
-            for selector in container_selectors:
-                try:
-                    containers = self.tab.eles(selector, timeout=2)
-                    if containers:
-                        break
-                except:
-                    continue
-            
-            if not containers:
-                return {"thought": "", "answer": ""}
-            
-            # 获取最后一个回答容器
-            last_container = containers[-1]
-            
-            # 提取思考过程（如果存在）
-            thought = ""
-            try:
-                # <div data-state="open" class="not-prose mb-4">
-                thought_div = last_container.ele('css:div.not-prose', timeout=1)
-                if thought_div:
-                    # 查找思考内容
-                    thought_content = thought_div.ele('css:div.space-y-4', timeout=1)
-                    if thought_content:
-                        thought = thought_content.text.strip()
-            except:
-                pass
-            
-            # 提取实际回答
-            answer = ""
-            try:
-                # <div class="prose prose-sm prose-pre:bg-transparent prose-pre:p-0 text-wrap break-words">
-                answer_div = last_container.ele('css:div.prose', timeout=1)
-                if answer_div:
-                    answer = answer_div.text.strip()
-            except:
-                pass
-            
-            return {"thought": thought, "answer": answer}
-            
-        except Exception as e:
-            print(f"[{self.name}] 提取回答时出错: {e}")
-            return {"thought": "", "answer": ""}
+        return self._run_extractor()
 
     def _wait_for_response(self) -> dict:
         """等待回答生成完成"""
         print(f"[{self.name}] ⏳ 等待回答...")
-        time.sleep(2)
+        captured = self._wait_for_capture()
+        if captured is not None:
+            return captured
+        self._wait_for_start()
         
         prev_answer = ""
         prev_thought = ""
         stable_count = 0
+        start = time.time()
         elapsed = 0
         required = int(STABLE_WAIT_TIME / CHECK_INTERVAL)
         
-        while elapsed < MAX_WAIT_TIME:
-            time.sleep(CHECK_INTERVAL)
-            elapsed += CHECK_INTERVAL
+        max_wait = self._max_wait(MAX_WAIT_TIME)
+        while elapsed < max_wait:
+            finished = self._wait_tick(CHECK_INTERVAL)
+            elapsed = time.time() - start
             
             current = self._get_last_answer()
             current_answer = current["answer"]
             current_thought = current["thought"]
             
+            if finished and current_answer:
+                print(f"[{self.name}] ✅ 完成信号 ({elapsed:.1f}s)")
+                return current
+            
             if current_answer and current_answer == prev_answer and current_thought == prev_thought:
-                stable_count += 1
-                if stable_count >= required:
-                    print(f"[{self.name}] ✅ 完成 ({elapsed:.1f}s)")
-                    return current
+                if self._stability_allowed(elapsed):
+                    stable_count += 1
+                    if stable_count >= required:
+                        print(f"[{self.name}] ✅ 完成 ({elapsed:.1f}s)")
+                        return current
             else:
                 stable_count = 0
                 if len(current_answer) > len(prev_answer):
                     print(f"[{self.name}] 回答中... (+{len(current_answer) - len(prev_answer)} 字符)")
                 elif len(current_thought) > len(prev_thought):
                     print(f"[{self.name}] 思考中... (+{len(current_thought) - len(prev_thought)} 字符)")
+                if current_answer or current_thought:
+                    self._notify_progress(current_thought, current_answer)
             
             prev_answer = current_answer
             prev_thought = current_thought
         
         print(f"[{self.name}] ⚠️ 超时")
+        self.timed_out = True
         return {"thought": prev_thought, "answer": prev_answer}
 
     def ask(self, query: str, model_name: str = None) -> dict:
@@ -319,34 +323,41 @@ class LMArenaBot(BaseBot):
         # 切换模型（如果需要）
         target_model = model_name or self.model_name
         if target_model and target_model != self.current_model:
-            if not self._select_model(target_model):
+            with self.timed("select_model"):
+                selected = self._select_model(target_model)
+            if not selected:
                 print(f"[{self.name}] ⚠️ 模型选择失败，使用当前模型")
 
         print(f"[{self.name}] 📝 提问: {query[:50]}...")
 
         try:
-            # 1. 定位输入框
-            input_box = self._find_input_box()
-            if not input_box:
-                return {"thought": "", "answer": "Error: 找不到输入框"}
-            
-            # 2. 清空并输入问题
-            input_box.clear()
-            input_box.input(query)
-            time.sleep(0.5)
+            with self.timed("input"):
+                # 1. 定位输入框
+                input_box = self._find_input_box()
+                if not input_box:
+                    return {"thought": "", "answer": "Error: 找不到输入框"}
+            
+                # 2. 清空并输入问题
+                input_box.clear()
+                input_box.input(query)
+                time.sleep(0.5)
             
             # 3. 按回车发送
+            self._arm_completion_signal()
             self.tab.actions.key_down('Enter').key_up('Enter')
             print(f"[{self.name}] 📤 已发送")
             
             # 4. 等待并获取回答
-            result = self._wait_for_response()
+            with self.timed("generation"):
+                result = self._wait_for_response()
             
             if not result["answer"]:
                 return {"thought": result["thought"], "answer": "Error: 未获取到回答"}
             
             return result
 
+        except GenerationCancelled:
+            raise
         except Exception as e:
             import traceback
             traceback.print_exc()
@@ -0,0 +1,268 @@
+# adapters/network_capture.py
+"""
+网络捕获：直接读取站点自己的流式补全响应（SSE / fetch 分块），不再轮询页面文本
+
+发送问题后第一个 URL 匹配的响应（Network.responseReceived）即为本轮回答：
+- 调用 Network.streamResourceContent 开启流式读取，之后每个数据块随 Network.dataReceived 到达，立即交给站点解析器
+- 浏览器不支持流式读取时，在响应结束（Network.loadingFinished）后用 Network.getResponseBody 一次取回
+思考过程和回答由解析器按接口字段区分；未截获到响应或解析不出内容时由适配器退回 DOM 轮询
+"""
+
+import base64
+import codecs
+import fnmatch
+import json
+import threading
+from abc import ABC, abstractmethod
+
+from .cdp_events import listen, unlisten
+
+_EVENTS = ("Network.responseReceived", "Network.dataReceived", "Network.loadingFinished", "Network.loadingFailed")
+
+
+class StreamParser(ABC):
+    """
+    流式响应解析器基类：按行解析，累计 thought / answer
+
+    子类实现 parse_line；看到站点的结束标记时设置 self.done
+    """
+
+    def __init__(self):
+        self.thought = ""
+        self.answer = ""
+        self.done = False
+        self._pending = ""
+
+    def feed(self, text: str):
+        """喂入一段响应文本（可能在行中间断开，不完整的行留到下次）"""
+        lines = (self._pending + text).split("\n")
+        self._pending = lines.pop()
+        for line in lines:
+            self.parse_line(line.rstrip("\r"))
+
+    def close(self):
+        """响应结束：处理最后一行"""
+        if self._pending:
+            line, self._pending = self._pending, ""
+            self.parse_line(line.rstrip("\r"))
+
+    @abstractmethod
+    def parse_line(self, line: str):
+        """处理一行响应（已去掉行尾换行）"""
+        pass
+
+
+class SSEParser(StreamParser):
+    """Server-Sent Events：data 行按 JSON 解析后交给 on_event，data: [DONE] 为结束标记"""
+
+    def __init__(self):
+        super().__init__()
+        self.event = None  # 当前事件的 event: 字段
+
+    def parse_line(self, line: str):
+        if not line:
+            self.event = None
+            return
+        if line.startswith("event:"):
+            self.event = line[6:].strip()
+            return
+        if not line.startswith("data:"):
+            return
+        data = line[5:].strip()
+        if data == "[DONE]":
+            self.done = True
+            return
+        try:
+            payload = json.loads(data)
+        except ValueError:
+            return
+        self.on_event(payload)
+
+    @abstractmethod
+    def on_event(self, payload):
+        """处理一个 data 事件（已解析的 JSON）"""
+        pass
+
+
+class NetworkCapture:
+    """
+    单个标签页上的流式响应捕获
+
+    用法:
+        capture = NetworkCapture(tab, ["*/api/chat/completion*"], DeepSeekStream)
+        capture.arm()                # 发送问题前调用
+        while not capture.done:
+            capture.wait(0.5)        # 有新数据或响应结束时立即返回
+            snapshot = capture.snapshot()
+    """
+
+    def __init__(self, tab, urls: list, parser_factory, name: str = "Capture"):
+        """
+        Args:
+            urls: 补全接口的 URL 模式（* 通配，需匹配完整 URL）
+            parser_factory: 无参调用返回 StreamParser
+        """
+        self.tab = tab
+        self.urls = list(urls)
+        self.parser_factory = parser_factory
+        self.name = name
+
+        self.armed = False
+        self.request_id = None  # 本轮匹配到的请求
+        self.streaming = False  # 是否通过 streamResourceContent 逐块读取
+        self.finished = False   # 响应已结束（完成、中断或失败）
+        self.failed = False     # 请求失败，且没有取到任何内容
+        self.parser = None
+
+        self._lock = threading.Lock()
+        self._event = threading.Event()
+        self._decoder = None
+        self._listening = False
+        self._handlers = {
+            "Network.responseReceived": self._on_response,
+            "Network.dataReceived": self._on_data,
+            "Network.loadingFinished": self._on_finished,
+            "Network.loadingFailed": self._on_failed,
+        }
+
+    @classmethod
+    def of(cls, tab, urls: list, parser_factory, name: str = "Capture") -> "NetworkCapture":
+        """
+        标签页上的捕获（每个标签页一个）
+
+        适配器实例按请求创建，复用同一个捕获，事件只登记一次
+        """
+        capture = getattr(tab, "_webllm_capture", None)
+        if capture is None or capture.parser_factory is not parser_factory or capture.urls != list(urls):
+            if capture is not None:
+                capture.close()
+            capture = cls(tab, urls, parser_factory, name)
+            setattr(tab, "_webllm_capture", capture)
+        return capture
+
+    def _listen(self) -> bool:
+        try:
+            self.tab.run_cdp("Network.enable")
+            for event in _EVENTS:
+                listen(self.tab, event, self._handlers[event])
+            return True
+        except Exception as e:
+            print(f"[{self.name}] 网络捕获不可用，改为读取页面: {e}")
+            self.close()
+            return False
+
+    def close(self):
+        """取消事件登记（被同一标签页上的新捕获替换时调用）"""
+        for event in _EVENTS:
+            try:
+                unlisten(self.tab, event, self._handlers[event])
+            except Exception:
+                pass
+        self._listening = False
+        self.armed = False
+
+    def arm(self) -> bool:
+        """开始新一轮捕获（发送问题前调用，只接收之后到达的响应）"""
+        with self._lock:
+            self.armed = False
+            self.request_id = None
+            self.streaming = self.finished = self.failed = False
+            self.parser = self.parser_factory()
+            self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+            self._event.clear()
+        if not self._listening:
+            self._listening = self._listen()
+        self.armed = self._listening
+        return self.armed
+
+    # ============== 事件回调（DrissionPage 事件线程） ==============
+
+    def _matches(self, url: str) -> bool:
+        return any(fnmatch.fnmatchcase(url or "", pattern) for pattern in self.urls)
+
+    def _feed(self, data: str, encoded: bool = True):
+        """喂入一块数据（调用方需持有锁）"""
+        if not data:
+            return
+        raw = base64.b64decode(data) if encoded else data.encode("utf-8")
+        self.parser.feed(self._decoder.decode(raw))
+        self._event.set()
+
+    def _on_response(self, requestId=None, response=None, **kwargs):
+        with self._lock:
+            if not self.armed or self.request_id or not self._matches((response or {}).get("url", "")):
+                return
+            self.request_id = requestId
+            try:
+                result = self.tab.run_cdp("Network.streamResourceContent", requestId=requestId) or {}
+                self.streaming = True
+                self._feed(result.get("bufferedData", ""))
+            except Exception as e:
+                print(f"[{self.name}] 不支持流式读取，响应结束后一次取回: {e}")
+            self._event.set()
+
+    def _on_data(self, requestId=None, data=None, **kwargs):
+        with self._lock:
+            if requestId == self.request_id and self.streaming and not self.finished:
+                self._feed(data)
+
+    def _on_finished(self, requestId=None, **kwargs):
+        with self._lock:
+            if requestId != self.request_id or self.finished:
+                return
+            if not self.streaming:
+                try:
+                    result = self.tab.run_cdp("Network.getResponseBody", requestId=requestId) or {}
+                    self._feed(result.get("body", ""), encoded=bool(result.get("base64Encoded")))
+                except Exception as e:
+                    print(f"[{self.name}] 读取响应失败: {e}")
+            self._finish()
+
+    def _on_failed(self, requestId=None, errorText="", canceled=False, **kwargs):
+        with self._lock:
+            if requestId != self.request_id or self.finished:
+                return
+            if not canceled:
+                print(f"[{self.name}] 补全请求失败: {errorText}")
+            self._finish()
+            self.failed = not (self.parser.thought or self.parser.answer)
+
+    def _finish(self):
+        self.parser.feed(self._decoder.decode(b"", final=True))
+        self.parser.close()
+        self.finished = True
+        self._event.set()
+
+    # ============== 等待方 ==============
+
+    @property
+    def matched(self) -> bool:
+        """本轮是否截获到补全响应"""
+        return self.request_id is not None
+
+    @property
+    def done(self) -> bool:
+        """本轮回答已结束（站点的结束标记或响应结束）"""
+        parser = self.parser
+        return self.finished or bool(parser and parser.done)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            if not self.parser:
+                return {"thought": "", "answer": ""}
+            return {"thought": self.parser.thought.strip(), "answer": self.parser.answer.strip()}
+
+    def disarm(self):
+        """本轮结束（之后到达的响应不再匹配）"""
+        self.armed = False
+
+    def wait(self, timeout: float) -> bool:
+        """
+        最多等待 timeout 秒，有新数据时立即返回
+
+        Returns:
+            本轮回答是否已结束
+        """
+        if self._event.wait(timeout):
+            self._event.clear()
+        return self.done
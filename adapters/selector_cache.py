@@ -0,0 +1,81 @@
+# adapters/selector_cache.py
+"""
+选择器命中缓存
+
+每个适配器类共享一份缓存，按用途（如 "input"、"send"、"new_chat"）记住上次命中的选择器。
+下次优先只试这一个，失效时才回退到完整列表，避免每次请求都在失效选择器上等待超时
+"""
+
+import threading
+from typing import Optional
+
+
+class SelectorCache:
+    """线程安全的选择器命中缓存"""
+
+    def __init__(self, name: str = ""):
+        self.name = name
+        self._winners = {}   # {key: selector}
+        self._stats = {}     # {key: {"hits": int, "misses": int}}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _try(tab, selector: str, timeout: float):
+        try:
+            ele = tab.ele(selector, timeout=timeout)
+            return ele if ele else None
+        except Exception:
+            return None
+
+    def _count(self, key: str, field: str):
+        with self._lock:
+            stats = self._stats.setdefault(key, {"hits": 0, "misses": 0})
+            stats[field] += 1
+
+    def find(self, tab, key: str, selectors: list, timeout: float = 2):
+        """
+        按缓存优先的顺序查找元素
+
+        Args:
+            tab: 标签页
+            key: 用途标识
+            selectors: 候选选择器（按优先级排列）
+            timeout: 每个选择器的等待时间（秒）
+
+        Returns:
+            找到的元素，找不到返回 None
+        """
+        with self._lock:
+            winner = self._winners.get(key)
+
+        if winner in selectors:
+            ele = self._try(tab, winner, timeout)
+            if ele:
+                self._count(key, "hits")
+                return ele
+
+        self._count(key, "misses")
+        for selector in selectors:
+            if selector == winner:
+                continue
+            ele = self._try(tab, selector, timeout)
+            if ele:
+                with self._lock:
+                    self._winners[key] = selector
+                print(f"[{self.name}] 选择器已缓存: {key} -> {selector}")
+                return ele
+
+        return None
+
+    def winner(self, key: str) -> Optional[str]:
+        """当前缓存的选择器"""
+        with self._lock:
+            return self._winners.get(key)
+
+    def stats(self) -> dict:
+        """命中统计: {key: {"selector", "hits", "misses"}}"""
+        with self._lock:
+            return {
+                key: {"selector": self._winners.get(key), **counts}
+                for key, counts in self._stats.items()
+            }
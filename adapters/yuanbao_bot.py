@@ -4,19 +4,85 @@
 """
 
 import time
-from .base_bot import BaseBot
+from .base_bot import BaseBot, GenerationCancelled
+from .network_capture import SSEParser
 from config import STABLE_WAIT_TIME, CHECK_INTERVAL, MAX_WAIT_TIME
 
 # 可以在 config.py 中添加，或直接使用默认值
 YUANBAO_URL = "https://yuanbao.tencent.com/chat"
 
 
+class YuanbaoStream(SSEParser):
+    """
+    /api/chat/<会话 ID> 的 SSE
+    
+    {"type": "think", "content": 思考增量} / {"type": "text", "msg": 回答增量}，其他类型（搜索、状态）忽略
+    """
+    
+    def on_event(self, payload):
+        if not isinstance(payload, dict):
+            return
+        if payload.get("type") == "think":
+            self.thought += payload.get("content") or ""
+        elif payload.get("type") == "text":
+            self.answer += payload.get("msg") or ""
+
+
 class YuanbaoBot(BaseBot):
     """
     腾讯元宝 (yuanbao.tencent.com) 网页机器人
     支持多标签页并发
     """
     
+    COMPLETION_SIGNAL = {
+        "busy": ['a[class*="send-btn--stop"]', 'div[class*="stop-btn"]', 'div.agent-chat__speech-text--box-left [class*="loading"]'],
+        "done": ['div.agent-chat__toolbar', 'div[class*="agent-chat__toolbar"]'],
+    }
+    
+    STOP_SELECTORS = ['a[class*="send-btn--stop"]', 'div[class*="stop-btn"]']
+    INPUT_SELECTORS = ['div.ql-editor[contenteditable="true"]', 'div.ql-editor']
+    
+    STREAM_URLS = ['*yuanbao.tencent.com/api/chat/*']
+    STREAM_PARSER = YuanbaoStream
+    
+    EXTRACT_JS = """
+    const result = {thought: "", answer: ""};
+    
+    // 最后一个回复容器
+    const last = latest('div.agent-chat__speech-text--box-left') || latest('div[class*="speech-text--box-left"]');
+    if (!last) return result;
+    
+    // 思考过程
+    const think = last.querySelector('div.hyc-component-reasoner__think-content');
+    if (think) result.thought = think.innerText.trim();
+    
+    // 最终回答：不在思考区域内的 markdown 内容，通常最后一块是最终回答
+    for (const md of last.querySelectorAll('div.hyc-content-md')) {
+        const parentClass = String((md.parentElement && md.parentElement.className) || "");
+        if (parentClass.includes('think-content')) continue;
+        const text = md.innerText.trim();
+        if (text && text !== result.thought) result.answer = text;
+    }
+    
+    // 备用：主要回答区域，去除开头的思考内容
+    if (!result.answer) {
+        const main = last.querySelector('div.hyc-common-markdown');
+        if (main) {
+            const full = main.innerText.trim();
+            result.answer = result.thought && full.startsWith(result.thought)
+                ? full.slice(result.thought.length).trim()
+                : full;
+        }
+    }
+    
+    // 仍然没有答案时取整个容器的文本
+    if (!result.answer) {
+        const full = last.innerText.trim();
+        result.answer = result.thought ? full.replace(result.thought, "").trim() : full;
+    }
+    return result;
+    """
+    
     def __init__(self, page=None, tab=None):
         """
         初始化元宝 Bot
@@ -33,7 +99,7 @@ class YuanbaoBot(BaseBot):
         """激活或打开腾讯元宝标签页"""
         try:
             if self.tab:
-                self.tab.set.activate()
+                self._activate_tab()
                 if "yuanbao.tencent.com" not in self.tab.url:
                     self.tab.get(self.url)
                     time.sleep(2)
@@ -45,7 +111,7 @@ class YuanbaoBot(BaseBot):
                 for tab in tabs:
                     if "yuanbao.tencent.com" in tab.url:
                         self.tab = tab
-                        self.tab.set.activate()
+                        self._activate_tab()
                         return True
                 
                 self.tab = self.page.latest_tab
@@ -75,16 +141,7 @@ class YuanbaoBot(BaseBot):
             'tag:div@@contenteditable=true@@class:ql-editor',
         ]
         
-        for selector in selectors:
-            try:
-                ele = self.tab.ele(selector, timeout=2)
-                if ele:
-                    print(f"[{self.name}] 找到输入框: {selector}")
-                    return ele
-            except:
-                continue
-        
-        return None
+        return self._find_element("input", selectors, timeout=2)
 
     def _find_send_button(self):
         """定位发送按钮"""
@@ -101,136 +158,64 @@ class YuanbaoBot(BaseBot):
             'css:div.chat-input-send-button svg',
         ]
         
-        for selector in selectors:
-            try:
-                ele = self.tab.ele(selector, timeout=1)
-                if ele:
-                    print(f"[{self.name}] 找到发送按钮: {selector}")
-                    return ele
-            except:
-                continue
-        
-        return None
+        return self._find_element("send", selectors, timeout=1)
 
     def _get_last_answer(self) -> dict:
         """
-        获取最后一条回答
+        获取最后一条回答（单次 run_js 取回快照）
         
         Returns:
             {"thought": "思考过程", "answer": "实际回答"}
         """
-        if not self.tab:
-            return {"thought": "", "answer": ""}
-        
-        result = {"thought": "", "answer": ""}
-        
-        try:
-            # 获取所有回复容器
-            response_containers = self.tab.eles('css:div.agent-chat__speech-text--box-left')
-            
-            if not response_containers:
-                # 备用选择器
-                response_containers = self.tab.eles('css:div[class*="speech-text--box-left"]')
-            
-            if not response_containers:
-                return result
-            
-            # 取最后一个回复
-            last_response = response_containers[-1]
-            
-            # 尝试提取思考过程
-            try:
-                think_section = last_response.ele('css:div.hyc-component-reasoner__think-content', timeout=1)
-                if think_section:
-                    result["thought"] = think_section.text.strip()
-            except:
-                pass
-            
-            # 尝试提取最终回答（思考区域之外的 markdown 内容）
-            try:
-                # 方法1：查找不在思考区域内的 markdown 内容
-                all_markdown = last_response.eles('css:div.hyc-content-md')
-                
-                if all_markdown:
-                    # 通常最后一个 markdown 块是最终回答
-                    # 或者查找不在 reasoner 区域内的内容
-                    for md in all_markdown:
-                        # 检查是否在思考区域内
-                        parent_classes = ""
-                        try:
-                            parent = md.parent()
-                            if parent:
-                                parent_classes = parent.attr('class') or ""
-                        except:
-                            pass
-                        
-                        if "think-content" not in parent_classes:
-                            answer_text = md.text.strip()
-                            if answer_text and answer_text != result["thought"]:
-                                result["answer"] = answer_text
-                
-                # 如果上面方法没找到，尝试其他选择器
-                if not result["answer"]:
-                    # 查找主要回答区域
-                    main_content = last_response.ele('css:div.hyc-common-markdown', timeout=1)
-                    if main_content:
-                        full_text = main_content.text.strip()
-                        # 如果有思考内容，需要去除
-                        if result["thought"] and full_text.startswith(result["thought"]):
-                            result["answer"] = full_text[len(result["thought"]):].strip()
-                        else:
-                            result["answer"] = full_text
-                            
-            except Exception as e:
-                print(f"[{self.name}] 提取回答时出错: {e}")
-            
-            # 如果仍然没有答案，尝试获取整个容器的文本
-            if not result["answer"]:
-                full_text = last_response.text.strip()
-                if result["thought"]:
-                    # 移除思考部分
-                    result["answer"] = full_text.replace(result["thought"], "").strip()
-                else:
-                    result["answer"] = full_text
-                    
-        except Exception as e:
-            print(f"[{self.name}] 获取回答失败: {e}")
-            
-        return result
+        return self._run_extractor()
 
     def _wait_for_response(self) -> dict:
         """等待回答生成完成"""
         print(f"[{self.name}] ⏳ 等待回答生成...")
         
+        captured = self._wait_for_capture()
+        if captured is not None:
+            return captured
+        
         # 等待回答开始
-        time.sleep(2)
+        self._wait_for_start()
         
         prev_text = ""
         stable_count = 0
+        start_time = time.time()
         elapsed_time = 0
         required_stable_checks = int(STABLE_WAIT_TIME / CHECK_INTERVAL)
         
-        while elapsed_time < MAX_WAIT_TIME:
-            time.sleep(CHECK_INTERVAL)
-            elapsed_time += CHECK_INTERVAL
+        max_wait = self._max_wait(MAX_WAIT_TIME)
+        while elapsed_time < max_wait:
+            finished = self._wait_tick(CHECK_INTERVAL)
+            elapsed_time = time.time() - start_time
             
             current_result = self._get_last_answer()
             current_text = current_result.get("answer", "") + current_result.get("thought", "")
             
+            if finished and current_result.get("answer"):
+                print(f"[{self.name}] ✅ 回答生成完成 (完成信号，耗时 {elapsed_time:.1f}s)")
+                return current_result
+            
             if current_text and current_text == prev_text:
-                stable_count += 1
-                if stable_count >= required_stable_checks:
-                    print(f"[{self.name}] ✅ 回答生成完成 (耗时 {elapsed_time:.1f}s)")
-                    return current_result
+                if self._stability_allowed(elapsed_time):
+                    stable_count += 1
+                    if stable_count >= required_stable_checks:
+                        print(f"[{self.name}] ✅ 回答生成完成 (耗时 {elapsed_time:.1f}s)")
+                        return current_result
             else:
                 stable_count = 0
                 if len(current_text) > len(prev_text):
                     new_chars = len(current_text) - len(prev_text)
                     print(f"[{self.name}] 生成中... (+{new_chars} 字符)")
+                if current_text:
+                    self._notify_progress(current_result.get("thought", ""), current_result.get("answer", ""))
             
             prev_text = current_text
         
         print(f"[{self.name}] ⚠️ 等待超时")
+        self.timed_out = True
         return self._get_last_answer()
 
     def ask(self, query: str) -> dict:
@@ -245,46 +230,51 @@ class YuanbaoBot(BaseBot):
         print(f"[{self.name}] 📝 正在提问: {query[:50]}...")
 
         try:
-            # 1. 定位输入框
-            input_box = self._find_input_box()
-            if not input_box:
-                return {"thought": "", "answer": "Error: 找不到输入框，请确保已登录腾讯元宝"}
+            with self.timed("input"):
+                # 1. 定位输入框
+                input_box = self._find_input_box()
+                if not input_box:
+                    return {"thought": "", "answer": "Error: 找不到输入框，请确保已登录腾讯元宝"}
             
-            # 2. 点击输入框激活
-            input_box.click()
-            time.sleep(0.3)
+                # 2. 点击输入框激活
+                input_box.click()
+                time.sleep(0.3)
             
-            # 3. 清空并输入问题
-            # 对于 contenteditable div，使用不同的清空方式
-            try:
-                # 先全选再删除
-                self.tab.actions.key_down('Ctrl').key('a').key_up('Ctrl')
-                time.sleep(0.1)
-                self.tab.actions.key('Backspace')
-                time.sleep(0.1)
-            except:
-                pass
+                # 3. 清空并输入问题
+                # 对于 contenteditable div，使用不同的清空方式
+                try:
+                    # 先全选再删除
+                    self.tab.actions.key_down('Ctrl').key('a').key_up('Ctrl')
+                    time.sleep(0.1)
+                    self.tab.actions.key('Backspace')
+                    time.sleep(0.1)
+                except:
+                    pass
             
-            # 输入新内容
-            input_box.input(query)
-            time.sleep(0.5)
+                # 输入新内容
+                input_box.input(query)
+                time.sleep(0.5)
             
-            # 4. 发送消息
-            # 方式1：按回车（根据 placeholder 提示：enterkeyhint="send"）
-            # self.input_box.actions.key_down('Enter').key_up('Enter')
-            # 上面的方法不行换成下面的方法
-            btn = self._find_send_button()
+                # 4. 发送消息
+                # 方式1：按回车（根据 placeholder 提示：enterkeyhint="send"）
+                # self.input_box.actions.key_down('Enter').key_up('Enter')
+                # 上面的方法不行换成下面的方法
+                btn = self._find_send_button()
+            self._arm_completion_signal()
             btn.click()
             print(f"[{self.name}] 📤 消息已发送")
             
             # 5. 等待并获取回答
-            result = self._wait_for_response()
+            with self.timed("generation"):
+                result = self._wait_for_response()
             
             if not result.get("answer"):
                 return {"thought": "", "answer": "Error: 未能获取到回答"}
             
             return result
 
+        except GenerationCancelled:
+            raise
         except Exception as e:
             import traceback
             traceback.print_exc()
@@ -309,16 +299,15 @@ class YuanbaoBot(BaseBot):
                 'css:div[class*="sidebar"]@@text():新对话',
             ]
             
-            for selector in new_chat_selectors:
+            btn = self._find_element("new_chat", new_chat_selectors, timeout=1)
+            if btn:
                 try:
-                    btn = self.tab.ele(selector, timeout=1)
-                    if btn:
-                        btn.click()
-                        time.sleep(1)
-                        print(f"[{self.name}] ✅ 已开启新对话")
-                        return True
+                    btn.click()
+                    time.sleep(1)
+                    print(f"[{self.name}] ✅ 已开启新对话")
+                    return True
                 except:
-                    continue
+                    pass
             
             # 备选：刷新页面
             print(f"[{self.name}] 未找到新对话按钮，刷新页面...")
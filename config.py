@@ -4,6 +4,10 @@
 # Chrome 调试端口（必须与启动 Chrome 时的端口一致）
 CHROME_PORT = 9222
 
+# 多浏览器分片：每个端口一个 Chrome 实例（各自用独立的 --user-data-dir 启动并登录），
+# 新标签页放到负载最低的实例上，把 CPU / 内存压力分散到多个进程
+CHROME_PORTS = [CHROME_PORT]
+
 # 用户数据目录（重要！改成你自己的）
 CHROME_USER_DATA_DIR = r"C:\Users\dell\AppData\Local\Google\Chrome\User Data"
 
@@ -18,5 +22,79 @@ STABLE_WAIT_TIME = 2.0      # 文本稳定多少秒后认为生成完成
 CHECK_INTERVAL = 0.5         # 检测间隔（秒）
 MAX_WAIT_TIME = 120          # 最长等待时间（秒）
 
+# 完成信号（注入 MutationObserver 检测停止按钮消失 / 工具栏出现，失败时退回稳定性轮询）
+USE_COMPLETION_SIGNAL = True
+SIGNAL_DEBOUNCE_MS = 100     # DOM 变化后延迟多久再判定（毫秒）
+ANSWER_START_GRACE = 2.0     # 未观察到开始生成时，稳定性判定生效前的最短等待（秒）
+
+# 回答获取方式: "dom" 轮询页面文本；"network" 直接读取站点自己的流式补全响应（CDP Network.streamResourceContent），
+# 每个数据块到达即推送，思考过程和回答按接口字段区分；未截获到响应（接口变化、浏览器不支持）时自动退回 "dom"
+CAPTURE_MODE = "dom"
+CAPTURE_START_TIMEOUT = 10   # 发送后多久仍未截获到补全响应则退回读取页面（秒）
+
+# 标签页池配置
+MAX_TABS_PER_BOT = 6         # 每种模型最多并行标签页数（自适应并发的上限）
+TAB_ACQUIRE_TIMEOUT = 300    # 排队等待标签页的最长时间（秒），超时返回 503
+MIN_TABS_PER_BOT = 1         # 启动时为每种模型预热的标签页数
+TAB_MAINTENANCE_INTERVAL = 60  # 后台维护间隔（秒）：清理闲置标签页、健康巡检、内存采样；0 关闭
+TAB_HEALTH_CHECK = True        # 巡检空闲标签页，页面无响应 / 找不到输入框（掉登录、验证码）的回收并补充
+TAB_HEALTH_TIMEOUT = 5         # 单次探测 / 内存采样超时（秒）
+TAB_MEMORY_BUDGET_MB = 2048    # 每个浏览器所有标签页 JS 堆合计上限（MB），超出时先处理最重的空闲标签页；None 只采样
+TAB_MAX_REQUESTS = 50          # 标签页处理多少个请求后在空闲时重新加载页面（"新对话"按钮不清理旧 DOM）；None 不限
+TAB_MAX_DOM_NODES = 30000      # DOM 节点数超过多少时在空闲时重新加载；None 不限
+
+# 免焦点运行：并行的标签页不再在每个请求前切到前台（互相抢焦点），
+# 新标签页开启焦点模拟，请求前只把页面生命周期设为 active（防止后台冻结）；
+# 后台标签页的定时器和渲染限速只能在启动时关闭：手动启动 Chrome 时请加上 CHROME_BACKGROUND_FLAGS
+FOCUS_FREE = True
+CHROME_BACKGROUND_FLAGS = [
+    "--disable-background-timer-throttling",
+    "--disable-renderer-backgrounding",
+    "--disable-backgrounding-occluded-windows",
+]
+
+# 资源拦截：新标签页加载页面前通过 CDP Network.setBlockedURLs 拦截抓取文本用不到的资源，
+# 加快打开 / 跳转 / 刷新并减少标签页内存。"*" 对所有站点生效，支持 * 通配（需匹配完整 URL）
+# LMArena 的人机验证依赖图片，不拦截其图片
+BLOCK_RESOURCES = True
+BLOCKED_IMAGE_URLS = ["*.png*", "*.jpg*", "*.jpeg*", "*.gif*", "*.webp*", "*.avif*", "*.ico*"]
+BLOCKED_URLS = {
+    "*": [
+        "*.woff2*", "*.woff*", "*.ttf*", "*.otf*", "*.mp4*", "*.webm*", "*.mp3*",
+        "*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*",
+        "*hm.baidu.com*", "*sentry.io*", "*sensorsdata*",
+    ],
+    "kimi": BLOCKED_IMAGE_URLS,
+    "deepseek": BLOCKED_IMAGE_URLS,
+    "yuanbao": BLOCKED_IMAGE_URLS + ["*aegis.qq.com*", "*beacon.qq.com*", "*report.url.cn*"],
+    "lmarena": ["*posthog.com*", "*plausible.io*"],
+}
+
+# 自适应并发（AIMD）：各站点能承受的并行对话数不同，按执行结果自动调整每种模型的并发上限
+# 用满上限且连续成功一轮后加 1；生成超时、"Error:" 回答、执行异常或首字延迟变慢时减半
+ADAPTIVE_CONCURRENCY = True      # False 时固定为 MAX_TABS_PER_BOT
+CONCURRENCY_INITIAL = 2          # 初始并发上限
+CONCURRENCY_MIN = 1              # 并发上限下限
+SLOWDOWN_FACTOR = 2.0            # 首字延迟超过基线多少倍视为变慢
+
+# 请求优先级（请求头 X-Priority 或请求字段 priority）：数值小的先获得准入名额和标签页，也可直接传整数
+PRIORITY_LEVELS = {"high": 0, "normal": 1, "low": 2}
+DEFAULT_PRIORITY = "normal"
+BATCH_PRIORITY = "low"           # 批处理请求默认优先级，不挤占交互请求
+
+# 回答缓存（相同模型、消息和 temperature 的请求直接返回已有回答）
+RESPONSE_CACHE_ENABLED = True
+RESPONSE_CACHE_SIZE = 1000       # 内存中最多缓存条数
+RESPONSE_CACHE_TTL = 24 * 3600   # 缓存有效期（秒）
+RESPONSE_CACHE_DB = None         # SQLite 持久化路径，如 "response_cache.db"；None 只用内存
+
+# 相同请求合并：并发到达的完全相同请求只占用一个标签页，共享结果或流
+SINGLE_FLIGHT_ENABLED = True
+
+# 批处理（/v1/files + /v1/batches）：任务和输出保存在 BATCH_DIR，重启后从断点继续
+BATCH_ENABLED = True
+BATCH_DIR = "batch_data"
+BATCH_CONCURRENCY = None         # 每个任务同时执行的请求数，None 为 MAX_TABS_PER_BOT × 模型种类数
+
 # LMArena 默认模型（可选）
 DEFAULT_LMARENA_MODEL = "gemini-3-pro"
\ No newline at end of file
@@ -1,5 +1,14 @@
 # core/__init__.py
 
 from .tab_manager import TabPoolManager, TabInfo
+from .chat_stream import ChatStream
+from .response_cache import ResponseCache
+from .single_flight import SingleFlight
+from .metrics import Metrics
+from .router import BackendRouter, create_router_app
+from .concurrency import AIMDController, AdmissionLimiter, DeadlineExceeded
+from .batch import BatchManager, BatchError
 
-__all__ = ["TabPoolManager", "TabInfo"]
\ No newline at end of file
+__all__ = ["TabPoolManager", "TabInfo", "ChatStream", "ResponseCache", "SingleFlight", "Metrics",
+           "BackendRouter", "create_router_app",
+           "AIMDController", "AdmissionLimiter", "DeadlineExceeded", "BatchManager", "BatchError"]
\ No newline at end of file
@@ -0,0 +1,380 @@
+# core/batch.py
+"""
+批处理（OpenAI Batch API 兼容）
+- /v1/files 上传 JSONL，每行一个请求 {"custom_id", "method", "url", "body"}（也接受只有请求体的行）
+- /v1/batches 创建任务后在后台按并发上限执行，结果逐行追加到输出文件
+- 任务状态和输出都落盘，服务重启后跳过已有结果的请求继续执行
+"""
+
+import asyncio
+import json
+import os
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+# 执行一条请求: body -> (status_code, 响应体)
+Executor = Callable[[dict], Awaitable[Tuple[int, dict]]]
+
+# 未结束的状态（重启后继续执行）
+ACTIVE_STATUSES = ("validating", "in_progress", "finalizing", "cancelling")
+
+WINDOWS = {"24h": 24 * 3600}
+
+
+class BatchError(Exception):
+    """请求参数错误（对应 HTTP 400 / 404）"""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class BatchManager:
+    """
+    文件与批处理任务
+
+    目录结构:
+        root/files/{file_id}.jsonl   文件内容（上传的输入和生成的输出 / 错误文件）
+        root/files/{file_id}.json    文件对象
+        root/batches/{batch_id}.json 任务对象（每完成一条请求更新一次）
+
+    用法:
+        manager = BatchManager("batches", execute=run_batch_request, concurrency=24)
+        await manager.resume()
+        file = manager.create_file("eval.jsonl", content, "batch")
+        batch = manager.create_batch(file["id"], "/v1/chat/completions", "24h")
+    """
+
+    def __init__(self, root: str, execute: Executor, concurrency: int = 8,
+                 endpoints: tuple = ("/v1/chat/completions",), max_retries: int = 3):
+        """
+        Args:
+            root: 数据目录
+            execute: 执行一条请求的协程函数
+            concurrency: 每个任务同时执行的请求数（超出各模型并发上限的部分在准入队列中等待）
+            endpoints: 支持的接口
+            max_retries: 503（排队超时）时的重试次数
+        """
+        self.root = root
+        self.execute = execute
+        self.concurrency = max(1, concurrency)
+        self.endpoints = endpoints
+        self.max_retries = max_retries
+        self.files_dir = os.path.join(root, "files")
+        self.batches_dir = os.path.join(root, "batches")
+        os.makedirs(self.files_dir, exist_ok=True)
+        os.makedirs(self.batches_dir, exist_ok=True)
+
+        self.batches: Dict[str, dict] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._load()
+
+        print(f"[Batch] 初始化完成，目录 {root}，已有 {len(self.batches)} 个任务，每个任务并发 {self.concurrency}")
+
+    # ============== 存储 ==============
+
+    @staticmethod
+    def _write_json(path: str, data: dict):
+        """先写临时文件再替换，避免中途退出留下半个文件"""
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    def _load(self):
+        for name in os.listdir(self.batches_dir):
+            if name.endswith(".json"):
+                with open(os.path.join(self.batches_dir, name), encoding="utf-8") as f:
+                    batch = json.load(f)
+                self.batches[batch["id"]] = batch
+
+    def _save(self, batch: dict):
+        self._write_json(os.path.join(self.batches_dir, f"{batch['id']}.json"), batch)
+
+    def file_path(self, file_id: str) -> str:
+        return os.path.join(self.files_dir, f"{os.path.basename(file_id)}.jsonl")
+
+    # ============== 文件 ==============
+
+    def _register_file(self, file_id: str, filename: str, purpose: str) -> dict:
+        file = {
+            "id": file_id,
+            "object": "file",
+            "bytes": os.path.getsize(self.file_path(file_id)),
+            "created_at": int(time.time()),
+            "filename": filename,
+            "purpose": purpose,
+        }
+        self._write_json(os.path.join(self.files_dir, f"{file_id}.json"), file)
+        return file
+
+    def create_file(self, filename: str, content: bytes, purpose: str) -> dict:
+        """保存上传的文件"""
+        if purpose != "batch":
+            raise BatchError(f"不支持的 purpose: {purpose}")
+        file_id = f"file-{uuid.uuid4().hex[:24]}"
+        with open(self.file_path(file_id), "wb") as f:
+            f.write(content)
+        print(f"[Batch] 上传文件 {file_id}: {filename} ({len(content)} 字节)")
+        return self._register_file(file_id, filename, purpose)
+
+    def get_file(self, file_id: str) -> dict:
+        path = os.path.join(self.files_dir, f"{os.path.basename(file_id)}.json")
+        if not os.path.exists(path):
+            raise BatchError(f"文件不存在: {file_id}", 404)
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+
+    # ============== 任务 ==============
+
+    @staticmethod
+    def public(batch: dict) -> dict:
+        """去掉内部字段（下划线开头）"""
+        return {k: v for k, v in batch.items() if not k.startswith("_")}
+
+    def get_batch(self, batch_id: str) -> dict:
+        batch = self.batches.get(batch_id)
+        if not batch:
+            raise BatchError(f"任务不存在: {batch_id}", 404)
+        return batch
+
+    def list_batches(self, limit: int = 20, after: Optional[str] = None) -> dict:
+        batches = sorted(self.batches.values(), key=lambda b: (b["created_at"], b["id"]), reverse=True)
+        if after:
+            ids = [b["id"] for b in batches]
+            batches = batches[ids.index(after) + 1:] if after in ids else []
+        page = batches[:limit]
+        return {
+            "object": "list",
+            "data": [self.public(b) for b in page],
+            "first_id": page[0]["id"] if page else None,
+            "last_id": page[-1]["id"] if page else None,
+            "has_more": len(batches) > limit,
+        }
+
+    def create_batch(self, input_file_id: str, endpoint: str, completion_window: str = "24h",
+                     metadata: Optional[dict] = None) -> dict:
+        """创建任务并在后台开始执行（需在事件循环中调用）"""
+        self.get_file(input_file_id)
+        if endpoint not in self.endpoints:
+            raise BatchError(f"不支持的 endpoint: {endpoint}")
+        if completion_window not in WINDOWS:
+            raise BatchError(f"不支持的 completion_window: {completion_window}")
+
+        now = int(time.time())
+        batch = {
+            "id": f"batch_{uuid.uuid4().hex[:24]}",
+            "object": "batch",
+            "endpoint": endpoint,
+            "errors": None,
+            "input_file_id": input_file_id,
+            "completion_window": completion_window,
+            "status": "validating",
+            "output_file_id": None,
+            "error_file_id": None,
+            "created_at": now,
+            "in_progress_at": None,
+            "expires_at": now + WINDOWS[completion_window],
+            "finalizing_at": None,
+            "completed_at": None,
+            "failed_at": None,
+            "expired_at": None,
+            "cancelling_at": None,
+            "cancelled_at": None,
+            "request_counts": {"total": 0, "completed": 0, "failed": 0},
+            "metadata": metadata,
+            # 输出文件在执行过程中逐行追加，结束时才对外公布
+            "_output_file_id": f"file-{uuid.uuid4().hex[:24]}",
+            "_error_file_id": f"file-{uuid.uuid4().hex[:24]}",
+        }
+        self.batches[batch["id"]] = batch
+        self._save(batch)
+        print(f"[Batch] 创建任务 {batch['id']}，输入 {input_file_id}")
+        self._start(batch)
+        return batch
+
+    def cancel_batch(self, batch_id: str) -> dict:
+        """取消任务：不再发起新请求，进行中的请求完成后结束"""
+        batch = self.get_batch(batch_id)
+        if batch["status"] in ("validating", "in_progress"):
+            batch["status"] = "cancelling"
+            batch["cancelling_at"] = int(time.time())
+            self._save(batch)
+            print(f"[Batch] 取消任务 {batch_id}")
+        return batch
+
+    async def resume(self):
+        """启动时继续未结束的任务"""
+        for batch in self.batches.values():
+            if batch["status"] in ACTIVE_STATUSES:
+                print(f"[Batch] 继续任务 {batch['id']} ({batch['status']})")
+                self._start(batch)
+
+    async def close(self):
+        for task in self._tasks.values():
+            task.cancel()
+        self._tasks.clear()
+
+    def _start(self, batch: dict):
+        task = asyncio.get_running_loop().create_task(self._run(batch))
+        self._tasks[batch["id"]] = task
+        task.add_done_callback(lambda _: self._tasks.pop(batch["id"], None))
+
+    # ============== 执行 ==============
+
+    def _parse_input(self, batch: dict) -> Tuple[List[dict], List[dict]]:
+        """解析输入文件 -> (请求列表, 错误列表)"""
+        requests, errors, seen = [], [], set()
+        with open(self.file_path(batch["input_file_id"]), encoding="utf-8") as f:
+            for line_no, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    item = json.loads(line)
+                except ValueError:
+                    errors.append({"code": "invalid_json_line", "message": "不是有效的 JSON", "line": line_no})
+                    continue
+                if not isinstance(item, dict):
+                    errors.append({"code": "invalid_request", "message": "每行应为 JSON 对象", "line": line_no})
+                    continue
+                if "body" not in item:
+                    item = {"custom_id": f"line-{line_no}", "method": "POST", "url": batch["endpoint"], "body": item}
+                custom_id = str(item.get("custom_id") or f"line-{line_no}")
+                if item.get("url", batch["endpoint"]) != batch["endpoint"]:
+                    errors.append({"code": "invalid_url", "message": f"url 应为 {batch['endpoint']}", "line": line_no})
+                elif custom_id in seen:
+                    errors.append({"code": "duplicate_custom_id", "message": f"custom_id 重复: {custom_id}", "line": line_no})
+                elif not isinstance(item.get("body"), dict):
+                    errors.append({"code": "invalid_request", "message": "body 应为 JSON 对象", "line": line_no})
+                else:
+                    seen.add(custom_id)
+                    requests.append({"custom_id": custom_id, "body": item["body"]})
+        return requests, errors
+
+    def _finished(self, file_id: str) -> set:
+        """
+        输出 / 错误文件中已有结果的 custom_id（断点）
+
+        中途退出时写了一半的最后一行先截掉，否则续跑追加的下一条会接在它后面、一起无法解析
+        """
+        done = set()
+        path = self.file_path(file_id)
+        if os.path.exists(path):
+            with open(path, "rb+") as f:
+                data = f.read()
+                if data and not data.endswith(b"\n"):
+                    data = data[:data.rfind(b"\n") + 1]
+                    f.truncate(len(data))
+                    print(f"[Batch] 截掉 {file_id} 末尾不完整的一行")
+            for line in data.decode("utf-8", errors="replace").splitlines():
+                try:
+                    done.add(json.loads(line)["custom_id"])
+                except (ValueError, KeyError):
+                    pass
+        return done
+
+    def _append(self, file_id: str, record: dict):
+        with open(self.file_path(file_id), "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    async def _run(self, batch: dict):
+        try:
+            await self._execute(batch)
+        except asyncio.CancelledError:
+            raise  # 服务关闭，状态保留，重启后继续
+        except Exception as e:
+            print(f"[Batch] 任务 {batch['id']} 异常: {e}")
+            batch["status"] = "failed"
+            batch["failed_at"] = int(time.time())
+            batch["errors"] = {"object": "list", "data": [{"code": "internal_error", "message": str(e), "line": None}]}
+            self._save(batch)
+
+    async def _execute(self, batch: dict):
+        requests, errors = self._parse_input(batch)
+        if batch["status"] == "validating":
+            if errors or not requests:
+                batch["status"] = "failed"
+                batch["failed_at"] = int(time.time())
+                batch["errors"] = {"object": "list", "data": errors or [
+                    {"code": "empty_file", "message": "输入文件没有请求", "line": None}]}
+                self._save(batch)
+                print(f"[Batch] 任务 {batch['id']} 校验失败: {len(errors)} 行错误")
+                return
+            batch["status"] = "in_progress"
+            batch["in_progress_at"] = int(time.time())
+
+        completed = self._finished(batch["_output_file_id"])
+        failed = self._finished(batch["_error_file_id"])
+        pending = [r for r in requests if r["custom_id"] not in completed and r["custom_id"] not in failed]
+        batch["request_counts"] = {"total": len(requests), "completed": len(completed), "failed": len(failed)}
+        self._save(batch)
+        if pending and batch["status"] == "in_progress":
+            print(f"[Batch] 任务 {batch['id']}: 共 {len(requests)} 条，待执行 {len(pending)} 条")
+
+        queue = iter(pending)
+
+        async def worker():
+            for item in queue:
+                if batch["status"] != "in_progress":
+                    return
+                if time.time() > batch["expires_at"]:
+                    batch["status"] = "expired"
+                    batch["expired_at"] = int(time.time())
+                    return
+                await self._run_one(batch, item)
+
+        await asyncio.gather(*(worker() for _ in range(min(self.concurrency, len(pending)) or 1)))
+        self._finalize(batch)
+
+    async def _run_one(self, batch: dict, item: dict):
+        """执行一条请求并把结果追加到输出或错误文件"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                status_code, body = await self.execute(item["body"])
+            except Exception as e:
+                status_code, body = 500, {"error": {"message": str(e), "type": "server_error"}}
+            if status_code != 503 or attempt == self.max_retries:
+                break
+            await asyncio.sleep(2 ** attempt)  # 排队超时：稍后重试
+
+        record = {
+            "id": f"batch_req_{uuid.uuid4().hex[:24]}",
+            "custom_id": item["custom_id"],
+            "response": {"status_code": status_code, "request_id": uuid.uuid4().hex[:12], "body": body},
+            "error": None,
+        }
+        counts = batch["request_counts"]
+        if status_code == 200:
+            self._append(batch["_output_file_id"], record)
+            counts["completed"] += 1
+        else:
+            message = (body.get("error") or {}).get("message") if isinstance(body, dict) else None
+            record["error"] = {"code": str(status_code), "message": message or str(body)}
+            self._append(batch["_error_file_id"], record)
+            counts["failed"] += 1
+        self._save(batch)
+
+    def _finalize(self, batch: dict):
+        """生成输出文件对象并结束任务"""
+        now = int(time.time())
+        if batch["status"] == "in_progress":
+            batch["status"] = "finalizing"
+            batch["finalizing_at"] = now
+            self._save(batch)
+
+        for key, file_id in (("output_file_id", batch["_output_file_id"]), ("error_file_id", batch["_error_file_id"])):
+            if os.path.exists(self.file_path(file_id)):
+                batch[key] = self._register_file(file_id, f"{batch['id']}_{key[:-8]}.jsonl", f"batch_{key[:-8]}")["id"]
+
+        if batch["status"] == "finalizing":
+            batch["status"] = "completed"
+            batch["completed_at"] = now
+        elif batch["status"] == "cancelling":
+            batch["status"] = "cancelled"
+            batch["cancelled_at"] = now
+        self._save(batch)
+        counts = batch["request_counts"]
+        print(f"[Batch] 任务 {batch['id']} {batch['status']}: 成功 {counts['completed']}，失败 {counts['failed']}")
@@ -0,0 +1,230 @@
+# core/chat_stream.py
+"""
+流式输出通道
+把适配器轮询到的累计文本转换为增量事件，供 SSE 接口消费
+"""
+
+import asyncio
+import os
+import threading
+
+
+def _unclosed(line: str) -> int:
+    """
+    一行中第一个尚未闭合的 Markdown 标记位置，没有时返回 -1
+
+    生成中的强调 / 删除线（"*wor"）、行内代码、链接（"[text](url"）和 HTML 标签（"<b"）闭合后会被渲染改写，
+    按 CommonMark 的规则近似判断：后面跟空白的 * _ ~ 不是开始标记（如 "a * b"），词中间的 _ 不算（如 my_var），
+    闭合的 [1] 和不像标签的 <（如 "a < b"）是普通文本
+    """
+    opened = []  # [(闭合标记, 开始位置)]
+    i, n = 0, len(line)
+    while i < n:
+        ch = line[i]
+        if ch == "\\":
+            i += 2
+            continue
+        if ch in "*_~`":
+            j = i
+            while j < n and line[j] == ch:
+                j += 1
+            run = line[i:j]
+            if ch == "`":
+                end = line.find(run, j)
+                if end < 0:
+                    opened.append((run, i))
+                    break  # 未闭合的行内代码，之后的内容都在代码中
+                i = end + len(run)
+                continue
+            before = line[i - 1] if i else " "
+            after = line[j] if j < n else " "
+            if opened and opened[-1][0] == run and not before.isspace():
+                opened.pop()
+            elif not after.isspace() and not (ch == "_" and before.isalnum()):
+                opened.append((run, i))
+            i = j
+            continue
+        if ch == "[":
+            opened.append(("]", i))
+        elif ch == "<" and i + 1 < n and (line[i + 1].isalpha() or line[i + 1] in "/!"):
+            opened.append((">", i))
+        elif ch in "])>":
+            for k in range(len(opened) - 1, -1, -1):
+                if opened[k][0] == ch:
+                    start = opened[k][1]
+                    del opened[k:]  # 其中未闭合的强调不会跨过链接或标签
+                    if ch == "]" and line[i + 1:i + 2] == "(":
+                        opened.append((")", start))
+                        i += 1
+                    break
+        i += 1
+    return opened[0][1] if opened else -1
+
+
+class ChatStream:
+    """
+    线程安全的增量事件通道
+
+    - 生产者（执行对话的线程）通过 push() 推送当前累计的思考/回答文本
+    - 消费者迭代得到事件:
+        ("thought", 增量)  思考过程新增内容
+        ("answer", 增量)   回答新增内容
+        ("done", result)   生成结束，result 为 execute_chat 的返回值
+        ("error", 异常)    执行失败
+
+    事件会保留到通道结束，多个消费者可以各自从头迭代（用于合并相同请求）
+    消费者在协程中用 async for 迭代 / await wait()，等待期间不占用线程
+
+    客户端通过 attach() / detach() 登记；最后一个客户端在结束前离开时设置 cancelled，
+    执行线程据此停止生成并释放标签页
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()  # finish() 持锁调用 push()
+        self._events = []
+        self._closed = False
+        self._sent = {"thought": "", "answer": ""}
+        self._callbacks = []
+        self._watchers = []  # [(loop, asyncio.Event)] 异步消费者
+        self._subscribers = 0
+        self.cancelled = threading.Event()
+
+    @staticmethod
+    def _stable(text: str) -> str:
+        """生成中的文本先不发送最后一行中未闭合的 Markdown 标记及之后的部分，等标记闭合、换行或生成结束再发"""
+        start = text.rfind("\n") + 1
+        cut = _unclosed(text[start:])
+        return text[:start + cut] if cut >= 0 else text
+
+    def _delta(self, kind: str, text: str, final: bool = False) -> str:
+        """
+        计算相对已发送内容的新增部分
+
+        页面暂时少渲染了一部分（文本是已发送内容的前缀）时跳过；
+        已发送的内容被页面改写时无法撤回，从共同前缀之后补发，之后的增量与页面文本重新对齐
+        """
+        if not final:
+            text = self._stable(text)
+        sent = self._sent[kind]
+        if sent.startswith(text):
+            return ""
+        common = len(sent) if text.startswith(sent) else len(os.path.commonprefix([sent, text]))
+        if common < len(sent):
+            print(f"[ChatStream] 已发送的{kind}被页面改写，从第 {common} 个字符起补发")
+        self._sent[kind] = text
+        return text[common:]
+
+    def _notify(self):
+        """唤醒异步消费者（调用方需持有锁）"""
+        for loop, event in self._watchers:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                pass  # 事件循环已关闭
+
+    def push(self, thought: str, answer: str, final: bool = False):
+        """推送当前累计文本（由适配器轮询循环回调）；final 表示最终结果，不再保留未稳定的部分"""
+        with self._lock:
+            if self._closed:
+                return
+            for kind, text in (("thought", thought), ("answer", answer)):
+                delta = self._delta(kind, text or "", final)
+                if delta:
+                    self._events.append((kind, delta))
+            self._notify()
+
+    def finish(self, result: dict):
+        """生成完成：补发剩余增量并结束通道"""
+        with self._lock:
+            if self._closed:
+                return
+            self.push(result.get("thought", ""), result.get("answer", ""), final=True)
+            self._close(("done", result))
+        self._run_callbacks()
+
+    def fail(self, error: Exception):
+        """执行失败：结束通道"""
+        with self._lock:
+            if self._closed:
+                return
+            self._close(("error", error))
+        self._run_callbacks()
+
+    def _close(self, event: tuple):
+        """追加结束事件（调用方需持有锁）"""
+        self._events.append(event)
+        self._closed = True
+        self._notify()
+
+    def _run_callbacks(self):
+        callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback(self)
+            except Exception as e:
+                print(f"[ChatStream] 结束回调失败: {e}")
+
+    def add_done_callback(self, callback):
+        """通道结束后调用 callback(stream)；已结束时立即调用"""
+        with self._lock:
+            if not self._closed:
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def attach(self):
+        """登记一个等待结果的客户端"""
+        with self._lock:
+            self._subscribers += 1
+
+    def detach(self):
+        """客户端离开；最后一个客户端在通道结束前离开时取消执行"""
+        with self._lock:
+            self._subscribers -= 1
+            if self._subscribers > 0 or self._closed:
+                return
+        self.cancel()
+
+    def cancel(self):
+        """请求取消执行（执行线程在下一次轮询时停止）"""
+        if not self.cancelled.is_set():
+            self.cancelled.set()
+            print("[ChatStream] 客户端已断开，取消执行")
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    async def _aiter(self):
+        loop = asyncio.get_running_loop()
+        watcher = (loop, asyncio.Event())
+        with self._lock:
+            self._watchers.append(watcher)
+        cursor = 0
+        try:
+            while True:
+                with self._lock:
+                    event = self._events[cursor] if cursor < len(self._events) else None
+                    if event is None:
+                        watcher[1].clear()
+                if event is None:
+                    await watcher[1].wait()
+                    continue
+                cursor += 1
+                yield event
+                if event[0] in ("done", "error"):
+                    return
+        finally:
+            with self._lock:
+                self._watchers.remove(watcher)
+
+    def __aiter__(self):
+        return self._aiter()
+
+    async def wait(self) -> dict:
+        """等待结束，返回 execute_chat 的结果；执行失败时抛出原异常"""
+        async for kind, payload in self:
+            if kind == "error":
+                raise payload
+            if kind == "done":
+                return payload
@@ -0,0 +1,207 @@
+# core/concurrency.py
+"""
+自适应并发控制（AIMD）
+每种 Bot 的并发上限根据执行结果自动调整：
+- 上限被用满且连续成功一轮（成功数 >= 当前上限）后加 1
+- 生成超时、"Error:" 回答、执行异常或首字延迟明显变慢时乘以 backoff 减小
+准入名额按请求优先级排队
+"""
+
+import asyncio
+import heapq
+import itertools
+import math
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+
+class DeadlineExceeded(TimeoutError):
+    """请求的截止时间已过（不再占用或继续占用标签页）"""
+
+
+class AIMDController:
+    """
+    并发上限控制器（线程安全，由工作线程上报结果）
+
+    用法:
+        controller = AIMDController("kimi", initial=2, min_limit=1, max_limit=6)
+        controller.record_success(latency=1.2, started_at=t0)
+        controller.record_failure("timeout", started_at=t0)
+    """
+
+    def __init__(self, name: str, initial: int, min_limit: int = 1, max_limit: int = 3,
+                 backoff: float = 0.5, slowdown_factor: float = 2.0, min_samples: int = 5,
+                 history_size: int = 50):
+        """
+        Args:
+            initial: 初始上限
+            min_limit / max_limit: 上限的调整范围（max_limit 不超过标签页池容量）
+            backoff: 减小时的乘数
+            slowdown_factor: 延迟超过基线多少倍视为变慢
+            min_samples: 延迟基线至少积累多少个样本后才判定变慢
+        """
+        self.name = name
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = min(max(initial, self.min_limit), self.max_limit)
+        self.backoff = backoff
+        self.slowdown_factor = slowdown_factor
+        self.min_samples = min_samples
+
+        self.baseline: Optional[float] = None  # 延迟基线（指数移动平均）
+        self.samples = 0
+        self.successes = 0          # 上次调整后的连续成功数
+        self.saturated = False      # 上次调整后并发是否达到过上限
+        self.changed_at = time.time()
+        self.history = deque(maxlen=history_size)
+        self.lock = threading.Lock()
+        self._listeners = []
+        self._record("initial")
+
+    def add_listener(self, callback):
+        """上限变化后调用 callback()（在上报结果的线程中，持有锁，不应阻塞）"""
+        self._listeners.append(callback)
+
+    def _record(self, reason: str):
+        self.history.append({"time": round(time.time(), 3), "limit": self.limit, "reason": reason})
+
+    def _set_limit(self, limit: int, reason: str):
+        limit = min(max(limit, self.min_limit), self.max_limit)
+        self.successes = 0
+        self.saturated = False
+        self.changed_at = time.time()
+        if limit != self.limit:
+            print(f"[Concurrency] {self.name} 并发上限 {self.limit} -> {limit} ({reason})")
+            self.limit = limit
+            self._record(reason)
+            for callback in self._listeners:
+                callback()
+
+    def mark_saturated(self):
+        """准入时并发达到上限（只有用满上限时的成功才说明可以再加）"""
+        self.saturated = True
+
+    def record_success(self, latency: Optional[float] = None, started_at: Optional[float] = None):
+        """
+        上报一次成功
+
+        Args:
+            latency: 站点侧延迟（首字延迟），用于判定变慢
+            started_at: 请求开始时间；早于上次调整的请求不触发减小（同一批请求只减一次）
+        """
+        with self.lock:
+            if latency is not None:
+                slow = self.baseline is not None and self.samples >= self.min_samples \
+                    and latency > self.baseline * self.slowdown_factor
+                # 变慢的样本同样计入基线：延迟持续升高后基线随之抬高，加性增长得以恢复
+                self.baseline = latency if self.baseline is None else self.baseline * 0.9 + latency * 0.1
+                self.samples += 1
+                if slow:
+                    if started_at is None or started_at >= self.changed_at:
+                        self._set_limit(math.floor(self.limit * self.backoff), "slowdown")
+                    return
+
+            self.successes += 1
+            if self.saturated and self.successes >= self.limit and self.limit < self.max_limit:
+                self._set_limit(self.limit + 1, "increase")
+
+    def record_failure(self, reason: str, started_at: Optional[float] = None):
+        """上报一次失败（timeout / error），乘性减小"""
+        with self.lock:
+            if started_at is not None and started_at < self.changed_at:
+                return
+            self._set_limit(math.floor(self.limit * self.backoff), reason)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "limit": self.limit,
+                "min": self.min_limit,
+                "max": self.max_limit,
+                "baseline_latency": round(self.baseline, 3) if self.baseline is not None else None,
+                "successes": self.successes,
+                "history": list(self.history),
+            }
+
+
+class AdmissionLimiter:
+    """
+    事件循环中的准入名额，上限取自控制器（可随时变化）
+
+    按优先级（数值小的先）排队，同优先级先来后到；上限减小时已占用的名额不收回，归还后不再补发
+    acquire / release 只能在事件循环线程调用（工作线程通过 call_soon_threadsafe 归还）
+    """
+
+    def __init__(self, controller: AIMDController):
+        self.controller = controller
+        self.active = 0
+        self._waiters: list = []   # 堆: [priority, seq, future]，放弃等待的条目留在堆中，出队时跳过
+        self._waiting = 0
+        self._seq = itertools.count()
+        self._loop = None          # 排队时所在的事件循环（上限增大时在其中唤醒等待者）
+        controller.add_listener(self._on_limit_change)
+
+    @property
+    def limit(self) -> int:
+        return self.controller.limit
+
+    @property
+    def waiting(self) -> int:
+        return self._waiting
+
+    @property
+    def available(self) -> int:
+        return max(0, self.limit - self.active)
+
+    def _take(self):
+        self.active += 1
+        if self.active >= self.limit:
+            self.controller.mark_saturated()
+
+    async def acquire(self, priority: int = 1):
+        """
+        Args:
+            priority: 优先级，数值小的先获得名额
+        """
+        if self.active < self.limit and not self._waiting:
+            self._take()
+            return
+
+        self._loop = asyncio.get_running_loop()
+        future = self._loop.create_future()
+        heapq.heappush(self._waiters, [priority, next(self._seq), future])
+        self._waiting += 1
+        try:
+            await future
+        except BaseException:
+            if future.done() and not future.cancelled():
+                self.release()  # 已分到名额但等待方放弃，转交下一个
+            else:
+                future.cancel()
+                self._waiting -= 1
+            raise
+
+    def release(self):
+        self.active -= 1
+        self._wake()
+
+    def _on_limit_change(self):
+        """控制器调整上限后（工作线程中）：上限增大时排队的请求不必等到下一次归还"""
+        loop = self._loop
+        if loop is None:
+            return
+        try:
+            loop.call_soon_threadsafe(self._wake)
+        except RuntimeError:
+            pass  # 事件循环已关闭
+
+    def _wake(self):
+        """按上限唤醒等待者（上限增大后也会一次唤醒多个）"""
+        while self._waiters and self.active < self.limit:
+            future = heapq.heappop(self._waiters)[2]
+            if not future.done():
+                self._waiting -= 1
+                self._take()
+                future.set_result(None)
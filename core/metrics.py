@@ -0,0 +1,103 @@
+# core/metrics.py
+"""
+Prometheus 指标
+- 请求各阶段耗时直方图（按 Bot 类型和阶段）
+- 错误 / 超时 / 取消计数
+- 标签页数、队列深度、并发上限、标签页创建 / 关闭次数：抓取时从标签页池统计中读取
+"""
+
+from typing import Callable, Dict, Optional
+
+from prometheus_client import CollectorRegistry, Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+# 请求的阶段: admission 等待准入（异步队列），acquire 等待标签页，total 为 execute_chat 总耗时（不含准入）
+PHASES = ("admission", "acquire", "activate", "new_chat", "select_model", "input", "ttft", "generation", "total")
+
+# 覆盖从毫秒级的标签页复用到 MAX_WAIT_TIME 级别的长回答
+PHASE_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300)
+
+
+class Metrics:
+    """
+    服务指标
+
+    用法:
+        metrics = Metrics()
+        metrics.track_pool(lambda: tab_pool.get_stats())
+        metrics.observe_phases("kimi", {"acquire": 0.01, "generation": 12.3, ...})
+        body, content_type = metrics.render()
+    """
+
+    def __init__(self):
+        self.registry = CollectorRegistry()
+        self.phase_seconds = Histogram(
+            "webllm_phase_seconds", "请求各阶段耗时（秒）",
+            ["bot", "phase"], buckets=PHASE_BUCKETS, registry=self.registry
+        )
+        self.errors = Counter(
+            "webllm_errors", "执行失败的请求数",
+            ["bot"], registry=self.registry
+        )
+        self.timeouts = Counter(
+            "webllm_timeouts", "超时次数（admission 等待准入 / acquire 等待标签页 / generation 等待回答 / deadline 超过请求截止时间）",
+            ["bot", "stage"], registry=self.registry
+        )
+        self.cancellations = Counter(
+            "webllm_cancellations", "客户端断开而取消的请求数（admission 等待准入 / queued 等待标签页 / generation 生成中）",
+            ["bot", "stage"], registry=self.registry
+        )
+        self._pool_stats: Optional[Callable[[], Dict[str, dict]]] = None
+        self.registry.register(self)
+
+    def track_pool(self, stats: Callable[[], Dict[str, dict]]):
+        """
+        设置标签页池统计来源，抓取时调用
+
+        Args:
+            stats: 返回 {bot_type: {"total", "in_use", "queue_depth", "limit", "created", "closed"}}
+        """
+        self._pool_stats = stats
+
+    def observe_phases(self, bot_type: str, timings: Dict[str, float]):
+        """记录一次请求的各阶段耗时（未经历的阶段不记录）"""
+        for phase, seconds in timings.items():
+            if phase in PHASES and seconds is not None:
+                self.phase_seconds.labels(bot_type, phase).observe(seconds)
+
+    def collect(self):
+        """Collector 接口：从标签页池读取当前值"""
+        if not self._pool_stats:
+            return
+        try:
+            stats = self._pool_stats() or {}
+        except Exception as e:
+            print(f"[Metrics] 读取标签页池统计失败: {e}")
+            return
+
+        families = {
+            "total": GaugeMetricFamily("webllm_tabs", "标签页数", labels=["bot"]),
+            "in_use": GaugeMetricFamily("webllm_tabs_in_use", "使用中的标签页数", labels=["bot"]),
+            "queue_depth": GaugeMetricFamily("webllm_queue_depth", "等待执行的请求数", labels=["bot"]),
+            "limit": GaugeMetricFamily("webllm_concurrency_limit", "当前并发上限", labels=["bot"]),
+            "blocked_requests": GaugeMetricFamily("webllm_tabs_blocked_requests", "现有标签页被资源拦截的请求数", labels=["bot"]),
+            "loaded_bytes": GaugeMetricFamily("webllm_tabs_loaded_bytes", "现有标签页实际加载的网络字节数", labels=["bot"]),
+            "js_heap": GaugeMetricFamily("webllm_tabs_js_heap_bytes", "标签页 JS 堆使用量合计（最近一次采样）", labels=["bot"]),
+            "created": CounterMetricFamily("webllm_tabs_created", "创建的标签页数", labels=["bot"]),
+            "closed": CounterMetricFamily("webllm_tabs_closed", "关闭的标签页数", labels=["bot"]),
+            "unhealthy": CounterMetricFamily("webllm_tabs_unhealthy", "巡检发现异常并回收的标签页数", labels=["bot"]),
+            "evicted": CounterMetricFamily("webllm_tabs_evicted", "超出内存预算而关闭或重新加载的标签页数", labels=["bot"]),
+            "recycled": CounterMetricFamily("webllm_tabs_recycled", "超过请求数 / DOM 节点阈值而重新加载的标签页数", labels=["bot"]),
+        }
+        for bot_type, bot_stats in stats.items():
+            for key, family in families.items():
+                family.add_metric([bot_type], bot_stats.get(key, 0))
+        yield from families.values()
+
+    def describe(self):
+        # 自定义 Collector 在注册时不调用 collect()（标签页池可能尚未初始化）
+        return []
+
+    def render(self) -> tuple:
+        """导出文本格式 -> (body, content_type)"""
+        return generate_latest(self.registry), CONTENT_TYPE_LATEST
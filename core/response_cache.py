@@ -0,0 +1,136 @@
+# core/response_cache.py
+"""
+回答缓存
+对 (模型, 消息, temperature) 完全相同的请求直接返回已有回答，不再占用标签页
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+
+class ResponseCache:
+    """
+    完全匹配的回答缓存
+
+    - 内存层: LRU + TTL
+    - 磁盘层（可选）: SQLite，服务重启后仍可命中，内存未命中时回查并提升到内存
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl: float = 3600, db_path: Optional[str] = None):
+        """
+        Args:
+            max_entries: 内存层最多条目数
+            ttl: 条目有效期（秒）
+            db_path: SQLite 文件路径，None 表示只用内存
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.db_path = db_path
+
+        # {key: (created, value)}
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)"
+            )
+            self._db.commit()
+
+        print(f"[Cache] 初始化完成，容量 {max_entries}，TTL {ttl}s，磁盘: {db_path or '无'}")
+
+    @staticmethod
+    def make_key(model: str, messages: list, temperature: Optional[float]) -> str:
+        """
+        生成缓存键
+
+        Args:
+            model: 模型名称（忽略大小写和首尾空白）
+            messages: [(role, content), ...]（content 忽略首尾空白）
+            temperature: 采样温度
+        """
+        normalized = {
+            "model": model.lower().strip(),
+            "messages": [[role, content.strip()] for role, content in messages],
+            "temperature": None if temperature is None else round(float(temperature), 4),
+        }
+        raw = json.dumps(normalized, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _expired(self, created: float) -> bool:
+        return time.time() - created > self.ttl
+
+    def get(self, key: str) -> Optional[dict]:
+        """查找缓存，未命中或已过期返回 None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry:
+                created, value = entry
+                if not self._expired(created):
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return value
+                del self._entries[key]
+
+            if self._db:
+                row = self._db.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+                if row:
+                    value, created = json.loads(row[0]), row[1]
+                    if not self._expired(created):
+                        self._put_memory(key, created, value)
+                        self._stats["disk_hits"] += 1
+                        return value
+                    self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._db.commit()
+
+            self._stats["misses"] += 1
+            return None
+
+    def _put_memory(self, key: str, created: float, value: dict):
+        """写入内存层并按 LRU 淘汰（调用方需持有锁）"""
+        self._entries[key] = (created, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def set(self, key: str, value: dict):
+        """写入缓存（同时写入磁盘层）"""
+        created = time.time()
+        with self._lock:
+            self._put_memory(key, created, value)
+            self._stats["stores"] += 1
+            if self._db:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, created) VALUES (?, ?, ?)",
+                    (key, json.dumps(value, ensure_ascii=False), created)
+                )
+                self._db.commit()
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+            if self._db:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+
+    def stats(self) -> dict:
+        """缓存统计"""
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["disk_hits"] + self._stats["misses"]
+            hits = self._stats["hits"] + self._stats["disk_hits"]
+            return {
+                **self._stats,
+                "entries": len(self._entries),
+                "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+                "persistent": self._db is not None,
+            }
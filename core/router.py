@@ -0,0 +1,290 @@
+# core/router.py
+"""
+多节点路由
+对外提供同样的 OpenAI 兼容接口，把请求转发到多个 WebLLM API 实例（各自连接自己的浏览器）
+- 定期读取各实例的 /health 和 /v1/pool/stats，新请求转发到预计等待最短的实例
+- 与各实例保持连接池（httpx.AsyncClient），流式响应逐块透传
+- 实例连续失败后摘除（draining）：不再分配新请求，进行中的请求继续完成；恢复健康后重新加入
+"""
+
+import asyncio
+import json
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+import httpx
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# 不透传的逐跳请求 / 响应头
+HOP_HEADERS = {"host", "content-length", "connection", "keep-alive", "transfer-encoding", "te", "upgrade"}
+
+
+@dataclass
+class Backend:
+    """后端实例状态"""
+    url: str
+    state: str = "healthy"          # healthy / draining（不分配新请求） / down（摘除且无进行中请求）
+    failures: int = 0               # 连续失败次数
+    inflight: int = 0               # 经路由转发、尚未结束的请求数
+    dispatched: Dict[str, int] = field(default_factory=dict)  # 上次读取统计后新分配的请求数 {bot_type: n}
+    stats: Dict[str, dict] = field(default_factory=dict)      # 最近一次 /v1/pool/stats
+    checked_at: float = 0.0
+    served: int = 0
+    last_error: str = ""
+
+
+class BackendRouter:
+    """
+    后端选择与转发
+
+    预计等待 = (使用中 + 排队中 + 上次统计后新分配 + 1) / 并发上限（旧版本实例为标签页数），
+    即新请求前面还有几轮生成；相同时选路由进行中请求更少的实例
+
+    用法:
+        router = BackendRouter(["http://127.0.0.1:8001", "http://127.0.0.1:8002"])
+        await router.start()
+        backend = router.pick("deepseek")
+    """
+
+    def __init__(self, backends: List[str], poll_interval: float = 2.0, unhealthy_after: int = 2,
+                 timeout: float = 600, max_connections: int = 100,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        """
+        Args:
+            backends: 后端实例地址列表
+            poll_interval: 健康检查和读取统计的间隔（秒）
+            unhealthy_after: 连续失败多少次后摘除
+            timeout: 转发请求的读超时（秒），需覆盖排队和最长生成时间
+            max_connections: 连接池大小（所有后端共享）
+            transport: 自定义 httpx transport（测试用）
+        """
+        if not backends:
+            raise ValueError("至少需要一个后端实例")
+        self.backends = [Backend(url=url.rstrip("/")) for url in backends]
+        self.poll_interval = poll_interval
+        self.unhealthy_after = unhealthy_after
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.transport = transport
+        self.client: Optional[httpx.AsyncClient] = None
+        self._poller: Optional[asyncio.Task] = None
+
+        print(f"[Router] 初始化完成，{len(self.backends)} 个后端: {', '.join(b.url for b in self.backends)}")
+
+    # ============== 生命周期 ==============
+
+    def _ensure_client(self) -> httpx.AsyncClient:
+        if self.client is None:
+            self.client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout, connect=5.0),
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections),
+                transport=self.transport,
+            )
+        return self.client
+
+    async def start(self):
+        """建立连接池，立即检查一次各后端，然后在后台定期检查"""
+        self._ensure_client()
+        await self.poll()
+        self._poller = asyncio.create_task(self._poll_loop())
+
+    async def close(self):
+        if self._poller:
+            self._poller.cancel()
+            self._poller = None
+        if self.client:
+            await self.client.aclose()
+            self.client = None
+
+    async def _poll_loop(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self.poll()
+            except Exception as e:
+                print(f"[Router] 健康检查异常: {e}")
+
+    # ============== 健康检查 ==============
+
+    async def poll(self):
+        """检查所有后端（并发）"""
+        await asyncio.gather(*(self._check(backend) for backend in self.backends))
+
+    async def _check(self, backend: Backend):
+        client = self._ensure_client()
+        try:
+            health = await client.get(f"{backend.url}/health", timeout=5.0)
+            health.raise_for_status()
+            if not health.json().get("tab_pool"):
+                raise RuntimeError("标签页池未初始化")
+            stats = await client.get(f"{backend.url}/v1/pool/stats", timeout=5.0)
+            stats.raise_for_status()
+            data = stats.json()
+        except Exception as e:
+            self._record_failure(backend, e)
+            return
+
+        backend.stats = {k: v for k, v in data.items() if isinstance(v, dict)}
+        backend.dispatched = {}
+        backend.checked_at = time.time()
+        backend.failures = 0
+        if backend.state != "healthy":
+            print(f"[Router] ✅ 后端恢复: {backend.url}")
+            backend.state = "healthy"
+
+    def _record_failure(self, backend: Backend, error: Exception):
+        backend.failures += 1
+        backend.last_error = str(error) or type(error).__name__
+        if backend.state == "healthy" and backend.failures >= self.unhealthy_after:
+            print(f"[Router] ⚠️ 后端连续失败 {backend.failures} 次，停止分配新请求: {backend.url} ({backend.last_error})")
+            backend.state = "draining"
+        self._settle(backend)
+
+    def _settle(self, backend: Backend):
+        """摘除中的后端没有进行中的请求时标记为 down"""
+        if backend.state == "draining" and backend.inflight == 0:
+            backend.state = "down"
+            print(f"[Router] 后端已摘除: {backend.url}")
+
+    # ============== 选择 ==============
+
+    def expected_wait(self, backend: Backend, bot_type: str) -> float:
+        """预计等待（以一轮生成为单位）"""
+        stats = backend.stats.get(bot_type, {})
+        busy = stats.get("in_use", 0) + stats.get("queue_depth", 0) + backend.dispatched.get(bot_type, 0)
+        return (busy + 1) / max(stats.get("limit") or stats.get("total", 0), 1)
+
+    def pick(self, bot_type: str, exclude: tuple = ()) -> Optional[Backend]:
+        """选择预计等待最短的健康后端，没有时返回 None"""
+        candidates = [b for b in self.backends if b.state == "healthy" and b not in exclude]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda b: (self.expected_wait(b, bot_type), b.inflight))
+
+    # ============== 转发 ==============
+
+    async def forward(self, method: str, path: str, bot_type: str, body: bytes = b"",
+                      headers: Optional[dict] = None) -> StreamingResponse:
+        """
+        转发请求并逐块透传响应
+
+        连接失败（请求未送达）时换下一个后端重试；响应开始后不再重试
+
+        Raises:
+            HTTPException(503): 没有可用后端
+        """
+        client = self._ensure_client()
+        headers = {k: v for k, v in (headers or {}).items() if k.lower() not in HOP_HEADERS}
+        tried = []
+
+        while True:
+            backend = self.pick(bot_type, exclude=tuple(tried))
+            if backend is None:
+                raise HTTPException(status_code=503, detail="没有可用的后端实例")
+            tried.append(backend)
+
+            backend.inflight += 1
+            backend.dispatched[bot_type] = backend.dispatched.get(bot_type, 0) + 1
+            request = client.build_request(method, f"{backend.url}{path}", content=body, headers=headers)
+            try:
+                response = await client.send(request, stream=True)
+            except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                backend.inflight -= 1
+                self._record_failure(backend, e)
+                print(f"[Router] 连接 {backend.url} 失败，尝试其他后端")
+                continue
+            except BaseException:
+                backend.inflight -= 1
+                self._settle(backend)
+                raise
+            break
+
+        backend.served += 1
+        print(f"[Router] {method} {path} ({bot_type}) -> {backend.url}")
+
+        async def relay():
+            try:
+                async for chunk in response.aiter_bytes():  # 已解压，对应去掉 content-encoding
+                    yield chunk
+            except httpx.HTTPError as e:
+                self._record_failure(backend, e)
+            finally:
+                await response.aclose()  # 客户端断开时也关闭到后端的连接
+                backend.inflight -= 1
+                self._settle(backend)
+
+        response_headers = {k: v for k, v in response.headers.items()
+                            if k.lower() not in HOP_HEADERS and k.lower() != "content-encoding"}
+        response_headers["X-Backend"] = backend.url
+        return StreamingResponse(relay(), status_code=response.status_code, headers=response_headers)
+
+    def get_stats(self) -> dict:
+        """各后端状态"""
+        now = time.time()
+        return {
+            "backends": [
+                {
+                    "url": b.url,
+                    "state": b.state,
+                    "failures": b.failures,
+                    "inflight": b.inflight,
+                    "served": b.served,
+                    "last_error": b.last_error,
+                    "stats_age": round(now - b.checked_at, 2) if b.checked_at else None,
+                    "expected_wait": {bot: round(self.expected_wait(b, bot), 2) for bot in b.stats},
+                }
+                for b in self.backends
+            ]
+        }
+
+
+def create_router_app(router: BackendRouter, route_key: Callable[[str], str]) -> FastAPI:
+    """
+    路由模式的 FastAPI 应用
+
+    Args:
+        router: 后端路由
+        route_key: 模型名称 -> bot_type（按 Bot 类型比较各后端的等待）
+    """
+    app = FastAPI(title="WebLLM API Router", description="把请求分发到多个 WebLLM API 实例")
+
+    @app.on_event("startup")
+    async def startup():
+        await router.start()
+
+    @app.on_event("shutdown")
+    async def shutdown():
+        await router.close()
+
+    @app.get("/")
+    def root():
+        return {"status": "running", "mode": "router", **router.get_stats()}
+
+    @app.get("/health")
+    def health():
+        healthy = sum(1 for b in router.backends if b.state == "healthy")
+        return {"status": "healthy" if healthy else "unavailable", "tab_pool": healthy > 0,
+                "backends": len(router.backends), "healthy_backends": healthy}
+
+    @app.get("/v1/pool/stats")
+    def pool_stats():
+        return router.get_stats()
+
+    @app.get("/v1/models")
+    async def list_models(request: Request):
+        return await router.forward("GET", "/v1/models", "", headers=dict(request.headers))
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.body()
+        try:
+            model = json.loads(body).get("model", "")
+        except (ValueError, AttributeError):
+            return JSONResponse(status_code=400, content={"detail": "请求体不是有效的 JSON"})
+        return await router.forward("POST", "/v1/chat/completions", route_key(str(model)),
+                                    body, dict(request.headers))
+
+    return app
@@ -0,0 +1,93 @@
+# core/single_flight.py
+"""
+相同请求合并（single-flight）
+同一时刻多个完全相同的请求只占用一个标签页执行，其余请求订阅同一个 ChatStream
+"""
+
+import threading
+from typing import Callable, Dict, Optional
+
+from .chat_stream import ChatStream
+
+
+class SingleFlight:
+    """
+    进行中请求的去重表
+
+    第一个请求（leader）实际执行；执行期间到达的相同请求（follower）直接拿到同一个 ChatStream，
+    得到同样的结果或同样的流。通道结束后自动移除，之后的请求重新执行（或命中回答缓存）
+
+    只合并到能满足本请求的执行：其截止时间不早于本请求（或没有截止时间），优先级不低于本请求；
+    否则单独执行，避免继承别人更紧的截止时间或更低的优先级
+    """
+
+    def __init__(self):
+        self._inflight: Dict[str, tuple] = {}  # {key: (ChatStream, priority, deadline)}
+        self._lock = threading.Lock()
+        self._stats = {"leaders": 0, "followers": 0}
+
+    def _join(self, key: str, priority: int, deadline: Optional[float]) -> Optional[ChatStream]:
+        """返回能满足本请求的进行中相同请求并计为 follower（调用方需持有锁）"""
+        entry = self._inflight.get(key)
+        if entry is None:
+            return None
+        stream, leader_priority, leader_deadline = entry
+        if stream.cancelled.is_set():
+            return None  # 正在取消的执行不再合并，重新发起
+        if leader_priority > priority:
+            return None  # 数值小的优先，进行中的请求排队更靠后
+        if leader_deadline is not None and (deadline is None or leader_deadline < deadline):
+            return None  # 进行中的请求会更早因截止时间失败
+        self._stats["followers"] += 1
+        print(f"[SingleFlight] 合并相同请求 (已节省 {self._stats['followers']} 次执行)")
+        return stream
+
+    def join(self, key: str, priority: int = 1, deadline: Optional[float] = None) -> Optional[ChatStream]:
+        """只加入进行中的相同请求，没有（或不能满足本请求）时返回 None（不发起执行）"""
+        with self._lock:
+            return self._join(key, priority, deadline)
+
+    def run(self, key: str, launch: Callable[[ChatStream], None], priority: int = 1,
+            deadline: Optional[float] = None) -> ChatStream:
+        """
+        加入或发起一次执行
+
+        Args:
+            key: 请求去重键
+            launch: 发起执行的函数，接收新建的 ChatStream（需异步执行，不应阻塞）
+            priority / deadline: 本请求的优先级和截止时间，决定能否合并到进行中的执行
+
+        Returns:
+            该请求对应的 ChatStream
+        """
+        with self._lock:
+            stream = self._join(key, priority, deadline)
+            if stream is not None:
+                return stream
+
+            # 进行中的执行不满足本请求时单独执行，之后到达的相同请求合并到较新的这一个
+            stream = ChatStream()
+            self._inflight[key] = (stream, priority, deadline)
+            self._stats["leaders"] += 1
+
+        stream.add_done_callback(lambda s: self._forget(key, s))
+        try:
+            launch(stream)
+        except Exception as e:
+            stream.fail(e)
+        return stream
+
+    def _forget(self, key: str, stream: ChatStream):
+        with self._lock:
+            entry = self._inflight.get(key)
+            if entry is not None and entry[0] is stream:
+                del self._inflight[key]
+
+    def stats(self) -> dict:
+        """合并统计: leaders 实际执行次数，followers 被合并（节省的标签页执行）次数"""
+        with self._lock:
+            return {
+                **self._stats,
+                "saved_executions": self._stats["followers"],
+                "in_flight": len(self._inflight),
+            }
@@ -6,11 +6,15 @@
 
 import time
 import threading
-from typing import Dict, Optional, Any
+import itertools
+from typing import Dict, Optional, Any, Callable
 from dataclasses import dataclass, field
-from queue import Queue
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
 from contextlib import contextmanager
 
+from .concurrency import DeadlineExceeded
+from adapters.cdp_events import listen
+
 
 @dataclass
 class TabInfo:
@@ -20,6 +24,32 @@ class TabInfo:
     in_use: bool = False       # 是否正在使用
     last_used: float = field(default_factory=time.time)
     url: str = ""              # 当前 URL
+    state: str = "ready"       # 会话状态: ready 干净的新对话 / dirty 有旧对话 / resetting 后台重置中
+    session_key: Optional[str] = None  # 标签页中保留的多轮对话（消息历史哈希）
+    browser_id: int = 0        # 所在浏览器（TabPoolManager.browsers 的下标）
+    health: str = "unknown"    # 最近一次巡检结果: unknown / healthy / unhealthy
+    health_error: str = ""     # 最近一次巡检发现的问题
+    checked_at: float = 0.0    # 最近一次巡检时间
+    checking: bool = False     # 巡检中（暂不分配）
+    js_heap: int = 0           # 渲染进程 JS 堆使用量（字节，Performance.getMetrics 采样）
+    dom_nodes: int = 0         # DOM 节点数
+    sampled_at: float = 0.0    # 最近一次内存采样时间
+    requests_served: int = 0   # 上次加载页面后处理的请求数
+    blocked_requests: int = 0  # 被资源拦截规则拦下的请求数
+    loaded_bytes: int = 0      # 实际加载的网络字节数（Network.loadingFinished）
+
+
+@dataclass
+class _Waiter:
+    """排队等待标签页的请求"""
+    bot_type: str
+    event: threading.Event = field(default_factory=threading.Event)
+    tab_info: Optional[TabInfo] = None   # 被分配到的标签页（由 release_tab 直接移交）
+    enqueued_at: float = field(default_factory=time.time)
+    priority: int = 1                    # 数值小的先分配
+    deadline: Optional[float] = None     # 截止时间（time.time()），过期后不再分配标签页
+    seq: int = 0                         # 同优先级按到达顺序
+    expired: bool = False                # 移交时发现已过截止时间
 
 
 class TabPoolManager:
@@ -29,26 +59,89 @@ class TabPoolManager:
     功能:
     - 为每个请求分配独立标签页
     - 标签页复用，避免频繁创建
+    - 启动时预热，新标签页在后台线程创建，不占用池锁
+    - 释放后在后台重置为新对话，请求拿到的标签页已就绪
+    - 多轮对话亲和：保留对话的标签页优先分配给同一对话的后续请求
     - 线程安全的资源管理
+    - 标签页用满时按优先级排队（同优先级先来后到），释放时直接移交给队首请求；已过截止时间的请求直接出队
+    - 多浏览器分片：新标签页放到负载最低的浏览器，分散 CPU 和内存压力
     - 自动清理闲置标签页
+    - 后台巡检：定期探测空闲标签页（页面无响应、退出登录、验证码），异常的在请求到来前回收并补充
+    - 内存预算：定期采样各标签页的 JS 堆和 DOM 节点数，浏览器超出预算时先处理最重的空闲标签页
+      （超出预热数量的关闭，否则重新加载页面释放内存）
+    - 资源拦截：新标签页加载页面前通过 CDP Network.setBlockedURLs 拦截图片、字体、统计脚本等不需要的资源
+    - 免焦点：新标签页开启焦点模拟（Emulation.setFocusEmulationEnabled），后台标签页也按前台页面运行
+    - 老化回收：处理请求数或 DOM 节点数超过阈值的标签页在空闲时重新加载页面（失败时换新标签页），
+      避免只点"新对话"按钮的标签页无限累积 DOM
     """
     
-    def __init__(self, browser, max_tabs_per_bot: int = 3, tab_timeout: int = 300):
+    def __init__(self, browser, max_tabs_per_bot: int = 3, tab_timeout: int = 300,
+                 acquire_timeout: Optional[float] = None, min_tabs_per_bot: int = 0,
+                 reset_callback: Optional[Callable[[TabInfo], bool]] = None,
+                 health_callback: Optional[Callable[[TabInfo], Optional[str]]] = None,
+                 maintenance_interval: float = 60, health_timeout: float = 5,
+                 memory_budget_mb: Optional[float] = None, max_requests_per_tab: Optional[int] = None,
+                 max_dom_nodes: Optional[int] = None, blocked_urls: Optional[Dict[str, list]] = None,
+                 focus_free: bool = False):
         """
         初始化标签页池
         
         Args:
-            browser: DrissionPage 浏览器实例
+            browser: DrissionPage 浏览器实例，或多个实例的列表（标签页分散到各浏览器）
             max_tabs_per_bot: 每种 Bot 最大标签页数
             tab_timeout: 标签页闲置超时时间（秒）
+            acquire_timeout: 排队等待标签页的默认超时（秒），None 表示一直等待
+            min_tabs_per_bot: 每种 Bot 常驻的预热标签页数
+            reset_callback: 把标签页重置为新对话的回调，返回是否成功；为 None 时不做后台重置
+            health_callback: 健康探测回调，返回 None 表示健康，否则为问题描述；为 None 时不巡检
+            maintenance_interval: 后台维护（清理闲置、健康探测、内存采样）的间隔（秒），
+                                  闲置不足该时间的标签页不重复探测
+            health_timeout: 单次探测 / 采样的超时（秒），探测超时视为页面无响应
+            memory_budget_mb: 每个浏览器所有标签页 JS 堆合计的上限（MB），None 表示只采样不回收
+            max_requests_per_tab: 标签页处理多少个请求后重新加载，None 表示不限
+            max_dom_nodes: DOM 节点数（最近一次采样）超过多少时重新加载，None 表示不限
+            blocked_urls: 各 Bot 拦截的资源 URL 模式 {bot_type: [pattern, ...]}（支持 * 通配），
+                          "*" 对所有 Bot 生效；None 表示不拦截
+            focus_free: 新标签页开启焦点模拟，并行的标签页无需切到前台
         """
-        self.browser = browser
+        self.browsers = list(browser) if isinstance(browser, (list, tuple)) else [browser]
+        self.browser = self.browsers[0]
         self.max_tabs_per_bot = max_tabs_per_bot
+        self.min_tabs_per_bot = min(min_tabs_per_bot, max_tabs_per_bot)
         self.tab_timeout = tab_timeout
+        self.acquire_timeout = acquire_timeout
+        self.reset_callback = reset_callback
+        self.health_callback = health_callback
+        self.maintenance_interval = maintenance_interval
+        self.health_timeout = health_timeout
+        self.memory_budget = memory_budget_mb * 1024 * 1024 if memory_budget_mb else None
+        self.max_requests_per_tab = max_requests_per_tab
+        self.max_dom_nodes = max_dom_nodes
+        self.blocked_urls = blocked_urls or {}
+        self.focus_free = focus_free
         
         # 标签页池: {bot_type: [TabInfo, ...]}
         self.pools: Dict[str, list] = {}
         
+        # 正在后台创建的标签页数: {bot_type: int}
+        self.pending: Dict[str, int] = {}
+        
+        # 各浏览器正在创建的标签页数（与 browsers 下标对应）
+        self.browser_pending = [0] * len(self.browsers)
+        
+        # 对话索引: {session_key: TabInfo}
+        self.sessions: Dict[str, TabInfo] = {}
+        
+        # 等待队列: {bot_type: [_Waiter, ...]}，按 (priority, seq) 排序
+        self.waiters: Dict[str, list] = {}
+        self._waiter_seq = itertools.count()
+        
+        # 等待统计: {bot_type: {"waits", "total_wait", "max_wait", "timeouts"}}
+        self.wait_stats: Dict[str, dict] = {}
+        
+        # 标签页生命周期计数: {bot_type: {"created", "closed", "unhealthy", "evicted", "recycled"}}
+        self.tab_counts: Dict[str, dict] = {}
+        
         # 线程锁
         self.lock = threading.RLock()
         
@@ -60,97 +153,419 @@ class TabPoolManager:
             "lmarena": "https://lmarena.ai/",
         }
         
-        print(f"[TabPool] 初始化完成，每种 Bot 最大 {max_tabs_per_bot} 个标签页")
+        # 后台线程：建页、重置、健康探测
+        self._worker = ThreadPoolExecutor(
+            max_workers=max(1, max_tabs_per_bot) * len(self.bot_urls),
+            thread_name_prefix="tab-pool"
+        )
+        
+        # 巡检线程（start_maintenance 启动）
+        self._maintenance: Optional[threading.Thread] = None
+        self._stop_maintenance = threading.Event()
+        
+        print(f"[TabPool] 初始化完成，{len(self.browsers)} 个浏览器，每种 Bot 最大 {max_tabs_per_bot} 个标签页，预热 {self.min_tabs_per_bot} 个")
     
-    def _create_tab(self, bot_type: str) -> TabInfo:
-        """创建新标签页"""
+    def _create_tab(self, bot_type: str, browser_id: int = 0) -> TabInfo:
+        """在指定浏览器中创建新标签页并等待页面加载（耗时操作，不能持有锁调用）"""
         url = self.bot_urls.get(bot_type, "")
         if not url:
             raise ValueError(f"未知的 Bot 类型: {bot_type}")
         
-        # 创建新标签页
-        tab = self.browser.new_tab(url)
-        time.sleep(2)  # 等待页面加载
-        
+        # 创建新标签页；需要准备时先打开空白页，设置好拦截 / 焦点模拟后再加载，首次加载也生效
+        patterns = self._blocked_patterns(bot_type)
+        prepare = bool(patterns) or self.focus_free
+        tab = self.browsers[browser_id].new_tab(None if prepare else url)
         tab_info = TabInfo(
             tab=tab,
             bot_type=bot_type,
-            in_use=True,
-            url=url
+            url=url,
+            browser_id=browser_id
         )
+        if prepare:
+            self._prepare_tab(tab_info, patterns)
+            tab.get(url)
+        try:
+            tab.wait.doc_loaded(timeout=15)
+        except Exception as e:
+            print(f"[TabPool] 等待页面加载失败: {bot_type}: {e}")
         
-        print(f"[TabPool] 创建新标签页: {bot_type} (共 {self._count_tabs(bot_type) + 1} 个)")
         return tab_info
     
+    def _blocked_patterns(self, bot_type: str) -> list:
+        """某种 Bot 的资源拦截规则（通用规则 + 站点规则）"""
+        return list(dict.fromkeys(self.blocked_urls.get("*", []) + self.blocked_urls.get(bot_type, [])))
+    
+    def _prepare_tab(self, tab_info: TabInfo, patterns: list):
+        """
+        加载页面前准备标签页（对之后的跳转、刷新持续生效）:
+        - 焦点模拟：页面始终认为自己处于焦点中，不必切到前台
+        - 资源拦截，并统计网络流量
+        
+        设置失败不影响使用，只是退回默认行为
+        """
+        tab = tab_info.tab
+        if self.focus_free:
+            try:
+                tab.run_cdp("Emulation.setFocusEmulationEnabled", enabled=True)
+            except Exception as e:
+                print(f"[TabPool] 设置焦点模拟失败: {tab_info.bot_type}: {e}")
+        if not patterns:
+            return
+        
+        def on_failed(blockedReason=None, **kwargs):
+            if blockedReason:
+                tab_info.blocked_requests += 1  # 事件在该标签页的事件线程中依次回调
+        
+        def on_finished(encodedDataLength=0, **kwargs):
+            tab_info.loaded_bytes += int(encodedDataLength or 0)
+        
+        try:
+            tab.run_cdp("Network.enable")
+            tab.run_cdp("Network.setBlockedURLs", urls=patterns)
+            listen(tab, "Network.loadingFailed", on_failed)  # 与网络捕获共用事件
+            listen(tab, "Network.loadingFinished", on_finished)
+        except Exception as e:
+            print(f"[TabPool] 设置资源拦截失败: {tab_info.bot_type}: {e}")
+    
+    def _browser_load(self, browser_id: int) -> tuple:
+        """浏览器负载: (标签页数 + 创建中, 使用中)（调用方需持有锁）"""
+        tabs = [t for pool in self.pools.values() for t in pool if t.browser_id == browser_id]
+        return len(tabs) + self.browser_pending[browser_id], sum(1 for t in tabs if t.in_use)
+    
+    def _pick_browser(self) -> int:
+        """选择负载最低的浏览器（调用方需持有锁）"""
+        return min(range(len(self.browsers)), key=lambda i: (self._browser_load(i), i))
+    
+    def _spawn_tab(self, bot_type: str):
+        """提交后台建页任务（调用方需持有锁）"""
+        browser_id = self._pick_browser()
+        self.pending[bot_type] = self.pending.get(bot_type, 0) + 1
+        self.browser_pending[browser_id] += 1
+        self._worker.submit(self._create_tab_async, bot_type, browser_id)
+    
+    def _create_tab_async(self, bot_type: str, browser_id: int = 0):
+        """后台线程：创建标签页后加入池，并移交给等待者"""
+        tab_info = None
+        try:
+            tab_info = self._create_tab(bot_type, browser_id)
+        except Exception as e:
+            print(f"[TabPool] ❌ 创建标签页失败: {bot_type} (浏览器 {browser_id}): {e}")
+        
+        with self.lock:
+            self.pending[bot_type] -= 1
+            self.browser_pending[browser_id] -= 1
+            if tab_info is None:
+                return
+            
+            self.pools[bot_type].append(tab_info)
+            self.tab_counts[bot_type]["created"] += 1
+            print(f"[TabPool] 创建新标签页: {bot_type} (共 {self._count_tabs(bot_type)} 个，浏览器 {browser_id})")
+            if self._handoff(tab_info):
+                print(f"[TabPool] 移交新标签页: {bot_type}")
+    
+    def _ensure_capacity(self, bot_type: str):
+        """
+        按需补充标签页（调用方需持有锁）
+        
+        保证标签页数不低于 min_tabs_per_bot，且每个等待者都有一个在建标签页，
+        总数不超过 max_tabs_per_bot
+        """
+        self._init_bot_type(bot_type)
+        while self._count_tabs(bot_type) + self.pending[bot_type] < self.max_tabs_per_bot:
+            total = self._count_tabs(bot_type) + self.pending[bot_type]
+            if total >= self.min_tabs_per_bot and self.pending[bot_type] >= len(self.waiters[bot_type]):
+                break
+            self._spawn_tab(bot_type)
+    
+    def warm_up(self, bot_types: Optional[list] = None):
+        """后台预热：为每种 Bot 创建 min_tabs_per_bot 个标签页（立即返回）"""
+        with self.lock:
+            for bot_type in bot_types or list(self.bot_urls):
+                self._ensure_capacity(bot_type)
+        print(f"[TabPool] 预热已提交: {bot_types or list(self.bot_urls)}")
+    
+    def discard_tab(self, tab_info: TabInfo):
+        """关闭并移出标签页（用于回收异常标签页），随后在后台补充"""
+        with self.lock:
+            self._drop_session(tab_info)
+            pool = self.pools.get(tab_info.bot_type, [])
+            if tab_info in pool:
+                pool.remove(tab_info)
+                self.tab_counts[tab_info.bot_type]["closed"] += 1
+            self._ensure_capacity(tab_info.bot_type)
+        try:
+            tab_info.tab.close()
+        except Exception:
+            pass
+        print(f"[TabPool] 回收标签页: {tab_info.bot_type}")
+    
     def _count_tabs(self, bot_type: str) -> int:
         """统计某类型的标签页数量"""
         return len(self.pools.get(bot_type, []))
     
     def _find_available_tab(self, bot_type: str) -> Optional[TabInfo]:
-        """查找可用的标签页"""
-        pool = self.pools.get(bot_type, [])
-        for tab_info in pool:
-            if not tab_info.in_use:
-                return tab_info
-        return None
+        """
+        查找可用的标签页
+        
+        优先级: 已重置好的 > 未保留对话的 > 保留对话最久未用的（其对话被淘汰）
+        """
+        idle = [t for t in self.pools.get(bot_type, []) if not t.in_use]
+        if not idle:
+            return None
+        idle.sort(key=lambda t: (t.session_key is not None, t.state != "ready", t.last_used))
+        return idle[0]
+    
+    def _drop_session(self, tab_info: TabInfo):
+        """淘汰标签页上保留的对话（调用方需持有锁）"""
+        if tab_info.session_key:
+            self.sessions.pop(tab_info.session_key, None)
+            tab_info.session_key = None
+            print(f"[TabPool] 淘汰对话: {tab_info.bot_type}")
     
-    def acquire_tab(self, bot_type: str) -> TabInfo:
+    def bind_session(self, tab_info: TabInfo, session_key: Optional[str]):
+        """
+        记录标签页当前保留的对话
+        
+        Args:
+            tab_info: 标签页
+            session_key: 对话消息历史的哈希，None 表示清除
+        """
+        with self.lock:
+            if tab_info.session_key:
+                self.sessions.pop(tab_info.session_key, None)
+            tab_info.session_key = session_key
+            if session_key:
+                self.sessions[session_key] = tab_info
+    
+    def _init_bot_type(self, bot_type: str):
+        """初始化某类型的池、等待队列和统计"""
+        if bot_type not in self.pools:
+            self.pools[bot_type] = []
+            self.pending[bot_type] = 0
+            self.waiters[bot_type] = []
+            self.wait_stats[bot_type] = {"waits": 0, "total_wait": 0.0, "max_wait": 0.0, "timeouts": 0, "expired": 0}
+            self.tab_counts[bot_type] = {"created": 0, "closed": 0, "unhealthy": 0, "evicted": 0, "recycled": 0}
+    
+    def _enqueue(self, waiter: _Waiter):
+        """按 (priority, seq) 插入等待队列（调用方需持有锁）"""
+        queue = self.waiters[waiter.bot_type]
+        waiter.seq = next(self._waiter_seq)
+        index = len(queue)
+        while index > 0 and (queue[index - 1].priority, queue[index - 1].seq) > (waiter.priority, waiter.seq):
+            index -= 1
+        queue.insert(index, waiter)
+    
+    def _handoff(self, tab_info: TabInfo) -> bool:
+        """把标签页直接移交给队首的等待者，跳过已过截止时间的请求（调用方需持有锁）"""
+        queue = self.waiters.get(tab_info.bot_type)
+        now = time.time()
+        while queue and queue[0].deadline is not None and queue[0].deadline <= now:
+            waiter = queue.pop(0)
+            waiter.expired = True
+            waiter.event.set()
+            print(f"[TabPool] 丢弃已过截止时间的请求: {tab_info.bot_type}")
+        if not queue:
+            return False
+        
+        waiter = queue.pop(0)
+        self._drop_session(tab_info)
+        tab_info.in_use = True
+        tab_info.last_used = time.time()
+        waiter.tab_info = tab_info
+        waiter.event.set()
+        return True
+    
+    def acquire_tab(self, bot_type: str, timeout: Optional[float] = None,
+                    session_key: Optional[str] = None, priority: int = 1,
+                    deadline: Optional[float] = None) -> TabInfo:
         """
         获取一个可用的标签页
         
         Args:
             bot_type: Bot 类型
+            timeout: 排队等待超时（秒），默认使用 acquire_timeout
+            session_key: 多轮对话的历史哈希；对应标签页空闲时直接分配该标签页
+                         （调用方通过 tab_info.session_key == session_key 判断是否命中）
+            priority: 排队优先级，数值小的先分配
+            deadline: 请求截止时间（time.time()），排队等待不超过该时间
             
         Returns:
             TabInfo 对象
+            
+        Raises:
+            TimeoutError: 等待超时
+            DeadlineExceeded: 已过截止时间
         """
+        if timeout is None:
+            timeout = self.acquire_timeout
+        if deadline is not None:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise DeadlineExceeded(f"请求已过截止时间，不再分配 {bot_type} 标签页")
+            timeout = remaining if timeout is None else min(timeout, remaining)
+        
         with self.lock:
-            # 初始化池
-            if bot_type not in self.pools:
-                self.pools[bot_type] = []
+            self._init_bot_type(bot_type)
             
-            # 1. 尝试复用空闲标签页
-            tab_info = self._find_available_tab(bot_type)
-            if tab_info:
+            # 0. 对话亲和：保留该对话的标签页空闲时直接使用
+            tab_info = self.sessions.get(session_key) if session_key else None
+            if tab_info and not tab_info.in_use and tab_info.bot_type == bot_type:
                 tab_info.in_use = True
                 tab_info.last_used = time.time()
-                print(f"[TabPool] 复用标签页: {bot_type}")
-                return tab_info
-            
-            # 2. 检查是否可以创建新标签页
-            if self._count_tabs(bot_type) < self.max_tabs_per_bot:
-                tab_info = self._create_tab(bot_type)
-                self.pools[bot_type].append(tab_info)
+                print(f"[TabPool] 续接对话标签页: {bot_type}")
                 return tab_info
             
-            # 3. 达到上限，等待复用
-            print(f"[TabPool] {bot_type} 标签页已满，等待释放...")
-            
-        # 在锁外等待（避免死锁）
-        while True:
-            time.sleep(0.5)
-            with self.lock:
+            # 有同等或更高优先级的请求在排队时不插队
+            if not any(w.priority <= priority for w in self.waiters[bot_type]):
+                # 1. 尝试复用空闲标签页
                 tab_info = self._find_available_tab(bot_type)
                 if tab_info:
+                    self._drop_session(tab_info)
                     tab_info.in_use = True
                     tab_info.last_used = time.time()
-                    print(f"[TabPool] 等待后复用标签页: {bot_type}")
+                    print(f"[TabPool] 复用标签页: {bot_type}")
                     return tab_info
+                
+            # 2. 排队等待：释放的标签页或后台新建的标签页会直接移交
+            waiter = _Waiter(bot_type, priority=priority, deadline=deadline)
+            self._enqueue(waiter)
+            
+            # 3. 未达上限时在后台创建新标签页（不阻塞其他类型的获取）
+            self._ensure_capacity(bot_type)
+            print(f"[TabPool] {bot_type} 暂无空闲标签页，排队等待 (队列 {len(self.waiters[bot_type])}, 创建中 {self.pending[bot_type]})")
+        
+        # 在锁外等待（避免死锁）
+        waiter.event.wait(timeout)
+        
+        with self.lock:
+            stats = self.wait_stats[bot_type]
+            waited = time.time() - waiter.enqueued_at
+            
+            # 超时与移交可能同时发生，以是否已分配标签页为准
+            if waiter.tab_info is None:
+                if waiter in self.waiters[bot_type]:
+                    self.waiters[bot_type].remove(waiter)
+                if waiter.expired or (deadline is not None and time.time() >= deadline):
+                    stats["expired"] += 1
+                    raise DeadlineExceeded(f"等待 {bot_type} 标签页期间已过截止时间 ({waited:.1f}s)")
+                stats["timeouts"] += 1
+                raise TimeoutError(f"等待 {bot_type} 标签页超时 ({waited:.1f}s)")
+            
+            stats["waits"] += 1
+            stats["total_wait"] += waited
+            stats["max_wait"] = max(stats["max_wait"], waited)
+            print(f"[TabPool] 等待后复用标签页: {bot_type} (等待 {waited:.1f}s)")
+            return waiter.tab_info
+    
+    def _make_available(self, tab_info: TabInfo):
+        """有等待者时直接移交，否则标记为可用（调用方需持有锁）"""
+        if self._handoff(tab_info):
+            print(f"[TabPool] 移交标签页: {tab_info.bot_type}")
+            return
+        tab_info.in_use = False
+        print(f"[TabPool] 释放标签页: {tab_info.bot_type}")
     
     def release_tab(self, tab_info: TabInfo):
         """
-        释放标签页（标记为可用）
+        释放标签页
+        
+        超过老化阈值的标签页在后台重新加载页面（保留的对话一并淘汰）；
+        配置了 reset_callback 时先在后台重置为新对话，完成后再移交/标记可用；
+        保留了多轮对话的标签页不重置，等待同一对话的后续请求（被其他请求占用时才淘汰），
+        同时保证还有干净的标签页可用（见 _keep_ready）；否则立即移交给等待者或标记为可用
         
         Args:
             tab_info: 要释放的标签页
         """
         with self.lock:
-            tab_info.in_use = False
             tab_info.last_used = time.time()
-            print(f"[TabPool] 释放标签页: {tab_info.bot_type}")
+            tab_info.state = "dirty"
+            tab_info.requests_served += 1
+            
+            if self._worn(tab_info):
+                self._recycle(tab_info)
+                return
+            
+            if self.reset_callback and not tab_info.session_key:
+                tab_info.state = "resetting"
+                self._worker.submit(self._reset_async, tab_info)
+                print(f"[TabPool] 释放标签页，后台重置中: {tab_info.bot_type}")
+                return
+            
+            self._make_available(tab_info)
+            self._keep_ready(tab_info.bot_type)
+    
+    def _keep_ready(self, bot_type: str):
+        """
+        保证至少有一个干净的标签页（已重置好的空闲标签页、重置中或创建中）供无关的新请求使用，
+        避免它们在关键路径上开新对话（调用方需持有锁）
+        
+        没有时未达上限则后台新建一个，已达上限则在后台重置最久未用的保留对话标签页（淘汰其对话），
+        即最多保留 max_tabs_per_bot - 1 个对话
+        """
+        if not self.reset_callback:
+            return
+        pool = self.pools.get(bot_type, [])
+        if self.pending.get(bot_type, 0) or any(
+                not t.session_key and (t.state == "resetting" or (not t.in_use and t.state == "ready"))
+                for t in pool):
+            return
+        if len(pool) < self.max_tabs_per_bot:
+            self._spawn_tab(bot_type)
+            return
+        retained = [t for t in pool if not t.in_use and t.session_key]
+        if not retained:
+            return
+        tab_info = min(retained, key=lambda t: t.last_used)
+        self._drop_session(tab_info)
+        tab_info.in_use = True
+        tab_info.state = "resetting"
+        self._worker.submit(self._reset_async, tab_info)
+        print(f"[TabPool] 没有干净的标签页，后台重置保留对话的标签页: {bot_type}")
+    
+    def _worn(self, tab_info: TabInfo) -> bool:
+        """是否超过老化阈值（请求数 / DOM 节点数）"""
+        return bool(
+            (self.max_requests_per_tab and tab_info.requests_served >= self.max_requests_per_tab)
+            or (self.max_dom_nodes and tab_info.dom_nodes >= self.max_dom_nodes)
+        )
+    
+    def _recycle(self, tab_info: TabInfo):
+        """暂停分配并在后台重新加载老化的标签页（调用方需持有锁，标签页 in_use）"""
+        print(f"[TabPool] ♻️ 标签页老化（{tab_info.requests_served} 个请求，{tab_info.dom_nodes} 个 DOM 节点），"
+              f"后台重新加载: {tab_info.bot_type}")
+        self._drop_session(tab_info)
+        self.tab_counts[tab_info.bot_type]["recycled"] += 1
+        tab_info.state = "resetting"
+        self._worker.submit(self._reload_async, tab_info)
+    
+    def recycle_worn_tabs(self) -> int:
+        """重新加载超过老化阈值的空闲标签页（如保留对话的标签页 DOM 持续增长），返回处理数"""
+        with self.lock:
+            worn = [t for pool in self.pools.values() for t in pool if not t.in_use and self._worn(t)]
+            for tab_info in worn:
+                tab_info.in_use = True
+                self._recycle(tab_info)
+        return len(worn)
+    
+    def _reset_async(self, tab_info: TabInfo):
+        """后台线程：重置为新对话，然后放回池中"""
+        ok = False
+        try:
+            ok = bool(self.reset_callback(tab_info))
+        except Exception as e:
+            print(f"[TabPool] ❌ 重置标签页失败: {tab_info.bot_type}: {e}")
+        
+        with self.lock:
+            tab_info.state = "ready" if ok else "dirty"
+            tab_info.last_used = time.time()
+            if tab_info not in self.pools.get(tab_info.bot_type, []):
+                return  # 重置期间已被回收
+            self._make_available(tab_info)
     
     @contextmanager
-    def get_tab(self, bot_type: str):
+    def get_tab(self, bot_type: str, timeout: Optional[float] = None, session_key: Optional[str] = None,
+                priority: int = 1, deadline: Optional[float] = None):
         """
         上下文管理器：自动获取和释放标签页
         
@@ -158,19 +573,20 @@ class TabPoolManager:
             with tab_pool.get_tab("kimi") as tab_info:
                 # 使用 tab_info.tab
         """
-        tab_info = self.acquire_tab(bot_type)
+        tab_info = self.acquire_tab(bot_type, timeout, session_key, priority, deadline)
         try:
             yield tab_info
         finally:
             self.release_tab(tab_info)
     
     def cleanup_idle_tabs(self):
-        """清理闲置超时的标签页"""
+        """清理闲置超时的标签页（保留预热数量，不足时后台补充）"""
         with self.lock:
             now = time.time()
+            keep = max(1, self.min_tabs_per_bot)
             for bot_type, pool in self.pools.items():
-                # 保留至少一个标签页
-                if len(pool) <= 1:
+                # 保留至少 keep 个标签页
+                if len(pool) <= keep:
                     continue
                 
                 # 找出闲置超时的标签页
@@ -179,24 +595,281 @@ class TabPoolManager:
                     if not tab_info.in_use and (now - tab_info.last_used) > self.tab_timeout:
                         to_remove.append(tab_info)
                 
-                # 关闭并移除（保留至少一个）
-                for tab_info in to_remove[:-1] if len(pool) - len(to_remove) < 1 else to_remove:
+                # 关闭并移除（保留至少 keep 个）
+                for tab_info in to_remove[:len(pool) - keep]:
                     try:
                         tab_info.tab.close()
                         pool.remove(tab_info)
+                        self.tab_counts[bot_type]["closed"] += 1
+                        self._drop_session(tab_info)
                         print(f"[TabPool] 清理闲置标签页: {bot_type}")
                     except:
                         pass
+                
+                self._ensure_capacity(bot_type)
+    
+    # ============== 后台维护 ==============
+    
+    def start_maintenance(self):
+        """启动后台维护线程（每 maintenance_interval 秒执行一次 run_maintenance）"""
+        if self._maintenance or not self.maintenance_interval:
+            return
+        self._stop_maintenance.clear()
+        self._maintenance = threading.Thread(target=self._maintenance_loop, name="tab-pool-maintenance", daemon=True)
+        self._maintenance.start()
+        print(f"[TabPool] 后台维护已启动，间隔 {self.maintenance_interval}s")
+    
+    def stop_maintenance(self):
+        self._stop_maintenance.set()
+        self._maintenance = None
+    
+    def _maintenance_loop(self):
+        while not self._stop_maintenance.wait(self.maintenance_interval):
+            try:
+                self.run_maintenance()
+            except Exception as e:
+                print(f"[TabPool] 后台维护异常: {e}")
+    
+    def run_maintenance(self):
+        """清理闲置标签页、健康巡检、内存采样并执行内存预算"""
+        self.cleanup_idle_tabs()
+        self.check_health()
+        self.sample_memory()
+        self.recycle_worn_tabs()
+        self.enforce_memory_budget()
+    
+    def _call(self, func: Callable, tab_info: TabInfo):
+        """在后台线程中对标签页执行 func，超过 health_timeout 抛出 TimeoutError"""
+        future = self._worker.submit(func, tab_info)
+        try:
+            return future.result(timeout=self.health_timeout)
+        except FutureTimeout:
+            raise TimeoutError(f"超时 ({self.health_timeout}s)")
+    
+    # ============== 健康巡检 ==============
+    
+    def _next_to_check(self, checked: set) -> Optional[TabInfo]:
+        """
+        取一个需要探测的空闲标签页并暂停分配（调用方需持有锁）
+
+        保留对话的标签页不探测：探测期间续聊请求拿不到它，只能退回完整历史
+        """
+        now = time.time()
+        for pool in self.pools.values():
+            for tab_info in pool:
+                if id(tab_info) in checked or tab_info.in_use or tab_info.state == "resetting":
+                    continue
+                if tab_info.session_key:
+                    continue
+                # 刚用过或刚探测过的标签页不重复探测
+                if now - max(tab_info.last_used, tab_info.checked_at) < self.maintenance_interval:
+                    continue
+                tab_info.in_use = True
+                tab_info.checking = True
+                return tab_info
+        return None
+    
+    def _probe(self, tab_info: TabInfo) -> Optional[str]:
+        """在后台线程中探测，超时视为无响应"""
+        try:
+            return self._call(self.health_callback, tab_info)
+        except TimeoutError as e:
+            return f"探测{e}"
+        except Exception as e:
+            return f"探测失败: {e}"
+    
+    def check_health(self) -> int:
+        """
+        巡检一轮：逐个探测空闲标签页，每次只暂停分配一个
+        
+        健康的放回池中（有等待者时直接移交）；异常的关闭并在后台补充新标签页
+        
+        Returns:
+            回收的标签页数
+        """
+        if not self.health_callback:
+            return 0
+        checked, recycled = set(), 0
+        while True:
+            with self.lock:
+                tab_info = self._next_to_check(checked)
+            if tab_info is None:
+                return recycled
+            checked.add(id(tab_info))
+            
+            error = self._probe(tab_info)
+            with self.lock:
+                tab_info.checking = False
+                tab_info.checked_at = time.time()
+                tab_info.health = "unhealthy" if error else "healthy"
+                tab_info.health_error = error or ""
+                if not error:
+                    self._make_available(tab_info)
+                    continue
+                self.tab_counts[tab_info.bot_type]["unhealthy"] += 1
+            
+            print(f"[TabPool] ⚠️ 标签页异常，回收并补充: {tab_info.bot_type} (浏览器 {tab_info.browser_id}): {error}")
+            self.discard_tab(tab_info)
+            recycled += 1
+    
+    # ============== 内存预算 ==============
+    
+    @staticmethod
+    def _read_metrics(tab_info: TabInfo) -> dict:
+        """通过 CDP Performance.getMetrics 读取渲染进程指标 {name: value}"""
+        if not tab_info.sampled_at:
+            tab_info.tab.run_cdp("Performance.enable")
+        result = tab_info.tab.run_cdp("Performance.getMetrics") or {}
+        return {m["name"]: m["value"] for m in result.get("metrics", [])}
+    
+    def sample_memory(self):
+        """采样所有标签页的 JS 堆和 DOM 节点数（CDP 调用不触碰页面，使用中的标签页也采样）"""
+        with self.lock:
+            tabs = [t for pool in self.pools.values() for t in pool]
+        for tab_info in tabs:
+            try:
+                metrics = self._call(self._read_metrics, tab_info)
+            except Exception as e:
+                print(f"[TabPool] 内存采样失败: {tab_info.bot_type}: {e}")
+                continue
+            with self.lock:
+                tab_info.js_heap = int(metrics.get("JSHeapUsedSize", 0))
+                tab_info.dom_nodes = int(metrics.get("Nodes", 0))
+                tab_info.sampled_at = time.time()
+    
+    def enforce_memory_budget(self) -> int:
+        """
+        浏览器的 JS 堆合计超出预算时，从最重的空闲标签页开始处理，直到回到预算以内
+        
+        超出预热数量的标签页直接关闭，否则在后台重新加载页面（丢弃旧对话的 DOM 和 JS 堆）
+        
+        Returns:
+            处理的标签页数
+        """
+        if not self.memory_budget:
+            return 0
+        to_close, to_reload = [], []
+        with self.lock:
+            # 各模型的剩余标签页数跨浏览器累计：前面浏览器中已决定关闭的要先扣掉
+            remaining = {bot_type: len(pool) for bot_type, pool in self.pools.items()}
+            for browser_id in range(len(self.browsers)):
+                tabs = [t for pool in self.pools.values() for t in pool if t.browser_id == browser_id]
+                total = sum(t.js_heap for t in tabs)
+                if total <= self.memory_budget:
+                    continue
+                print(f"[TabPool] ⚠️ 浏览器 {browser_id} JS 堆 {total / 1048576:.0f}MB 超出预算 "
+                      f"{self.memory_budget / 1048576:.0f}MB")
+                idle = sorted((t for t in tabs if not t.in_use), key=lambda t: t.js_heap, reverse=True)
+                for tab_info in idle:
+                    if total <= self.memory_budget:
+                        break
+                    total -= tab_info.js_heap
+                    self.tab_counts[tab_info.bot_type]["evicted"] += 1
+                    tab_info.in_use = True  # 处理完成前不再分配
+                    if remaining[tab_info.bot_type] > max(1, self.min_tabs_per_bot):
+                        remaining[tab_info.bot_type] -= 1
+                        to_close.append(tab_info)
+                    else:
+                        self._drop_session(tab_info)
+                        tab_info.state = "resetting"
+                        to_reload.append(tab_info)
+        
+        for tab_info in to_close:
+            print(f"[TabPool] 关闭内存占用高的标签页: {tab_info.bot_type} ({tab_info.js_heap / 1048576:.0f}MB)")
+            self.discard_tab(tab_info)
+        for tab_info in to_reload:
+            print(f"[TabPool] 重新加载内存占用高的标签页: {tab_info.bot_type} ({tab_info.js_heap / 1048576:.0f}MB)")
+            self._worker.submit(self._reload_async, tab_info)
+        return len(to_close) + len(to_reload)
+    
+    def _reload_async(self, tab_info: TabInfo):
+        """后台线程：重新加载页面（新对话），然后放回池中；失败时关闭并补充新标签页"""
+        try:
+            tab_info.tab.get(tab_info.url)
+        except Exception as e:
+            print(f"[TabPool] ❌ 重新加载标签页失败，换新标签页: {tab_info.bot_type}: {e}")
+            self.discard_tab(tab_info)
+            return
+        
+        with self.lock:
+            tab_info.state = "ready"
+            tab_info.js_heap = 0  # 下次采样更新
+            tab_info.dom_nodes = 0
+            tab_info.requests_served = 0
+            tab_info.last_used = time.time()
+            if tab_info not in self.pools.get(tab_info.bot_type, []):
+                return
+            self._make_available(tab_info)
     
     def get_stats(self) -> dict:
         """获取标签页池统计信息"""
         with self.lock:
+            now = time.time()
             stats = {}
             for bot_type, pool in self.pools.items():
-                in_use = sum(1 for t in pool if t.in_use)
+                resetting = sum(1 for t in pool if t.state == "resetting")
+                checking = sum(1 for t in pool if t.checking)
+                in_use = sum(1 for t in pool if t.in_use) - resetting - checking
+                queue = self.waiters.get(bot_type) or ()
+                wait_stats = self.wait_stats[bot_type]
                 stats[bot_type] = {
                     "total": len(pool),
                     "in_use": in_use,
-                    "available": len(pool) - in_use
+                    "available": len(pool) - in_use - resetting - checking,
+                    "ready": sum(1 for t in pool if not t.in_use and t.state == "ready"),
+                    "sessions": sum(1 for t in pool if t.session_key),
+                    "resetting": resetting,
+                    "checking": checking,
+                    "creating": self.pending.get(bot_type, 0),
+                    "queue_depth": len(queue),
+                    "oldest_wait": round(now - min(w.enqueued_at for w in queue), 2) if queue else 0.0,
+                    "waits": wait_stats["waits"],
+                    "avg_wait": round(wait_stats["total_wait"] / wait_stats["waits"], 3) if wait_stats["waits"] else 0.0,
+                    "max_wait": round(wait_stats["max_wait"], 3),
+                    "timeouts": wait_stats["timeouts"],
+                    "expired": wait_stats["expired"],
+                    "js_heap": sum(t.js_heap for t in pool),
+                    "dom_nodes": sum(t.dom_nodes for t in pool),
+                    "blocked_requests": sum(t.blocked_requests for t in pool),
+                    "loaded_bytes": sum(t.loaded_bytes for t in pool),
+                    **self.tab_counts[bot_type],
+                    "tabs": [
+                        {
+                            "browser": t.browser_id,
+                            "state": "checking" if t.checking else t.state,
+                            "in_use": t.in_use and not t.checking and t.state != "resetting",
+                            "health": t.health,
+                            "error": t.health_error,
+                            "checked_ago": round(now - t.checked_at, 1) if t.checked_at else None,
+                            "idle": round(now - t.last_used, 1) if not t.in_use else 0.0,
+                            "js_heap_mb": round(t.js_heap / 1048576, 1),
+                            "dom_nodes": t.dom_nodes,
+                            "served": t.requests_served,
+                            "blocked": t.blocked_requests,
+                            "loaded_kb": round(t.loaded_bytes / 1024, 1),
+                        }
+                        for t in pool
+                    ],
                 }
-            return stats
\ No newline at end of file
+            return stats
+    
+    def get_browser_stats(self) -> list:
+        """各浏览器的标签页分布"""
+        with self.lock:
+            stats = []
+            for browser_id, browser in enumerate(self.browsers):
+                tabs = [t for pool in self.pools.values() for t in pool if t.browser_id == browser_id]
+                by_bot = {}
+                for t in tabs:
+                    by_bot[t.bot_type] = by_bot.get(t.bot_type, 0) + 1
+                stats.append({
+                    "id": browser_id,
+                    "address": str(getattr(browser, "address", browser_id)),
+                    "tabs": len(tabs),
+                    "in_use": sum(1 for t in tabs if t.in_use and t.state != "resetting" and not t.checking),
+                    "creating": self.browser_pending[browser_id],
+                    "js_heap_mb": round(sum(t.js_heap for t in tabs) / 1048576, 1),
+                    "memory_budget_mb": round(self.memory_budget / 1048576) if self.memory_budget else None,
+                    "by_bot": by_bot,
+                })
+            return stats
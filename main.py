@@ -6,19 +6,33 @@ WebLLM API v0.5
 """
 
 import uvicorn
+import argparse
+import asyncio
+import hashlib
+import json
 import time
 import uuid
 import sys
 import threading
 from concurrent.futures import ThreadPoolExecutor
-from fastapi import FastAPI, HTTPException, Header, BackgroundTasks
-from pydantic import BaseModel, Field
-from typing import Optional, List, Literal
+from fastapi import FastAPI, HTTPException, Header, BackgroundTasks, Request, Response, UploadFile, File, Form
+from fastapi.responses import StreamingResponse, FileResponse
+from pydantic import BaseModel, Field, ValidationError
+from typing import Callable, Optional, List, Literal, Union
 from DrissionPage import ChromiumPage, ChromiumOptions
 
-from config import CHROME_PORT, CHROME_USER_DATA_DIR, DEFAULT_LMARENA_MODEL
-from adapters import KimiBot, LMArenaBot, YuanbaoBot, DeepSeekBot, BaseBot
-from core import TabPoolManager
+from config import CHROME_PORT, CHROME_PORTS, CHROME_USER_DATA_DIR, DEFAULT_LMARENA_MODEL, TAB_ACQUIRE_TIMEOUT, MIN_TABS_PER_BOT
+from config import MAX_TABS_PER_BOT, SINGLE_FLIGHT_ENABLED
+from config import TAB_MAINTENANCE_INTERVAL, TAB_HEALTH_CHECK, TAB_HEALTH_TIMEOUT, TAB_MEMORY_BUDGET_MB
+from config import TAB_MAX_REQUESTS, TAB_MAX_DOM_NODES, BLOCK_RESOURCES, BLOCKED_URLS
+from config import FOCUS_FREE, CHROME_BACKGROUND_FLAGS
+from config import ADAPTIVE_CONCURRENCY, CONCURRENCY_INITIAL, CONCURRENCY_MIN, SLOWDOWN_FACTOR
+from config import BATCH_ENABLED, BATCH_DIR, BATCH_CONCURRENCY
+from config import PRIORITY_LEVELS, DEFAULT_PRIORITY, BATCH_PRIORITY
+from config import RESPONSE_CACHE_ENABLED, RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL, RESPONSE_CACHE_DB
+from adapters import KimiBot, LMArenaBot, YuanbaoBot, DeepSeekBot, BaseBot, GenerationCancelled
+from core import TabPoolManager, ChatStream, ResponseCache, SingleFlight, Metrics, BackendRouter, create_router_app
+from core import AIMDController, AdmissionLimiter, DeadlineExceeded, BatchManager, BatchError
 
 # ============== FastAPI 初始化 ==============
 app = FastAPI(
@@ -28,9 +42,13 @@ app = FastAPI(
 )
 
 # ============== 全局变量 ==============
-browser = None
+browser = None   # 第一个浏览器（兼容旧代码）
+browsers: list = []
 tab_pool: TabPoolManager = None
-executor = ThreadPoolExecutor(max_workers=10)
+response_cache: Optional[ResponseCache] = None
+batch_manager: Optional[BatchManager] = None
+single_flight: Optional[SingleFlight] = SingleFlight() if SINGLE_FLIGHT_ENABLED else None
+metrics = Metrics()
 
 # Bot 类映射
 BOT_CLASSES = {
@@ -40,6 +58,24 @@ BOT_CLASSES = {
     "lmarena": LMArenaBot,
 }
 
+# 执行对话的线程池，每个标签页对应一个线程（DrissionPage 调用都是阻塞的）
+executor = ThreadPoolExecutor(max_workers=MAX_TABS_PER_BOT * len(BOT_CLASSES), thread_name_prefix="chat")
+
+# 每种 Bot 的并发上限：自适应时在 [CONCURRENCY_MIN, MAX_TABS_PER_BOT] 之间按执行结果调整
+concurrency = {
+    bot_type: AIMDController(
+        bot_type,
+        initial=CONCURRENCY_INITIAL if ADAPTIVE_CONCURRENCY else MAX_TABS_PER_BOT,
+        min_limit=CONCURRENCY_MIN if ADAPTIVE_CONCURRENCY else MAX_TABS_PER_BOT,
+        max_limit=MAX_TABS_PER_BOT,
+        slowdown_factor=SLOWDOWN_FACTOR
+    )
+    for bot_type in BOT_CLASSES
+}
+
+# 每种 Bot 的准入名额，与并发上限一致；排队中的请求只在事件循环里等待，不占用线程
+admission = {bot_type: AdmissionLimiter(concurrency[bot_type]) for bot_type in BOT_CLASSES}
+
 # ============== 数据模型 ==============
 
 class ChatMessage(BaseModel):
@@ -52,6 +88,8 @@ class ChatCompletionRequest(BaseModel):
     temperature: Optional[float] = Field(default=1.0, ge=0, le=2)
     max_tokens: Optional[int] = None
     stream: Optional[bool] = False
+    priority: Optional[Union[str, int]] = None             # 覆盖 X-Priority 请求头
+    request_timeout: Optional[float] = Field(default=None, gt=0)  # 覆盖 X-Request-Timeout 请求头（秒）
 
 class ChatCompletionChoice(BaseModel):
     index: int
@@ -71,6 +109,29 @@ class ChatCompletionResponse(BaseModel):
     choices: List[ChatCompletionChoice]
     usage: Usage
 
+class ChatCompletionChunkDelta(BaseModel):
+    role: Optional[Literal["assistant"]] = None
+    content: Optional[str] = None
+    reasoning_content: Optional[str] = None  # 思考过程（与 DeepSeek API 字段一致）
+
+class ChatCompletionChunkChoice(BaseModel):
+    index: int
+    delta: ChatCompletionChunkDelta
+    finish_reason: Optional[Literal["stop", "length"]] = None
+
+class ChatCompletionChunk(BaseModel):
+    id: str
+    object: Literal["chat.completion.chunk"] = "chat.completion.chunk"
+    created: int
+    model: str
+    choices: List[ChatCompletionChunkChoice]
+
+class CreateBatchRequest(BaseModel):
+    input_file_id: str
+    endpoint: str = "/v1/chat/completions"
+    completion_window: str = "24h"
+    metadata: Optional[dict] = None
+
 class ModelInfo(BaseModel):
     id: str
     object: Literal["model"] = "model"
@@ -124,35 +185,132 @@ def create_bot_instance(bot_type: str, tab) -> BaseBot:
     return bot
 
 
-def execute_chat(bot_type: str, query: str, specific_model: str = None) -> dict:
+def display_model_name(bot_type: str, specific_model: str = None) -> str:
+    """返回给客户端的模型名称"""
+    return f"{bot_type}:{specific_model}" if specific_model else bot_type
+
+
+def reset_tab(tab_info) -> bool:
+    """标签页释放后在后台开启新对话（TabPoolManager 回调）"""
+    bot = create_bot_instance(tab_info.bot_type, tab_info.tab)
+    return bot.new_chat()
+
+
+def probe_tab(tab_info) -> Optional[str]:
+    """后台巡检空闲标签页（TabPoolManager 回调），返回 None 表示健康，否则为问题描述"""
+    return create_bot_instance(tab_info.bot_type, tab_info.tab).probe()
+
+
+def conversation_key(bot_type: str, specific_model: Optional[str], messages: List[ChatMessage]) -> str:
+    """对话历史的哈希，用于把后续请求路由到保留该对话的标签页"""
+    history = [[msg.role, msg.content.strip()] for msg in messages]
+    raw = json.dumps([bot_type, specific_model, history], ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def split_followup(messages: List[ChatMessage]) -> tuple:
+    """
+    拆分多轮对话 -> (历史前缀, 新消息)
+    
+    历史前缀到最后一条 assistant 消息为止；没有 assistant 消息时前缀为空
+    """
+    for i in range(len(messages) - 1, -1, -1):
+        if messages[i].role == "assistant":
+            return messages[:i + 1], messages[i + 1:]
+    return [], list(messages)
+
+
+def execute_chat(bot_type: str, query: str, specific_model: str = None, on_progress=None,
+                 messages: Optional[List[ChatMessage]] = None, priority: int = 1,
+                 deadline: Optional[float] = None, cancel_event: Optional[threading.Event] = None) -> dict:
     """
     在独立标签页中执行对话
     
     这是核心函数：从标签页池获取标签页，创建 Bot，执行对话
+    
+    Args:
+        on_progress: 可选的流式回调 on_progress(thought, answer)，生成过程中推送累计文本
+        messages: 原始消息列表；提供时启用多轮对话亲和——历史与某个标签页中保留的对话一致时，
+                  路由到该标签页并只发送新消息
+        priority: 排队优先级，数值小的先分配标签页
+        deadline: 截止时间（time.time()）：已过期的请求不再占用标签页，等待回答不超过该时间
+        cancel_event: 设置后（客户端已断开）不再占用标签页；生成中则点击停止生成，立即归还标签页
+    
+    Returns:
+        {"model", "thought", "answer", "query", "finish_reason"}；等满 MAX_WAIT_TIME 仍未生成完时
+        停止生成并返回已生成的部分，finish_reason 为 "length"
+    
+    Raises:
+        DeadlineExceeded: 获取标签页前或等待回答期间已过截止时间
+        GenerationCancelled: 请求已取消
     """
     global tab_pool
     
     request_id = uuid.uuid4().hex[:8]
     print(f"[{request_id}] 开始处理: {bot_type}, 查询: {query[:30]}...")
+    started = time.time()
+    
+    # 多轮对话：按历史前缀查找保留该对话的标签页
+    session_key, followup_query = None, ""
+    if messages:
+        prefix, new_messages = split_followup(messages)
+        followup_query = build_query(new_messages)
+        if prefix and followup_query.strip():
+            session_key = conversation_key(bot_type, specific_model, prefix)
+    
+    if cancel_event is not None and cancel_event.is_set():
+        metrics.cancellations.labels(bot_type, "queued").inc()
+        raise GenerationCancelled("请求已取消")
     
     # 从池中获取标签页
-    with tab_pool.get_tab(bot_type) as tab_info:
+    with tab_pool.get_tab(bot_type, session_key=session_key, priority=priority, deadline=deadline) as tab_info:
+        acquire_time = time.time() - started
+        if cancel_event is not None and cancel_event.is_set():
+            print(f"[{request_id}] ⏹ 等待标签页期间已取消")
+            metrics.cancellations.labels(bot_type, "queued").inc()
+            raise GenerationCancelled("请求已取消")
         try:
+            resumed = session_key is not None and tab_info.session_key == session_key
+            
             # 创建 Bot 实例
             bot = create_bot_instance(bot_type, tab_info.tab)
+            bot.on_progress = on_progress
+            bot.deadline = deadline
+            bot.cancel_event = cancel_event
             
-            # 激活并开新对话
-            bot.activate()
-            bot.new_chat()
+            # 激活；续接对话或标签页已在后台重置好时不再开新对话
+            with bot.timed("activate"):
+                bot.activate()
+            if resumed:
+                print(f"[{request_id}] 🔗 续接已有对话，仅发送新消息")
+                query_to_send = followup_query
+                if bot_type == "lmarena":
+                    bot.current_model = specific_model or bot.model_name  # 对话中不重新选择模型
+            else:
+                query_to_send = query
+                if tab_info.state != "ready":
+                    with bot.timed("new_chat"):
+                        bot.new_chat()
             
             # 执行对话
+            bot.check_cancelled()
             if bot_type == "kimi":
-                answer = bot.ask(query)
+                answer = bot.ask(query_to_send)
                 result = {"thought": "", "answer": answer}
             elif bot_type == "lmarena":
-                result = bot.ask(query, model_name=specific_model)
+                result = bot.ask(query_to_send, model_name=specific_model)
             else:
-                result = bot.ask(query)
+                result = bot.ask(query_to_send)
+            
+            if bot.timed_out and deadline is not None and time.time() >= deadline:
+                # 调用方的截止时间到了，不是站点变慢，不影响并发上限；先停止生成，归还后的重置不会与生成并发
+                bot.stop_generation()
+                raise DeadlineExceeded(f"等待回答期间已过截止时间 ({time.time() - started:.1f}s)")
+            if bot.timed_out:
+                # 等满 MAX_WAIT_TIME 仍未结束：停止生成，返回已生成的部分（不缓存、不续接）
+                bot.stop_generation()
+                metrics.timeouts.labels(bot_type, "generation").inc()
+                concurrency[bot_type].record_failure("timeout", started)
             
             # 检查错误
             answer = result if isinstance(result, str) else result.get("answer", "")
@@ -160,25 +318,54 @@ def execute_chat(bot_type: str, query: str, specific_model: str = None) -> dict:
                 raise Exception(answer)
             
             print(f"[{request_id}] ✅ 完成")
+            if not bot.timed_out:
+                concurrency[bot_type].record_success(bot.timings.get("ttft"), started)
+            metrics.observe_phases(bot_type, {
+                "acquire": acquire_time,
+                **bot.timings,
+                "total": time.time() - started,
+            })
+            
+            # 记录标签页中的对话，供下一轮请求续接（回答不完整时不续接，释放后重置）
+            if bot.timed_out:
+                tab_pool.bind_session(tab_info, None)
+            elif messages:
+                history = list(messages) + [ChatMessage(role="assistant", content=answer)]
+                tab_pool.bind_session(tab_info, conversation_key(bot_type, specific_model, history))
             
             return {
-                "model": f"{bot_type}:{specific_model}" if specific_model else bot_type,
+                "model": display_model_name(bot_type, specific_model),
                 "thought": result.get("thought", "") if isinstance(result, dict) else "",
                 "answer": answer if isinstance(result, str) else result.get("answer", ""),
-                "query": query
+                "query": query,
+                "finish_reason": "length" if bot.timed_out else "stop",
             }
             
+        except DeadlineExceeded as e:
+            print(f"[{request_id}] ⏰ {e}")
+            tab_pool.bind_session(tab_info, None)
+            raise
+        except GenerationCancelled:
+            # 客户端断开，与站点状态无关，不影响并发上限
+            print(f"[{request_id}] ⏹ 已取消，归还标签页")
+            metrics.cancellations.labels(bot_type, "generation").inc()
+            tab_pool.bind_session(tab_info, None)
+            raise
         except Exception as e:
             print(f"[{request_id}] ❌ 失败: {e}")
+            concurrency[bot_type].record_failure("error", started)  # 同一请求已因超时减小过时忽略
+            tab_pool.bind_session(tab_info, None)  # 对话状态未知，释放后重置
             raise
 
 
 def build_query(messages: List[ChatMessage]) -> str:
-    """构建查询文本"""
+    """构建查询文本（无法续接对话时，历史回复也一并带上）"""
     parts = []
     for msg in messages:
         if msg.role == "system":
             parts.append(f"[系统指令] {msg.content}")
+        elif msg.role == "assistant":
+            parts.append(f"[助手回复] {msg.content}")
         elif msg.role == "user":
             parts.append(msg.content)
     return "\n".join(parts)
@@ -197,7 +384,7 @@ def build_response(result: dict) -> ChatCompletionResponse:
             ChatCompletionChoice(
                 index=0,
                 message=ChatMessage(role="assistant", content=answer),
-                finish_reason="stop"
+                finish_reason=result.get("finish_reason", "stop")
             )
         ],
         usage=Usage(
@@ -207,49 +394,434 @@ def build_response(result: dict) -> ChatCompletionResponse:
         )
     )
 
+def format_sse(chunk: BaseModel) -> str:
+    """序列化为一条 SSE 消息"""
+    return f"data: {chunk.model_dump_json(exclude_none=True)}\n\n"
+
+
+def start_chat(bot_type: str, query: str, specific_model: str = None,
+               messages: Optional[List[ChatMessage]] = None, cache_key: Optional[str] = None,
+               flight_key: Optional[str] = None,
+               on_launch: Optional[Callable[[ChatStream], None]] = None,
+               priority: int = 1, deadline: Optional[float] = None) -> ChatStream:
+    """
+    在线程池中发起对话，返回其 ChatStream
+    
+    适配器每次轮询到新内容即通过 ChatStream 推送增量；流式和非流式请求都从这里取结果
+    
+    Args:
+        cache_key: 提供时，成功生成的回答写入回答缓存
+        flight_key: 提供时，与进行中的相同请求合并，只占用一个标签页
+        on_launch: 实际发起执行时回调（合并到已有请求时不调用）
+        priority / deadline: 见 execute_chat
+    """
+    def worker(chat_stream: ChatStream):
+        try:
+            result = execute_chat(bot_type, query, specific_model, on_progress=chat_stream.push, messages=messages,
+                                  priority=priority, deadline=deadline, cancel_event=chat_stream.cancelled)
+            if cache_key and response_cache and result.get("finish_reason") != "length":
+                response_cache.set(cache_key, result)  # 超时截断的回答不缓存
+            chat_stream.finish(result)
+        except GenerationCancelled as e:
+            chat_stream.fail(e)
+        except DeadlineExceeded as e:
+            metrics.timeouts.labels(bot_type, "deadline").inc()
+            chat_stream.fail(e)
+        except TimeoutError as e:
+            metrics.timeouts.labels(bot_type, "acquire").inc()
+            chat_stream.fail(e)
+        except Exception as e:
+            metrics.errors.labels(bot_type).inc()
+            chat_stream.fail(e)
+    
+    def launch(chat_stream: ChatStream):
+        if on_launch:
+            on_launch(chat_stream)
+        executor.submit(worker, chat_stream)
+    
+    if single_flight and flight_key:
+        return single_flight.run(flight_key, launch, priority, deadline)
+    
+    chat_stream = ChatStream()
+    launch(chat_stream)
+    return chat_stream
+
+
+async def admit_chat(bot_type: str, query: str, specific_model: str = None,
+                     messages: Optional[List[ChatMessage]] = None, cache_key: Optional[str] = None,
+                     flight_key: Optional[str] = None, priority: int = 1,
+                     deadline: Optional[float] = None) -> ChatStream:
+    """
+    经过准入控制后发起对话（start_chat 的异步入口）
+    
+    每种 Bot 同时执行的请求数不超过其并发上限（自适应），其余请求在事件循环中排队，不占用任何线程；
+    进行中的相同请求（截止时间不更早、优先级不更低）直接合并，无需排队；排队按优先级，等待不超过截止时间
+    
+    返回的 ChatStream 已为调用方 attach()（与合并 / 发起之间没有 await，其他客户端此时离开不会取消该执行），
+    调用方结束等待后需 detach()
+    
+    Raises:
+        TimeoutError: 超过 TAB_ACQUIRE_TIMEOUT 仍未获得执行机会
+        DeadlineExceeded: 获得执行机会前已过截止时间
+    """
+    if single_flight and flight_key:
+        chat_stream = single_flight.join(flight_key, priority, deadline)
+        if chat_stream:
+            chat_stream.attach()
+            return chat_stream
+    
+    limiter = admission[bot_type]
+    waiting_since = time.time()
+    timeout = TAB_ACQUIRE_TIMEOUT
+    if deadline is not None:
+        timeout = min(timeout, deadline - waiting_since)
+        if timeout <= 0:
+            metrics.timeouts.labels(bot_type, "deadline").inc()
+            raise DeadlineExceeded("请求已过截止时间")
+    try:
+        await asyncio.wait_for(limiter.acquire(priority), timeout)
+    except asyncio.TimeoutError:
+        if deadline is not None and time.time() >= deadline:
+            metrics.timeouts.labels(bot_type, "deadline").inc()
+            raise DeadlineExceeded(f"等待 {bot_type} 准入期间已过截止时间 ({timeout:.1f}s)")
+        metrics.timeouts.labels(bot_type, "admission").inc()
+        raise TimeoutError(f"等待 {bot_type} 空闲标签页超时 ({TAB_ACQUIRE_TIMEOUT}s)")
+    metrics.observe_phases(bot_type, {"admission": time.time() - waiting_since})
+    
+    loop = asyncio.get_running_loop()
+    launched = []
+    
+    def release(_chat_stream: ChatStream):
+        try:
+            loop.call_soon_threadsafe(limiter.release)
+        except RuntimeError:
+            pass  # 事件循环已关闭
+    
+    def on_launch(chat_stream: ChatStream):
+        launched.append(chat_stream)
+        chat_stream.add_done_callback(release)  # 执行结束（工作线程中）归还名额
+    
+    try:
+        chat_stream = start_chat(bot_type, query, specific_model, messages, cache_key, flight_key, on_launch,
+                                 priority, deadline)
+    except BaseException:
+        if not launched:
+            limiter.release()
+        raise
+    
+    chat_stream.attach()
+    if not launched:
+        limiter.release()  # 等待期间相同请求已发起，合并到该请求
+    return chat_stream
+
+
+def stream_response(chat_stream: ChatStream, model: str, headers: Optional[dict] = None,
+                    attached: bool = False) -> StreamingResponse:
+    """
+    把 ChatStream 的增量转换为 OpenAI 格式的 chat.completion.chunk 事件，最后发送 [DONE]
+    
+    attached: 调用方已 attach()，响应结束或客户端断开时 detach()（最后一个客户端离开则取消执行）
+    """
+    chunk_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+    created = int(time.time())
+    
+    def make_chunk(finish_reason=None, **delta) -> ChatCompletionChunk:
+        return ChatCompletionChunk(
+            id=chunk_id,
+            created=created,
+            model=model,
+            choices=[
+                ChatCompletionChunkChoice(
+                    index=0,
+                    delta=ChatCompletionChunkDelta(**delta),
+                    finish_reason=finish_reason
+                )
+            ]
+        )
+    
+    async def generate():
+        try:
+            yield format_sse(make_chunk(role="assistant"))
+            
+            async for kind, payload in chat_stream:
+                if kind == "thought":
+                    yield format_sse(make_chunk(reasoning_content=payload))
+                elif kind == "answer":
+                    yield format_sse(make_chunk(content=payload))
+                elif kind == "done":
+                    yield format_sse(make_chunk(finish_reason=payload.get("finish_reason", "stop")))
+                elif kind == "error":
+                    error = {"error": {"message": str(payload), "type": "server_error"}}
+                    yield f"data: {json.dumps(error, ensure_ascii=False)}\n\n"
+            
+            yield "data: [DONE]\n\n"
+        finally:
+            if attached:
+                chat_stream.detach()  # 客户端断开时生成器被取消，同样走到这里
+    
+    return StreamingResponse(generate(), media_type="text/event-stream", headers=headers)
+
+
+class ClientDisconnected(Exception):
+    """等待期间 HTTP 客户端已断开"""
+
+
+async def wait_unless_disconnected(http_request: Request, awaitable, interval: float = 1.0,
+                                   on_abandon: Optional[Callable] = None):
+    """
+    等待 awaitable 完成，期间每 interval 秒检查一次客户端是否断开
+    
+    Args:
+        on_abandon: 检查断开期间 awaitable 恰好完成时，以其结果调用（如 detach 已登记的 ChatStream）
+    
+    Raises:
+        ClientDisconnected: 客户端已断开（awaitable 已取消）
+    """
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=interval)
+            if done:
+                return task.result()
+            if await http_request.is_disconnected():
+                if on_abandon and task.done() and not task.cancelled() and task.exception() is None:
+                    on_abandon(task.result())
+                raise ClientDisconnected()
+    finally:
+        if not task.done():
+            task.cancel()
+
+
+def pool_metrics() -> dict:
+    """标签页池统计，队列深度包含等待准入的请求，附带当前并发上限及其调整历史"""
+    stats = tab_pool.get_stats() if tab_pool else {}
+    for bot_type, limiter in admission.items():
+        bot_stats = stats.setdefault(bot_type, {})
+        bot_stats["queue_depth"] = bot_stats.get("queue_depth", 0) + limiter.waiting
+        bot_stats["limit"] = limiter.limit
+        bot_stats["concurrency"] = concurrency[bot_type].stats()
+    return stats
+
+
+metrics.track_pool(pool_metrics)
+
+
+def resolve_schedule(request: ChatCompletionRequest, x_priority: Optional[str] = None,
+                     x_request_timeout: Optional[str] = None, default_priority: str = DEFAULT_PRIORITY) -> tuple:
+    """
+    解析请求的优先级和截止时间 -> (priority, deadline)
+    
+    请求字段 priority / request_timeout 优先，其次是 X-Priority / X-Request-Timeout 请求头
+    
+    Raises:
+        HTTPException(400): 优先级或超时格式错误
+    """
+    value = request.priority if request.priority is not None else (x_priority or default_priority)
+    if isinstance(value, int):
+        priority = value
+    elif str(value).strip().lstrip("-").isdigit():
+        priority = int(str(value).strip())
+    elif str(value).strip().lower() in PRIORITY_LEVELS:
+        priority = PRIORITY_LEVELS[str(value).strip().lower()]
+    else:
+        raise HTTPException(status_code=400, detail=f"不支持的优先级: {value}（可选 {', '.join(PRIORITY_LEVELS)} 或整数）")
+    
+    timeout = request.request_timeout
+    if timeout is None and x_request_timeout:
+        try:
+            timeout = float(x_request_timeout)
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"X-Request-Timeout 应为秒数: {x_request_timeout}")
+        if timeout <= 0:
+            raise HTTPException(status_code=400, detail="X-Request-Timeout 应大于 0")
+    deadline = time.time() + timeout if timeout else None
+    return priority, deadline
+
+
+def prepare_chat(request: ChatCompletionRequest) -> tuple:
+    """
+    校验请求并解析路由 -> (query, bot_type, specific_model, request_key)
+    
+    request_key 用于回答缓存和相同请求合并
+    
+    Raises:
+        HTTPException(400): 消息为空或模型不支持
+    """
+    query = build_query(request.messages)
+    if not query.strip():
+        raise HTTPException(status_code=400, detail="消息内容不能为空")
+    
+    bot_type, specific_model = parse_model_name(request.model)
+    if bot_type not in BOT_CLASSES:
+        raise HTTPException(status_code=400, detail=f"不支持的模型: {request.model}")
+    
+    request_key = ResponseCache.make_key(
+        request.model,
+        [(msg.role, msg.content) for msg in request.messages],
+        request.temperature
+    )
+    return query, bot_type, specific_model, request_key
+
+
+def lookup_cache(request_key: str, cache_control: Optional[str] = None) -> tuple:
+    """按 Cache-Control 查询回答缓存 -> (写缓存用的 cache_key 或 None, 命中的回答或 None)"""
+    read_cache, write_cache = parse_cache_control(cache_control)
+    cache_key = request_key if response_cache and write_cache else None
+    cached = response_cache.get(cache_key) if cache_key and read_cache else None
+    return cache_key, cached
+
+
+def error_body(message: str, error_type: str = "server_error") -> dict:
+    """OpenAI 格式的错误响应体"""
+    return {"error": {"message": message, "type": error_type}}
+
+
+async def run_batch_request(body: dict) -> tuple:
+    """
+    执行批处理中的一条对话请求 -> (status_code, 响应体)（BatchManager 回调）
+    
+    与 /v1/chat/completions 的非流式路径一致：回答缓存、准入排队、相同请求合并；默认使用 BATCH_PRIORITY
+    """
+    try:
+        request = ChatCompletionRequest(**{**body, "stream": False})
+        query, bot_type, specific_model, request_key = prepare_chat(request)
+        priority, deadline = resolve_schedule(request, default_priority=BATCH_PRIORITY)
+    except ValidationError as e:
+        return 400, error_body(str(e), "invalid_request_error")
+    except HTTPException as e:
+        return e.status_code, error_body(str(e.detail), "invalid_request_error")
+    
+    cache_key, cached = lookup_cache(request_key)
+    if cached:
+        return 200, build_response(cached).model_dump()
+    
+    try:
+        chat_stream = await admit_chat(bot_type, query, specific_model, request.messages, cache_key, request_key,
+                                       priority, deadline)
+        try:
+            result = await chat_stream.wait()
+        finally:
+            chat_stream.detach()
+        return 200, build_response(result).model_dump()
+    except DeadlineExceeded as e:
+        return 504, error_body(str(e))
+    except TimeoutError as e:
+        return 503, error_body(str(e))
+    except Exception as e:
+        return 500, error_body(str(e))
+
+
+def parse_cache_control(cache_control: Optional[str]) -> tuple:
+    """
+    解析请求的 Cache-Control 头 -> (是否读缓存, 是否写缓存)
+    
+    - no-cache: 跳过缓存重新生成，并用新回答刷新缓存
+    - no-store: 完全绕过缓存
+    """
+    directives = {d.strip().lower() for d in (cache_control or "").split(",")}
+    if "no-store" in directives:
+        return False, False
+    if "no-cache" in directives:
+        return False, True
+    return True, True
+
 # ============== 启动事件 ==============
 
 @app.on_event("startup")
 def startup_event():
     """启动时初始化浏览器和标签页池"""
-    global browser, tab_pool
+    global browser, browsers, tab_pool, response_cache
     
     print("=" * 50)
     print("🚀 Pantheon API v0.4.0 (多标签页并行版)")
     print("=" * 50)
     
+    port = CHROME_PORT
     try:
-        co = ChromiumOptions()
-        co.set_local_port(CHROME_PORT)
-        co.set_argument('--no-sandbox')
-        
-        print(f"🔌 连接 Chrome (端口 {CHROME_PORT})...")
-        browser = ChromiumPage(addr_or_opts=co)
-        print("✅ 浏览器连接成功")
+        # 每个端口一个浏览器实例，标签页分散到各浏览器
+        for port in CHROME_PORTS or [CHROME_PORT]:
+            co = ChromiumOptions()
+            co.set_local_port(port)
+            co.set_argument('--no-sandbox')
+            if FOCUS_FREE:
+                # 由本程序启动 Chrome 时生效：后台标签页的定时器和渲染不限速
+                for flag in CHROME_BACKGROUND_FLAGS:
+                    co.set_argument(flag)
+            
+            print(f"🔌 连接 Chrome (端口 {port})...")
+            browsers.append(ChromiumPage(addr_or_opts=co))
+        browser = browsers[0]
+        print(f"✅ 浏览器连接成功 ({len(browsers)} 个)")
         
         # 初始化标签页池
         tab_pool = TabPoolManager(
-            browser=browser,
-            max_tabs_per_bot=3,  # 每种 Bot 最多 3 个并行标签页
-            tab_timeout=300      # 闲置 5 分钟后清理
+            browser=browsers,
+            max_tabs_per_bot=MAX_TABS_PER_BOT,  # 每种 Bot 最多并行标签页数
+            tab_timeout=300,     # 闲置 5 分钟后清理
+            acquire_timeout=TAB_ACQUIRE_TIMEOUT,
+            min_tabs_per_bot=MIN_TABS_PER_BOT,
+            reset_callback=reset_tab,  # 释放后在后台开新对话
+            health_callback=probe_tab if TAB_HEALTH_CHECK else None,  # 后台巡检，回收异常标签页
+            maintenance_interval=TAB_MAINTENANCE_INTERVAL,
+            health_timeout=TAB_HEALTH_TIMEOUT,
+            memory_budget_mb=TAB_MEMORY_BUDGET_MB,  # 超出时关闭 / 重新加载最重的空闲标签页
+            max_requests_per_tab=TAB_MAX_REQUESTS,  # 老化的标签页空闲时重新加载
+            max_dom_nodes=TAB_MAX_DOM_NODES,
+            blocked_urls=BLOCKED_URLS if BLOCK_RESOURCES else None,  # 不加载图片、字体、统计脚本
+            focus_free=FOCUS_FREE  # 并行标签页不抢焦点
         )
         
+        # 后台预热，首个请求无需等待打开页面
+        tab_pool.warm_up(list(BOT_CLASSES))
+        tab_pool.start_maintenance()
+        
+        # 回答缓存
+        if RESPONSE_CACHE_ENABLED:
+            response_cache = ResponseCache(
+                max_entries=RESPONSE_CACHE_SIZE,
+                ttl=RESPONSE_CACHE_TTL,
+                db_path=RESPONSE_CACHE_DB
+            )
+        
         print("\n" + "=" * 50)
-        print("📌 支持并行请求，每种模型最多 3 个并发")
+        print(f"📌 支持并行请求，每种模型最多 {MAX_TABS_PER_BOT} 个并发" + ("（自适应）" if ADAPTIVE_CONCURRENCY else ""))
         print("📌 模型: kimi, deepseek, yuanbao, lmarena:<model>")
         print("📌 API: http://127.0.0.1:8000/docs")
         print("=" * 50 + "\n")
         
     except Exception as e:
         print(f"\n❌ 启动失败: {e}")
-        print(f'请先启动 Chrome: chrome --remote-debugging-port={CHROME_PORT}')
+        flags = " " + " ".join(CHROME_BACKGROUND_FLAGS) if FOCUS_FREE else ""
+        print(f'请先启动 Chrome: chrome --remote-debugging-port={port}{flags}')
         sys.exit(1)
 
 
+@app.on_event("startup")
+async def start_batches():
+    """批处理：加载任务并继续执行未完成的任务（需在事件循环中启动）"""
+    global batch_manager
+    if BATCH_ENABLED:
+        batch_manager = BatchManager(
+            BATCH_DIR,
+            execute=run_batch_request,
+            concurrency=BATCH_CONCURRENCY or MAX_TABS_PER_BOT * len(BOT_CLASSES)
+        )
+        await batch_manager.resume()
+
+
+@app.on_event("shutdown")
+async def stop_batches():
+    """停止批处理任务，进度已落盘，重启后继续"""
+    if batch_manager:
+        await batch_manager.close()
+
+
 @app.on_event("shutdown")
 def shutdown_event():
     """关闭时清理资源"""
     global executor
+    if tab_pool:
+        tab_pool.stop_maintenance()
     executor.shutdown(wait=False)
     print("👋 服务已关闭")
 
@@ -264,6 +836,15 @@ def root():
         "version": "0.4.0",
         "parallel": True,
         "tab_stats": stats,
+        "browsers": tab_pool.get_browser_stats() if tab_pool else [],
+        "selector_cache": {name: cls.selector_cache.stats() for name, cls in BOT_CLASSES.items()},
+        "response_cache": response_cache.stats() if response_cache else None,
+        "single_flight": single_flight.stats() if single_flight else None,
+        "admission": {
+            bot_type: {"limit": limiter.limit, "active": limiter.active, "available": limiter.available,
+                       "waiting": limiter.waiting}
+            for bot_type, limiter in admission.items()
+        },
         "models": ["kimi", "deepseek", "yuanbao", "lmarena"],
         "docs": "/docs"
     }
@@ -275,10 +856,18 @@ def health():
     return {
         "status": "healthy",
         "browser": browser is not None,
+        "browsers": len(browsers),
         "tab_pool": tab_pool is not None
     }
 
 
+@app.get("/metrics")
+def prometheus_metrics():
+    """Prometheus 指标"""
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
+
 @app.get("/v1/models", response_model=ModelListResponse)
 def list_models():
     """获取可用模型"""
@@ -295,52 +884,154 @@ def list_models():
 
 @app.get("/v1/pool/stats")
 def pool_stats():
-    """获取标签页池状态"""
+    """获取标签页池状态（queue_depth 包含等待准入的请求，路由模式据此估计等待）"""
     if not tab_pool:
         return {"error": "标签页池未初始化"}
-    return tab_pool.get_stats()
+    return {**pool_metrics(), "browsers": tab_pool.get_browser_stats()}
 
 
 @app.post("/v1/chat/completions", response_model=ChatCompletionResponse)
-def chat_completions(
+async def chat_completions(
     request: ChatCompletionRequest,
-    authorization: Optional[str] = Header(None)
+    response: Response,
+    http_request: Request,
+    authorization: Optional[str] = Header(None),
+    cache_control: Optional[str] = Header(None),
+    x_priority: Optional[str] = Header(None),
+    x_request_timeout: Optional[str] = Header(None)
 ):
     """
     OpenAI 兼容对话接口（支持并行）
     
     每个请求使用独立标签页，支持多请求并行处理
+    stream=True 时以 SSE 逐段返回生成内容
+    完全相同的请求命中回答缓存（Cache-Control: no-cache 刷新，no-store 绕过）
+    X-Priority（high / normal / low 或整数）决定排队顺序，X-Request-Timeout（秒）设置截止时间，
+    过期的请求不再占用标签页，生成中到期则停止等待并返回 504
+    客户端断开时取消请求：排队中的请求放弃名额，生成中的请求点击停止生成并立即归还标签页
     """
-    if request.stream:
-        raise HTTPException(status_code=400, detail="暂不支持流式输出")
-    
-    # 构建查询
-    query = build_query(request.messages)
-    if not query.strip():
-        raise HTTPException(status_code=400, detail="消息内容不能为空")
-    
-    # 解析模型并路由
-    bot_type, specific_model = parse_model_name(request.model)
-    
-    if bot_type not in BOT_CLASSES:
-        raise HTTPException(status_code=400, detail=f"不支持的模型: {request.model}")
-    
+    query, bot_type, specific_model, request_key = prepare_chat(request)
+    priority, deadline = resolve_schedule(request, x_priority, x_request_timeout)
     print(f"[API] 收到请求: {request.model} -> {bot_type}")
     
+    # 回答缓存
+    cache_key, cached = lookup_cache(request_key, cache_control)
+    if cached:
+        print(f"[API] 命中回答缓存: {request.model}")
+        if request.stream:
+            replay = ChatStream()
+            replay.finish(cached)
+            return stream_response(replay, cached["model"], {"X-Cache": "HIT"})
+        response.headers["X-Cache"] = "HIT"
+        return build_response(cached)
+    
     try:
-        # 在标签页池中执行（自动分配标签页）
-        result = execute_chat(bot_type, query, specific_model)
+        # 等待准入后在标签页池中执行（自动分配标签页，相同请求合并执行）
+        try:
+            chat_stream = await wait_unless_disconnected(http_request, admit_chat(
+                bot_type, query, specific_model, request.messages, cache_key, request_key, priority, deadline),
+                on_abandon=ChatStream.detach)
+        except ClientDisconnected:
+            print(f"[API] 客户端在排队期间断开: {request.model}")
+            metrics.cancellations.labels(bot_type, "admission").inc()
+            return Response(status_code=499)
+        
+        if request.stream:
+            headers = {"X-Cache": "MISS" if cache_key else "BYPASS"}
+            return stream_response(chat_stream, display_model_name(bot_type, specific_model), headers,
+                                   attached=True)
+        
+        try:
+            result = await wait_unless_disconnected(http_request, chat_stream.wait())
+        except ClientDisconnected:
+            print(f"[API] 客户端在生成期间断开: {request.model}")
+            return Response(status_code=499)
+        finally:
+            chat_stream.detach()
+        response.headers["X-Cache"] = "MISS" if cache_key else "BYPASS"
         return build_response(result)
         
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except TimeoutError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def get_batch_manager() -> BatchManager:
+    if not batch_manager:
+        raise HTTPException(status_code=404, detail="批处理未启用")
+    return batch_manager
+
+
+def batch_call(func, *args, **kwargs):
+    """调用 BatchManager，BatchError 转换为对应的 HTTP 错误"""
+    try:
+        return func(*args, **kwargs)
+    except BatchError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+
+@app.post("/v1/files")
+async def upload_file(file: UploadFile = File(...), purpose: str = Form(...)):
+    """上传批处理输入文件（JSONL，每行一个请求）"""
+    content = await file.read()
+    return batch_call(get_batch_manager().create_file, file.filename or "upload.jsonl", content, purpose)
+
+
+@app.get("/v1/files/{file_id}")
+def retrieve_file(file_id: str):
+    """获取文件信息"""
+    return batch_call(get_batch_manager().get_file, file_id)
+
+
+@app.get("/v1/files/{file_id}/content")
+def file_content(file_id: str):
+    """下载文件内容（批处理输出 / 错误文件）"""
+    manager = get_batch_manager()
+    batch_call(manager.get_file, file_id)
+    return FileResponse(manager.file_path(file_id), media_type="application/jsonl")
+
+
+@app.post("/v1/batches")
+async def create_batch(request: CreateBatchRequest):
+    """
+    创建批处理任务
+    
+    后台按各模型的并发上限执行，每完成一条请求即写入输出文件；服务重启后从断点继续
+    """
+    manager = get_batch_manager()
+    batch = batch_call(manager.create_batch, request.input_file_id, request.endpoint,
+                       request.completion_window, request.metadata)
+    return manager.public(batch)
+
+
+@app.get("/v1/batches")
+def list_batches(limit: int = 20, after: Optional[str] = None):
+    """列出批处理任务（新的在前）"""
+    return get_batch_manager().list_batches(limit, after)
+
+
+@app.get("/v1/batches/{batch_id}")
+def retrieve_batch(batch_id: str):
+    """获取批处理任务状态"""
+    manager = get_batch_manager()
+    return manager.public(batch_call(manager.get_batch, batch_id))
+
+
+@app.post("/v1/batches/{batch_id}/cancel")
+def cancel_batch(batch_id: str):
+    """取消批处理任务（进行中的请求完成后结束）"""
+    manager = get_batch_manager()
+    return manager.public(batch_call(manager.cancel_batch, batch_id))
+
+
 @app.post("/v1/pool/cleanup")
 def cleanup_pool(background_tasks: BackgroundTasks):
-    """手动清理闲置标签页"""
+    """手动执行一次后台维护（清理闲置标签页、健康巡检、内存预算）"""
     if tab_pool:
-        background_tasks.add_task(tab_pool.cleanup_idle_tabs)
+        background_tasks.add_task(tab_pool.run_maintenance)
         return {"message": "清理任务已提交"}
     return {"error": "标签页池未初始化"}
 
@@ -348,9 +1039,34 @@ def cleanup_pool(background_tasks: BackgroundTasks):
 # ============== 主入口 ==============
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="WebLLM API")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--chrome-port", type=int, action="append",
+                        help="Chrome 调试端口，可重复指定（默认使用 config.CHROME_PORTS）")
+    parser.add_argument("--router", action="store_true", help="路由模式：不连接浏览器，把请求分发到 --backends")
+    parser.add_argument("--backends", default="", help="路由模式的后端地址，逗号分隔，如 http://127.0.0.1:8001,http://127.0.0.1:8002")
+    args = parser.parse_args()
+    
+    if args.router:
+        backends = [url.strip() for url in args.backends.split(",") if url.strip()]
+        if not backends:
+            parser.error("路由模式需要 --backends")
+        print("\n📌 WebLLM API 路由模式")
+        print("=" * 50)
+        print(f"后端: {', '.join(backends)}")
+        print("=" * 50 + "\n")
+        router = BackendRouter(backends)
+        uvicorn.run(create_router_app(router, lambda model: parse_model_name(model)[0]),
+                    host=args.host, port=args.port)
+        sys.exit(0)
+    
+    if args.chrome_port:
+        CHROME_PORTS = args.chrome_port
+    
     print("\n📌 Pantheon API v0.4.0 - 多标签页并行版")
     print("=" * 50)
     print("特性: 每个请求使用独立标签页，支持并行处理")
     print("=" * 50 + "\n")
     
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    uvicorn.run(app, host=args.host, port=args.port)
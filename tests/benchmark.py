@@ -0,0 +1,160 @@
+"""
+离线基准测试（模拟浏览器，结果可复现）
+
+    python tests/benchmark.py wait --bot deepseek --requests 10
+    python tests/benchmark.py pool --tabs 3 --requests 200 --concurrency 20
+    python tests/benchmark.py chat --bot kimi --tabs 3 --requests 30 --concurrency 6
+
+- wait: 单个适配器顺序提问，测量首字延迟和完成判定延迟（页面生成结束到 ask() 返回）
+- pool: TabPoolManager 获取 / 释放吞吐和排队等待
+- chat: execute_chat 端到端吞吐和延迟
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from simulator import FakeBrowser, SiteTiming
+from adapters import KimiBot, DeepSeekBot, YuanbaoBot, LMArenaBot
+from core import TabPoolManager
+
+BOTS = {
+    "kimi": (KimiBot, "https://www.kimi.com/"),
+    "deepseek": (DeepSeekBot, "https://chat.deepseek.com/"),
+    "yuanbao": (YuanbaoBot, "https://yuanbao.tencent.com/chat"),
+    "lmarena": (LMArenaBot, "https://lmarena.ai/"),
+}
+
+
+def emit(line: str = ""):
+    """输出报告（不受日志屏蔽影响）"""
+    sys.__stdout__.write(line + "\n")
+    sys.__stdout__.flush()
+
+
+def summarize(name: str, values: list, unit: str = "s"):
+    if not values:
+        emit(f"  {name:12s} -")
+        return
+    values = sorted(values)
+    p95 = values[min(len(values) - 1, int(len(values) * 0.95))]
+    emit(f"  {name:12s} mean {statistics.mean(values):7.3f}{unit}  p50 {statistics.median(values):7.3f}{unit}"
+          f"  p95 {p95:7.3f}{unit}  max {values[-1]:7.3f}{unit}")
+
+
+def bench_wait(args, timing: SiteTiming):
+    """适配器等待循环：首字延迟、完成判定延迟"""
+    browser = FakeBrowser(timing)
+    bot_class, url = BOTS[args.bot]
+    bot = bot_class(tab=browser.new_tab(url))
+    bot.activate()
+
+    ttft, lag, total = [], [], []
+    for i in range(args.requests):
+        bot.timings = {}
+        start = time.time()
+        bot.ask(f"question {i}")
+        returned = time.time()
+        generation = bot.tab.site.current
+        total.append(returned - start)
+        lag.append(returned - generation.finished_at)
+        if "ttft" in bot.timings:
+            ttft.append(bot.timings["ttft"] - (generation.first_token_at - generation.sent_at))
+
+    emit(f"[wait] {args.bot}: {args.requests} 次提问，js 调用 {bot.tab.js_calls} 次")
+    summarize("ask", total)
+    summarize("ttft 滞后", ttft)
+    summarize("完成滞后", lag)
+
+
+def bench_pool(args, timing: SiteTiming):
+    """标签页池：获取 / 释放吞吐"""
+    pool = TabPoolManager(FakeBrowser(timing), max_tabs_per_bot=args.tabs, acquire_timeout=60)
+    pool.warm_up([args.bot])
+    waits = []
+    lock = threading.Lock()
+
+    def work(_):
+        start = time.time()
+        with pool.get_tab(args.bot):
+            waited = time.time() - start
+            time.sleep(args.hold)
+        with lock:
+            waits.append(waited)
+
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(work, range(args.requests)))
+    elapsed = time.time() - start
+
+    emit(f"[pool] {args.bot}: {args.requests} 次获取，{args.tabs} 个标签页，并发 {args.concurrency}")
+    emit(f"  吞吐 {args.requests / elapsed:.1f} 次/秒（理论上限 {args.tabs / args.hold:.1f}）")
+    summarize("获取等待", waits)
+
+
+def bench_chat(args, timing: SiteTiming):
+    """execute_chat 端到端"""
+    import main
+
+    browser = FakeBrowser(timing)
+    main.tab_pool = TabPoolManager(browser, max_tabs_per_bot=args.tabs, acquire_timeout=300,
+                                   min_tabs_per_bot=args.tabs, reset_callback=main.reset_tab)
+    main.tab_pool.warm_up([args.bot])
+    latencies = []
+    lock = threading.Lock()
+
+    def work(i):
+        start = time.time()
+        main.execute_chat(args.bot, f"question {i}")
+        with lock:
+            latencies.append(time.time() - start)
+
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(work, range(args.requests)))
+    elapsed = time.time() - start
+    main.tab_pool._worker.shutdown(wait=True)  # 等待后台重置结束
+
+    emit(f"[chat] {args.bot}: {args.requests} 次请求，{args.tabs} 个标签页，并发 {args.concurrency}")
+    emit(f"  吞吐 {args.requests / elapsed:.2f} 次/秒，总耗时 {elapsed:.1f}s")
+    summarize("延迟", latencies)
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="WebLLM 离线基准测试")
+    parser.add_argument("target", choices=["wait", "pool", "chat"])
+    parser.add_argument("--bot", default="deepseek", choices=list(BOTS))
+    parser.add_argument("--requests", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--tabs", type=int, default=3)
+    parser.add_argument("--hold", type=float, default=0.05, help="pool 模式下每次占用标签页的时间（秒）")
+    parser.add_argument("--delay", type=float, default=0.3, help="首字延迟（秒）")
+    parser.add_argument("--tps", type=float, default=50.0, help="生成速度（词/秒）")
+    parser.add_argument("--tokens", type=int, default=40, help="回答词数")
+    parser.add_argument("--thought", type=int, default=0, help="思考过程词数")
+    parser.add_argument("--verbose", action="store_true", help="保留适配器和标签页池的日志输出")
+    args = parser.parse_args()
+
+    timing = SiteTiming(first_token_delay=args.delay, tokens_per_sec=args.tps,
+                        answer_tokens=args.tokens, thought_tokens=args.thought)
+
+    # 运行期间屏蔽适配器和标签页池的日志，报告通过 emit() 输出
+    if not args.verbose:
+        sys.stdout = open(os.devnull, "w")
+    try:
+        {"wait": bench_wait, "pool": bench_pool, "chat": bench_chat}[args.target](args, timing)
+    finally:
+        if not args.verbose:
+            sys.stdout.close()
+            sys.stdout = sys.__stdout__
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,11 @@
+# tests/simulator/__init__.py
+"""
+离线聊天站点模拟器
+- fake_browser: 无需 Chrome 的 DrissionPage 替身，用于单元测试和基准测试
+- site_server: 模拟各站点 DOM 并按设定速度流式输出的本地 HTTP 服务，供真实 Chrome 使用
+"""
+
+from .fake_browser import FakeBrowser, FakeTab, FakeElement, SiteTiming, SITE_PROFILES
+from .site_server import SiteServer
+
+__all__ = ["FakeBrowser", "FakeTab", "FakeElement", "SiteTiming", "SITE_PROFILES", "SiteServer"]
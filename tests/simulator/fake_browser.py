@@ -0,0 +1,705 @@
+# tests/simulator/fake_browser.py
+"""
+离线浏览器模型
+
+实现适配器和标签页池用到的 DrissionPage 子集:
+    browser.new_tab / get_tabs / latest_tab
+    tab.ele / eles / run_js / run_cdp / get / refresh / close / actions / set.activate / wait.doc_loaded / driver.set_callback
+    element.click / clear / input / text / parent
+
+页面由 FakeSite 模拟：发送问题后按 SiteTiming 设定的首字延迟和速度逐词生成回答（可带思考过程），
+并模拟完成信号（生成中 busy，结束后 done，通过 Runtime.bindingCalled 回调推送）。
+run_js 按脚本中的标记分派（提取函数 / 完成信号观察器 / 状态查询 / 停止生成 / 健康探测），不执行真正的 JS
+故障注入: tab.crash() 之后 run_js / ele 抛出异常（渲染进程崩溃）；tab.log_out() 之后找不到输入框（掉登录、验证码）；
+tab.leak(mb) 增加 Performance.getMetrics 报告的 JS 堆（页面跳转后恢复）
+加载站点页面时按 PAGE_RESOURCES 下载子资源：Network.setBlockedURLs 拦截的不下载（触发 Network.loadingFailed），
+其余按 SiteTiming.bandwidth 计入加载耗时（触发 Network.loadingFinished）
+开启 Network 后，发送问题时同时模拟站点的补全接口：按生成进度以站点自己的流式格式（STREAM_PATHS / _StreamEncoder）
+推送 Network.responseReceived / dataReceived / loadingFinished，支持 streamResourceContent 和 getResponseBody
+"""
+
+import base64
+import json
+import re
+import fnmatch
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+@dataclass
+class SiteTiming:
+    """模拟站点的时间特性"""
+    first_token_delay: float = 0.3   # 发送后到第一个词出现（秒）
+    tokens_per_sec: float = 50.0     # 生成速度（词/秒）
+    answer_tokens: int = 40          # 默认回答的词数
+    thought_tokens: int = 0          # 默认思考过程的词数（仅支持思考的站点）
+    page_load: float = 0.0           # 打开 / 跳转 / 刷新页面耗时（秒）
+    missing_element_wait: Optional[float] = None  # 找不到元素时的等待，None 表示与真实浏览器一样等满 timeout
+    bandwidth: Optional[float] = None  # 页面子资源的下载速度（字节/秒），None 表示不计下载耗时
+
+
+# 站点页面的子资源: (URL，{origin} 替换为站点地址, 字节数)
+PAGE_RESOURCES = [
+    ("{origin}/static/app.js", 900_000),
+    ("{origin}/static/app.css", 120_000),
+    ("{origin}/static/logo.png", 60_000),
+    ("{origin}/static/avatar.webp?v=2", 40_000),
+    ("{origin}/static/font.woff2", 180_000),
+    ("https://www.googletagmanager.com/gtag/js?id=G-TEST", 150_000),
+]
+
+
+# 各站点可被找到的元素: {选择器: 角色}，与适配器的首选选择器一致
+SITE_PROFILES = {
+    "kimi": {
+        "selectors": {
+            'tag:div@@contenteditable=true': "input",
+            'css:div[class*="new-chat"]': "new_chat",
+        },
+        "thinking": False,
+    },
+    "deepseek": {
+        "selectors": {
+            'css:textarea[placeholder*="DeepSeek"]': "input",
+            'tag:div@@text():新对话': "new_chat",
+        },
+        "thinking": True,
+    },
+    "yuanbao": {
+        "selectors": {
+            'css:div.ql-editor[contenteditable="true"]': "input",
+            'css:#yuanbao-send-btn': "send",
+            'css:div[class*="new-chat"]': "new_chat",
+        },
+        "thinking": True,
+    },
+    "lmarena": {
+        "selectors": {
+            'tag:textarea@@name=message': "input",
+            'css:button[aria-haspopup="dialog"]': "model_button",
+        },
+        "thinking": True,
+        "models": ["gemini-3-pro", "gpt-4o", "claude-opus-4"],
+    },
+}
+
+# 各站点补全接口的路径（与适配器的 STREAM_URLS 对应）
+STREAM_PATHS = {
+    "kimi": "/api/chat/c1/completion/stream",
+    "deepseek": "/api/v0/chat/completion",
+    "yuanbao": "/api/chat/c1",
+    "lmarena": "/nextjs-api/stream/create-evaluation",
+}
+
+_TOKEN_RE = re.compile(r"\S+\s*")
+
+
+class _StreamEncoder:
+    """把生成的词编码为站点补全接口的流式格式"""
+
+    def __init__(self, site: str):
+        self.site = site
+        self.kind = None    # 上一个词的类型 thought / answer
+        self.count = 0      # 当前 fragment 已发送的词数（DeepSeek）
+
+    def _sse(self, payload) -> str:
+        return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+    def start(self) -> str:
+        if self.site == "deepseek":
+            return self._sse({"v": {"response": {"message_id": 2, "fragments": [], "status": "WIP"}}})
+        return ""
+
+    def chunk(self, kind: str, text: str) -> str:
+        first = kind != self.kind
+        self.count = 1 if first else self.count + 1
+        self.kind = kind
+        thought = kind == "thought"
+        if self.site == "lmarena":
+            return f"a{'g' if thought else '0'}:{json.dumps(text, ensure_ascii=False)}\n"
+        if self.site == "kimi":
+            return self._sse({"event": "k1" if thought else "cmpl", "text": text})
+        if self.site == "yuanbao":
+            return self._sse({"type": "think", "content": text} if thought else {"type": "text", "msg": text})
+        # DeepSeek: 新 fragment 整体 APPEND，第二个词带上路径，之后省略路径
+        if first:
+            fragment = {"type": "THINK" if thought else "RESPONSE", "content": text}
+            return self._sse({"p": "response/fragments", "o": "APPEND", "v": [fragment]})
+        if self.count == 2:
+            return self._sse({"p": "response/fragments/-1/content", "o": "APPEND", "v": text})
+        return self._sse({"v": text})
+
+    def end(self) -> str:
+        if self.site == "lmarena":
+            return 'ad:{"finishReason":"stop"}\n'
+        if self.site == "kimi":
+            return self._sse({"event": "all_done"})
+        if self.site == "yuanbao":
+            return "data: [DONE]\n\n"
+        return self._sse({"p": "response/status", "o": "SET", "v": "FINISHED"}) + "event: close\ndata: {}\n\n"
+
+
+def default_responder(query: str, timing: SiteTiming, thinking: bool) -> Tuple[str, str]:
+    """默认回答: 回显问题，再补足到 answer_tokens 个词"""
+    answer = [f"Echo: {query.strip()} "] + [f"w{i} " for i in range(max(0, timing.answer_tokens - 1))]
+    thought = [f"t{i} " for i in range(timing.thought_tokens)] if thinking else []
+    return "".join(thought).strip(), "".join(answer).strip()
+
+
+def site_of(url: str) -> Optional[str]:
+    """由 URL 判断模拟哪个站点"""
+    for name in SITE_PROFILES:
+        if name in (url or ""):
+            return name
+    return None
+
+
+class _Generation:
+    """一次回答的生成过程（按时间推算已输出的内容）"""
+
+    def __init__(self, query: str, thought: str, answer: str, timing: SiteTiming):
+        self.query = query
+        self.thought_tokens = _TOKEN_RE.findall(thought)
+        self.answer_tokens = _TOKEN_RE.findall(answer)
+        self.sent_at = time.time()
+        self.first_token_at = self.sent_at + timing.first_token_delay
+        total = len(self.thought_tokens) + len(self.answer_tokens)
+        self.finished_at = self.first_token_at + total / max(timing.tokens_per_sec, 1e-6)
+        self.tokens_per_sec = timing.tokens_per_sec
+        self.stopped = False
+
+    def tokens(self, now: float) -> Tuple[List[str], List[str]]:
+        """已输出的 (思考过程的词, 回答的词)"""
+        if now < self.first_token_at:
+            return [], []
+        count = int((now - self.first_token_at) * self.tokens_per_sec) + 1
+        return self.thought_tokens[:count], self.answer_tokens[:max(0, count - len(self.thought_tokens))]
+
+    def snapshot(self, now: float) -> Dict[str, str]:
+        thought, answer = self.tokens(now)
+        return {"thought": "".join(thought).strip(), "answer": "".join(answer).strip()}
+
+    def done(self, now: float) -> bool:
+        return now >= self.finished_at
+
+    def stop(self, now: float):
+        """点击停止生成：保留已输出的内容"""
+        if self.done(now):
+            return
+        snapshot = self.snapshot(now)
+        self.thought_tokens = _TOKEN_RE.findall(snapshot["thought"])
+        self.answer_tokens = _TOKEN_RE.findall(snapshot["answer"])
+        self.finished_at = now
+        self.stopped = True
+
+
+class FakeSite:
+    """单个标签页中的页面状态"""
+
+    def __init__(self, name: str, timing: SiteTiming, responder: Callable = default_responder):
+        self.name = name
+        self.profile = SITE_PROFILES[name]
+        self.timing = timing
+        self.responder = responder
+
+        self.draft = ""
+        self.history: List[_Generation] = []   # 本页对话
+        self.extractors = set()                # 已安装的提取函数
+        self.signal_cfg: Optional[dict] = None # 完成信号观察器配置
+        self.signal_state: Optional[dict] = None
+        self.model = self.profile.get("models", [None])[0]
+        self.menu_open = False
+        self.logged_out = False                # 掉登录 / 验证码：输入框消失
+
+    @property
+    def current(self) -> Optional[_Generation]:
+        return self.history[-1] if self.history else None
+
+    def generating(self, now: float) -> bool:
+        return bool(self.current) and not self.current.done(now)
+
+    def send(self) -> Optional[_Generation]:
+        query, self.draft = self.draft, ""
+        if not query.strip():
+            return None
+        thought, answer = self.responder(query, self.timing, self.profile.get("thinking", False))
+        generation = _Generation(query, thought, answer, self.timing)
+        self.history.append(generation)
+        return generation
+
+    def snapshot(self, now: float) -> Dict[str, str]:
+        return self.current.snapshot(now) if self.current else {"thought": "", "answer": ""}
+
+
+class FakeElement:
+    """页面元素"""
+
+    def __init__(self, tab: "FakeTab", role: str, text: str = ""):
+        self.tab = tab
+        self.role = role
+        self.text = text
+
+    def __bool__(self):
+        return True
+
+    def click(self, by_js: bool = False):
+        self.tab._click(self)
+        return True
+
+    def clear(self):
+        if self.role == "input":
+            self.tab.site.draft = ""
+
+    def input(self, text: str):
+        if self.role == "input":
+            self.tab.site.draft += text
+
+    def parent(self):
+        return None
+
+
+class _Actions:
+    """tab.actions：只模拟回车发送和清空输入"""
+
+    def __init__(self, tab: "FakeTab"):
+        self.tab = tab
+
+    def key_down(self, key: str):
+        if key == "Enter":
+            self.tab._send()
+        return self
+
+    def key_up(self, key: str):
+        return self
+
+    def key(self, key: str):
+        if key == "Backspace":
+            self.tab.site.draft = ""
+        return self
+
+    def move_to(self, element):
+        self._target = element
+        return self
+
+    def click(self):
+        target = getattr(self, "_target", None)
+        if target:
+            target.click()
+        return self
+
+
+class _Setter:
+    def __init__(self, tab: "FakeTab"):
+        self.tab = tab
+
+    def activate(self):
+        self.tab.activations += 1
+
+
+class _Waiter:
+    def __init__(self, tab: "FakeTab"):
+        self.tab = tab
+
+    def doc_loaded(self, timeout: float = None):
+        return True
+
+
+class _Driver:
+    """tab.driver：保存 CDP 事件回调"""
+
+    def __init__(self):
+        self.callbacks: Dict[str, Callable] = {}
+
+    def set_callback(self, event: str, callback: Callable):
+        if callback is None:
+            self.callbacks.pop(event, None)
+        else:
+            self.callbacks[event] = callback
+
+
+class FakeTab:
+    """标签页"""
+
+    def __init__(self, browser: "FakeBrowser", tab_id: int, url: str):
+        self.browser = browser
+        self.tab_id = tab_id
+        self.url = ""
+        self.closed = False
+        self.crashed = False
+        self.leaked = 0               # 额外的 JS 堆（字节），跳转后清零
+        self.network_enabled = False
+        self.blocked_urls: List[str] = []   # Network.setBlockedURLs 设置的模式
+        self.loaded_bytes = 0               # 实际下载的子资源字节数
+        self.activations = 0
+        self.js_calls = 0
+        self.cdp_calls: List[str] = []
+        self.bindings = set()
+        self.streams: Dict[str, dict] = {}  # 补全请求: {requestId: {"body": 已发送的字节, "streaming": bool}}
+
+        self.actions = _Actions(self)
+        self.set = _Setter(self)
+        self.wait = _Waiter(self)
+        self.driver = _Driver()
+
+        self.site: Optional[FakeSite] = None
+        self._lock = threading.RLock()
+        self._timers: List[threading.Timer] = []
+        self.get(url)
+
+    def __repr__(self):
+        return f"<FakeTab {self.tab_id} {self.url}>"
+
+    # ---------- 导航 ----------
+
+    def get(self, url: str):
+        """跳转（清空页面状态）"""
+        url = url or ""
+        if url:
+            time.sleep(self.browser.timing.page_load)
+        with self._lock:
+            self._cancel_timers()
+            self.leaked = 0
+            self.url = url
+            name = site_of(url)
+            self.site = FakeSite(name, self.browser.timing, self.browser.responder) if name else None
+        if name:
+            self._load_resources(url)
+        return True
+
+    def _blocked(self, url: str) -> bool:
+        return any(fnmatch.fnmatchcase(url, pattern) for pattern in self.blocked_urls)
+
+    def _load_resources(self, url: str):
+        """下载页面子资源（拦截的跳过），按带宽计入加载耗时"""
+        origin = "/".join(url.split("/")[:3])
+        loaded = 0
+        for index, (template, size) in enumerate(PAGE_RESOURCES):
+            resource = template.format(origin=origin)
+            if self._blocked(resource):
+                self._emit("Network.loadingFailed", requestId=str(index), errorText="net::ERR_BLOCKED_BY_CLIENT",
+                           blockedReason="inspector")
+                continue
+            loaded += size
+            self._emit("Network.loadingFinished", requestId=str(index), encodedDataLength=size)
+        self.loaded_bytes += loaded
+        if self.browser.timing.bandwidth:
+            time.sleep(loaded / self.browser.timing.bandwidth)
+
+    def _emit(self, event: str, **params):
+        callback = self.driver.callbacks.get(event)
+        if self.network_enabled and callback:
+            callback(**params)
+
+    def refresh(self):
+        self.get(self.url)
+
+    def crash(self):
+        """模拟渲染进程崩溃"""
+        self.crashed = True
+
+    def leak(self, mb: float):
+        """模拟长对话累积的 JS 堆"""
+        self.leaked += int(mb * 1024 * 1024)
+
+    def log_out(self):
+        """模拟登录过期 / 验证码页面"""
+        with self._lock:
+            if self.site:
+                self.site.logged_out = True
+
+    def close(self):
+        with self._lock:
+            self._cancel_timers()
+            self.closed = True
+        self.browser._closed(self)
+
+    # ---------- 元素 ----------
+
+    def _lookup(self, selector: str) -> Optional[FakeElement]:
+        site = self.site
+        if not site:
+            return None
+        role = site.profile["selectors"].get(selector)
+        if role == "input" and site.logged_out:
+            return None
+        if role:
+            return FakeElement(self, role)
+        # LMArena 模型菜单中的选项
+        if site.menu_open and selector.startswith("tag:span@@text()="):
+            model = selector.split("=", 1)[1]
+            if model in site.profile.get("models", []):
+                return FakeElement(self, "model_option", model)
+        return None
+
+    def ele(self, selector: str, timeout: float = None):
+        if self.crashed:
+            raise RuntimeError("页面已崩溃")
+        element = self._lookup(selector)
+        if element is None:
+            wait = timeout or 0
+            if self.browser.timing.missing_element_wait is not None:
+                wait = min(wait, self.browser.timing.missing_element_wait)
+            time.sleep(wait)
+        return element
+
+    def eles(self, selector: str, timeout: float = None) -> List[FakeElement]:
+        site = self.site
+        if site and site.menu_open and selector == "css:span.truncate":
+            return [FakeElement(self, "model_option", m) for m in site.profile.get("models", [])]
+        element = self._lookup(selector)
+        return [element] if element else []
+
+    def _click(self, element: FakeElement):
+        site = self.site
+        if not site:
+            return
+        if element.role == "send":
+            self._send()
+        elif element.role == "new_chat":
+            self.get(self.url)
+        elif element.role == "model_button":
+            site.menu_open = True
+        elif element.role == "model_option":
+            site.model = element.text
+            site.menu_open = False
+
+    # ---------- 生成与完成信号 ----------
+
+    def _send(self):
+        with self._lock:
+            site = self.site
+            generation = site.send() if site else None
+            if not generation:
+                return
+            self.browser.sent.append((self.tab_id, generation.query))
+            if self.network_enabled and "Network.responseReceived" in self.driver.callbacks:
+                request_id = f"chat-{self.tab_id}-{len(site.history)}"
+                url = "/".join(self.url.split("/")[:3]) + STREAM_PATHS[site.name]
+                threading.Thread(target=self._stream, args=(site, generation, request_id, url), daemon=True).start()
+            if site.signal_cfg:
+                debounce = site.signal_cfg.get("debounce", 100) / 1000
+                self._schedule(debounce, self._report_signal)
+                self._schedule(generation.finished_at - time.time() + debounce, self._report_signal)
+
+    def _stream(self, site: FakeSite, generation: _Generation, request_id: str, url: str):
+        """按生成进度推送补全接口的响应（在独立线程中，与真实浏览器的事件线程一样异步回调）"""
+        encoder = _StreamEncoder(site.name)
+        self.streams[request_id] = {"body": b"", "streaming": False}
+        self._emit("Network.responseReceived", requestId=request_id, type="Fetch",
+                   response={"url": url, "status": 200, "mimeType": "text/event-stream"})
+        body = encoder.start()
+        sent_thought = sent_answer = 0
+        while True:
+            with self._lock:
+                aborted = self.site is not site or self.closed  # 页面跳转 / 关闭
+                now = time.time()
+                thought, answer = generation.tokens(now)
+                done = generation.done(now)
+            if aborted:
+                self._emit("Network.loadingFailed", requestId=request_id, errorText="net::ERR_ABORTED", canceled=True)
+                return
+            body += "".join(encoder.chunk("thought", t) for t in thought[sent_thought:])
+            body += "".join(encoder.chunk("answer", t) for t in answer[sent_answer:])
+            sent_thought, sent_answer = len(thought), len(answer)
+            if done:
+                body += encoder.end()
+            if body:
+                self._stream_data(request_id, body.encode("utf-8"))
+                body = ""
+            if done:
+                self._emit("Network.loadingFinished", requestId=request_id,
+                           encodedDataLength=len(self.streams[request_id]["body"]))
+                return
+            time.sleep(0.02)
+
+    def _stream_data(self, request_id: str, raw: bytes):
+        """一批响应数据，拆成两块发送（可能断在 UTF-8 字符或行的中间）"""
+        stream = self.streams[request_id]
+        stream["body"] += raw
+        half = len(raw) // 2
+        for part in (raw[:half], raw[half:]):
+            if not part:
+                continue
+            if stream["streaming"]:
+                self._emit("Network.dataReceived", requestId=request_id, dataLength=len(part),
+                           data=base64.b64encode(part).decode("ascii"))
+            else:
+                self._emit("Network.dataReceived", requestId=request_id, dataLength=len(part))
+
+    def _schedule(self, delay: float, callback: Callable):
+        timer = threading.Timer(max(0.0, delay), callback)
+        timer.daemon = True
+        self._timers.append(timer)
+        timer.start()
+
+    def _cancel_timers(self):
+        for timer in self._timers:
+            timer.cancel()
+        self._timers = []
+
+    def _signal_state(self) -> Optional[dict]:
+        """按当前页面推算完成信号状态（与 _OBSERVER_JS 的判定一致）"""
+        site = self.site
+        if not site or not site.signal_state:
+            return None
+        state = site.signal_state
+        if state["done"]:
+            return state
+        now = time.time()
+        generation = site.current
+        if generation and generation.sent_at >= state["armed_at"]:
+            busy = not generation.done(now)
+            state["busy"] = busy
+            state["started"] = True
+            state["done"] = not busy
+        return state
+
+    def _report_signal(self):
+        with self._lock:
+            state = self._signal_state()
+            cfg = self.site.signal_cfg if self.site else None
+        if not state or not cfg:
+            return
+        callback = self.driver.callbacks.get("Runtime.bindingCalled")
+        if callback and cfg["binding"] in self.bindings:
+            payload = {k: state[k] for k in ("round", "busy", "started", "done")}
+            callback(name=cfg["binding"], payload=json.dumps(payload))
+
+    # ---------- JS / CDP ----------
+
+    def run_js(self, script: str, *args):
+        self.js_calls += 1
+        if self.crashed:
+            raise RuntimeError("页面已崩溃")
+        with self._lock:
+            site = self.site
+            if site is None:
+                return None
+
+            if "__webllmExtractors" in script:
+                key = args[0] if args else ""
+                if "function ()" in script:
+                    site.extractors.add(key)
+                elif key not in site.extractors:
+                    return None
+                return json.dumps(site.snapshot(time.time()), ensure_ascii=False)
+
+            if "__webllmObserver" in script:
+                cfg = args[0] if args else {}
+                site.signal_cfg = cfg
+                site.signal_state = {
+                    "round": cfg.get("round"), "busy": False, "started": False, "done": False,
+                    "armed_at": time.time(),
+                }
+                return True
+
+            if "__webllmStop" in script:
+                now = time.time()
+                if not site.generating(now):
+                    return None
+                site.current.stop(now)
+                self.browser.stopped.append(self.tab_id)
+                return (args[0] or [None])[0] if args else True
+
+            if "__webllmProbe" in script:
+                return json.dumps({"ready": "complete", "input": not site.logged_out, "url": self.url})
+
+            if "__webllmState" in script:
+                state = self._signal_state()
+                if not state:
+                    return None
+                return json.dumps({k: state[k] for k in ("round", "busy", "started", "done")})
+
+        return self.browser.run_js_fallback(self, script, *args)
+
+    def run_cdp(self, method: str, **kwargs):
+        self.cdp_calls.append(method)
+        if method == "Runtime.addBinding":
+            self.bindings.add(kwargs.get("name"))
+        if method == "Performance.getMetrics":
+            return {"metrics": self._performance_metrics()}
+        if method == "Network.enable":
+            self.network_enabled = True
+        if method == "Network.setBlockedURLs":
+            self.blocked_urls = list(kwargs.get("urls", []))
+        if method == "Network.streamResourceContent":
+            stream = self.streams.get(kwargs.get("requestId"))
+            if not self.browser.stream_content or stream is None:
+                raise RuntimeError(f"'{method}' wasn't found")
+            stream["streaming"] = True
+            return {"bufferedData": base64.b64encode(stream["body"]).decode("ascii")}
+        if method == "Network.getResponseBody":
+            stream = self.streams.get(kwargs.get("requestId"))
+            if stream is None:
+                raise RuntimeError("No resource with given identifier found")
+            return {"body": stream["body"].decode("utf-8"), "base64Encoded": False}
+        return self.browser.run_cdp_fallback(self, method, **kwargs)
+
+    def _performance_metrics(self) -> List[dict]:
+        """JS 堆和 DOM 节点数随对话轮数增长"""
+        with self._lock:
+            rounds = len(self.site.history) if self.site else 0
+            heap = 8 * 1024 * 1024 + rounds * 2 * 1024 * 1024 + self.leaked
+            return [
+                {"name": "Nodes", "value": 600 + rounds * 150},
+                {"name": "JSHeapUsedSize", "value": heap},
+                {"name": "JSHeapTotalSize", "value": heap * 2},
+            ]
+
+
+class FakeBrowser:
+    """
+    浏览器
+
+    Args:
+        timing: 站点时间特性（所有标签页共用）
+        responder: 生成回答的函数 responder(query, timing, thinking) -> (thought, answer)
+        new_tab_delay: 打开新标签页的额外耗时（秒）
+        stream_content: 是否支持 Network.streamResourceContent（旧版 Chrome 不支持，只能在响应结束后取回）
+    """
+
+    def __init__(self, timing: Optional[SiteTiming] = None, responder: Callable = default_responder,
+                 new_tab_delay: float = 0.0, stream_content: bool = True):
+        self.timing = timing or SiteTiming()
+        self.responder = responder
+        self.new_tab_delay = new_tab_delay
+        self.stream_content = stream_content
+        self.tabs: List[FakeTab] = []
+        self.sent: List[tuple] = []   # 所有发送过的问题: [(tab_id, query)]
+        self.stopped: List[int] = []  # 点击过停止生成的标签页
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def new_tab(self, url: str = "") -> FakeTab:
+        time.sleep(self.new_tab_delay)
+        with self._lock:
+            self._next_id += 1
+            tab_id = self._next_id
+        tab = FakeTab(self, tab_id, url)
+        with self._lock:
+            self.tabs.append(tab)
+        return tab
+
+    def get_tabs(self) -> List[FakeTab]:
+        with self._lock:
+            return list(self.tabs)
+
+    @property
+    def latest_tab(self) -> Optional[FakeTab]:
+        with self._lock:
+            return self.tabs[-1] if self.tabs else None
+
+    def _closed(self, tab: FakeTab):
+        with self._lock:
+            if tab in self.tabs:
+                self.tabs.remove(tab)
+
+    def run_js_fallback(self, tab: FakeTab, script: str, *args):
+        """未识别的脚本，子类可覆盖"""
+        return None
+
+    def run_cdp_fallback(self, tab: FakeTab, method: str, **kwargs):
+        """未识别的 CDP 命令，子类可覆盖"""
+        return {}
@@ -0,0 +1,419 @@
+# tests/simulator/site_server.py
+"""
+本地模拟站点服务
+
+提供与 Kimi / DeepSeek / 元宝 / LMArena 页面结构一致的简化页面（输入框、发送 / 新对话按钮、
+回答容器、生成中和完成后的标记元素都与适配器的选择器对应），发送问题后页面向 /api/chat
+发起请求，服务端按 SiteTiming 设定的首字延迟和速度以 SSE 逐词返回，页面边收边渲染。
+
+用于在真实 Chrome 中离线运行适配器:
+    python -m tests.simulator.site_server --port 8900 --tps 30 --delay 0.5
+然后把各适配器的 url 和 TabPoolManager.bot_urls 指向 SiteServer.url_for(bot_type)
+（路径中保留原站点域名，适配器 activate() 的 URL 检查无需修改）
+"""
+
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional
+from urllib.parse import parse_qs, urlparse
+
+from .fake_browser import SiteTiming, SITE_PROFILES, default_responder, _TOKEN_RE
+
+# 各站点页面路径（包含原域名，满足适配器 activate() 中的 URL 检查）
+SITE_PATHS = {
+    "kimi": "/www.kimi.com/",
+    "deepseek": "/chat.deepseek.com/",
+    "yuanbao": "/yuanbao.tencent.com/chat",
+    "lmarena": "/lmarena.ai/",
+}
+
+# 各站点的静态 DOM 和消息渲染函数
+# build(): 创建一条回答，返回 {root, thought, answer}；busy(on): 切换生成中标记；done(msg): 添加完成标记
+_SITE_DOM = {
+    "kimi": {
+        "body": """
+<div class="new-chat" onclick="newChat()">新对话</div>
+<div id="chat"></div>
+<div class="chat-editor" data-testid="chat-input" contenteditable="true"></div>
+<div class="send-button-container" id="send-state"></div>
+""",
+        "script": """
+const SITE_DOM = {
+    input: () => document.querySelector('div.chat-editor'),
+    build() {
+        const root = el('div', 'segment-assistant');
+        const answer = el('div', 'markdown');
+        root.appendChild(answer);
+        return {root, thought: null, answer};
+    },
+    busy(on) { document.getElementById('send-state').classList.toggle('stop', on); },
+    done(msg) { msg.root.appendChild(el('div', 'segment-assistant-actions')); },
+};
+""",
+    },
+    "deepseek": {
+        "body": """
+<div class="new-chat-button" onclick="newChat()">新对话</div>
+<div id="chat"></div>
+<textarea id="chat-input" placeholder="给 DeepSeek 发送消息"></textarea>
+""",
+        "script": """
+const SITE_DOM = {
+    input: () => document.getElementById('chat-input'),
+    build() {
+        const root = el('div', 'ds-message');
+        const think = el('div', 'ds-think-content');
+        const thought = el('div', 'ds-markdown');
+        think.appendChild(thought);
+        const body = el('div', 'ds-answer');
+        const answer = el('div', 'ds-markdown');
+        body.appendChild(answer);
+        root.append(think, body);
+        return {root, thought, answer};
+    },
+    busy(on, msg) {
+        const loading = msg && msg.root.querySelector('div.ds-loading');
+        if (on && msg && !loading) msg.root.appendChild(el('div', 'ds-loading'));
+        if (!on && loading) loading.remove();
+        const stop = document.querySelector('div[aria-label="停止"]');
+        if (on && !stop) {
+            const button = el('div', '');
+            button.setAttribute('role', 'button');
+            button.setAttribute('aria-label', '停止');
+            document.body.appendChild(button);
+        }
+        if (!on && stop) stop.remove();
+    },
+    done(msg) { msg.root.appendChild(el('div', 'ds-message-feedback-container')); },
+};
+""",
+    },
+    "yuanbao": {
+        "body": """
+<div class="new-chat" onclick="newChat()">新对话</div>
+<div id="chat"></div>
+<div class="ql-editor" contenteditable="true" data-placeholder="有问题，尽管问"></div>
+<div id="yuanbao-send-btn" class="chat-input-send-button" onclick="send()">发送</div>
+""",
+        "script": """
+const SITE_DOM = {
+    input: () => document.querySelector('div.ql-editor'),
+    build() {
+        const root = el('div', 'agent-chat__speech-text--box-left');
+        const think = el('div', 'hyc-component-reasoner__think-content');
+        const thought = el('div', 'hyc-content-md');
+        think.appendChild(thought);
+        const main = el('div', 'hyc-common-markdown');
+        const answer = el('div', 'hyc-content-md');
+        main.appendChild(answer);
+        root.append(think, main);
+        return {root, thought, answer};
+    },
+    busy(on) {
+        const stop = document.querySelector('div.stop-btn');
+        if (on && !stop) document.body.appendChild(el('div', 'stop-btn'));
+        if (!on && stop) stop.remove();
+    },
+    done(msg) { msg.root.appendChild(el('div', 'agent-chat__toolbar')); },
+};
+""",
+    },
+    "lmarena": {
+        "body": """
+<button aria-haspopup="dialog" onclick="toggleMenu()">模型</button>
+<div id="model-menu" role="dialog" hidden></div>
+<div id="chat"></div>
+<textarea name="message" placeholder="Ask anything"></textarea>
+""",
+        "script": """
+const SITE_DOM = {
+    input: () => document.querySelector('textarea[name="message"]'),
+    build() {
+        const root = el('div', 'no-scrollbar relative flex w-full flex-1 flex-col overflow-x-auto');
+        const wrap = el('div', 'not-prose mb-4');
+        const thought = el('div', 'space-y-4');
+        wrap.appendChild(thought);
+        const answer = el('div', 'prose prose-sm text-wrap break-words');
+        root.append(wrap, answer);
+        return {root, thought, answer};
+    },
+    busy(on) {
+        const stop = document.querySelector('button[aria-label="Stop"]');
+        if (on && !stop) {
+            const button = el('button', '');
+            button.setAttribute('aria-label', 'Stop');
+            document.body.appendChild(button);
+        }
+        if (!on && stop) stop.remove();
+    },
+    done(msg) {
+        const copy = el('button', '');
+        copy.setAttribute('aria-label', 'Copy');
+        msg.root.appendChild(copy);
+    },
+};
+function toggleMenu() {
+    const menu = document.getElementById('model-menu');
+    if (!menu.children.length) {
+        for (const name of SITE.models) {
+            const option = el('span', 'truncate');
+            option.textContent = name;
+            option.onclick = () => { SITE.model = name; menu.hidden = true; };
+            menu.appendChild(option);
+        }
+    }
+    menu.hidden = !menu.hidden;
+}
+""",
+    },
+}
+
+# 公共脚本：发送、读取 SSE、渲染
+_PAGE_SCRIPT = """
+function el(tag, cls) { const e = document.createElement(tag); if (cls) e.className = cls; return e; }
+
+function newChat() { document.getElementById('chat').innerHTML = ''; }
+
+// 停止生成按钮（各站点 busy() 创建的元素）
+const STOP_BUTTONS = 'div.send-button-container.stop, div.stop-btn, button[aria-label="Stop"], div[aria-label="停止"]';
+let generation = null;
+
+document.addEventListener('click', (e) => {
+    if (generation && e.target.closest(STOP_BUTTONS)) generation.abort();
+});
+
+function readInput() {
+    const box = SITE_DOM.input();
+    const text = box.tagName === 'TEXTAREA' ? box.value : box.innerText;
+    if (box.tagName === 'TEXTAREA') box.value = ''; else box.innerText = '';
+    return text.trim();
+}
+
+async function send() {
+    const query = readInput();
+    if (!query) return;
+    const user = el('div', 'user-message');
+    user.textContent = query;
+    document.getElementById('chat').appendChild(user);
+
+    const msg = SITE_DOM.build();
+    document.getElementById('chat').appendChild(msg.root);
+    SITE_DOM.busy(true, msg);
+
+    generation = new AbortController();
+    try {
+        await stream(msg, query, generation.signal);
+    } catch (e) {
+        if (e.name !== 'AbortError') throw e;
+    }
+    generation = null;
+    SITE_DOM.busy(false, msg);
+    SITE_DOM.done(msg);
+}
+
+async function stream(msg, query, signal) {
+    const response = await fetch('/api/chat' + location.search, {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify({site: SITE.name, query, model: SITE.model || null}),
+        signal,
+    });
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    for (;;) {
+        const {value, done} = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, {stream: true});
+        let cut;
+        while ((cut = buffer.indexOf('\\n\\n')) >= 0) {
+            const line = buffer.slice(0, cut).replace(/^data: /, '');
+            buffer = buffer.slice(cut + 2);
+            if (line === '[DONE]') continue;
+            const event = JSON.parse(line);
+            if (event.thought && msg.thought) msg.thought.textContent += event.thought;
+            if (event.answer) msg.answer.textContent += event.answer;
+        }
+    }
+}
+
+document.addEventListener('keydown', (e) => {
+    if (e.key === 'Enter' && !e.shiftKey && e.target === SITE_DOM.input()) {
+        e.preventDefault();
+        send();
+    }
+});
+"""
+
+_PAGE_TEMPLATE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{title}</title></head>
+<body>
+{body}
+<script>
+const SITE = {site};
+{site_script}
+{page_script}
+</script>
+</body></html>
+"""
+
+
+def render_page(name: str) -> str:
+    """生成某站点的模拟页面"""
+    dom = _SITE_DOM[name]
+    profile = SITE_PROFILES[name]
+    site = {"name": name, "models": profile.get("models", []), "model": None}
+    return _PAGE_TEMPLATE.format(
+        title=name,
+        body=dom["body"].strip(),
+        site=json.dumps(site, ensure_ascii=False),
+        site_script=dom["script"].strip(),
+        page_script=_PAGE_SCRIPT.strip(),
+    )
+
+
+def _timing_from_query(base: SiteTiming, query: dict) -> SiteTiming:
+    """URL 参数覆盖时间设定: ?delay=首字延迟&tps=速度&tokens=回答词数&thought=思考词数"""
+    def number(key, default, cast=float):
+        try:
+            return cast(query[key][0]) if key in query else default
+        except (TypeError, ValueError):
+            return default
+    return SiteTiming(
+        first_token_delay=number("delay", base.first_token_delay),
+        tokens_per_sec=number("tps", base.tokens_per_sec),
+        answer_tokens=number("tokens", base.answer_tokens, int),
+        thought_tokens=number("thought", base.thought_tokens, int),
+        page_load=base.page_load,
+        missing_element_wait=base.missing_element_wait,
+    )
+
+
+class SiteServer:
+    """
+    模拟站点 HTTP 服务（后台线程运行）
+
+    用法:
+        server = SiteServer(timing=SiteTiming(tokens_per_sec=30)).start()
+        url = server.url_for("deepseek")
+        ...
+        server.stop()
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, timing: Optional[SiteTiming] = None,
+                 responder: Callable = default_responder):
+        self.timing = timing or SiteTiming()
+        self.responder = responder
+        self.requests = 0
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def address(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def url_for(self, bot_type: str) -> str:
+        """某站点模拟页面的 URL"""
+        return self.address + SITE_PATHS[bot_type]
+
+    def start(self) -> "SiteServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="site-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def _make_handler(self):
+        server = self
+        pages = {path: name for name, path in SITE_PATHS.items()}
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                name = pages.get(urlparse(self.path).path)
+                if not name:
+                    self.send_error(404)
+                    return
+                body = render_page(name).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                url = urlparse(self.path)
+                if url.path != "/api/chat":
+                    self.send_error(404)
+                    return
+                length = int(self.headers.get("Content-Length") or 0)
+                try:
+                    payload = json.loads(self.rfile.read(length) or b"{}")
+                except ValueError:
+                    self.send_error(400)
+                    return
+
+                name = payload.get("site")
+                timing = _timing_from_query(server.timing, parse_qs(url.query))
+                thinking = SITE_PROFILES.get(name, {}).get("thinking", False)
+                thought, answer = server.responder(payload.get("query", ""), timing, thinking)
+                server.requests += 1
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                self.close_connection = True
+
+                interval = 1 / max(timing.tokens_per_sec, 1e-6)
+                try:
+                    time.sleep(timing.first_token_delay)
+                    for kind, text in (("thought", thought), ("answer", answer)):
+                        for token in _TOKEN_RE.findall(text):
+                            event = json.dumps({kind: token}, ensure_ascii=False)
+                            self.wfile.write(f"data: {event}\n\n".encode("utf-8"))
+                            self.wfile.flush()
+                            time.sleep(interval)
+                    self.wfile.write(b"data: [DONE]\n\n")
+                    self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟聊天站点")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--delay", type=float, default=0.3, help="首字延迟（秒）")
+    parser.add_argument("--tps", type=float, default=50.0, help="生成速度（词/秒）")
+    parser.add_argument("--tokens", type=int, default=40, help="回答词数")
+    parser.add_argument("--thought", type=int, default=0, help="思考过程词数")
+    args = parser.parse_args()
+
+    timing = SiteTiming(first_token_delay=args.delay, tokens_per_sec=args.tps,
+                        answer_tokens=args.tokens, thought_tokens=args.thought)
+    server = SiteServer(args.host, args.port, timing).start()
+    for name in SITE_PATHS:
+        print(f"{name:10s} {server.url_for(name)}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
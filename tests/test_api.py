@@ -96,7 +96,7 @@ def test_lmarena_specific_model(model_name: str = "claude-opus-4-5-20251101-thin
         return False
 
 def test_multi_turn_conversation():
-    """测试多轮对话（注意：当前实现每次都是新对话）"""
+    """测试多轮对话（历史与标签页中保留的对话一致时续接该对话，只发送新消息）"""
     print("\n" + "=" * 50)
     print("测试 5: 多轮对话格式")
     print("=" * 50)
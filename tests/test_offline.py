@@ -0,0 +1,1005 @@
+"""
+离线测试：使用 tests/simulator 中的模拟浏览器，无需 Chrome 和登录
+
+运行: python -m pytest tests/test_offline.py -q
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from simulator import FakeBrowser, SiteTiming
+from adapters import KimiBot, DeepSeekBot, YuanbaoBot, LMArenaBot
+from core import TabPoolManager
+
+FAST = SiteTiming(first_token_delay=0.1, tokens_per_sec=100, answer_tokens=10, thought_tokens=3)
+
+BOTS = {
+    "kimi": (KimiBot, "https://www.kimi.com/"),
+    "deepseek": (DeepSeekBot, "https://chat.deepseek.com/"),
+    "yuanbao": (YuanbaoBot, "https://yuanbao.tencent.com/chat"),
+    "lmarena": (LMArenaBot, "https://lmarena.ai/"),
+}
+
+
+def make_bot(browser, bot_type):
+    bot_class, url = BOTS[bot_type]
+    tab = browser.new_tab(url)
+    bot = bot_class(tab=tab)
+    bot.activate()
+    return bot
+
+
+def answer_of(result):
+    return result if isinstance(result, str) else result["answer"]
+
+
+@pytest.mark.parametrize("bot_type", list(BOTS))
+def test_adapter_returns_full_answer(bot_type):
+    """完整回答（和思考过程）都能取回，流式回调收到的是递增的累计文本"""
+    browser = FakeBrowser(FAST)
+    bot = make_bot(browser, bot_type)
+    progress = []
+    bot.on_progress = lambda thought, answer: progress.append(answer)
+
+    result = bot.ask("你好")
+
+    assert answer_of(result).startswith("Echo: 你好")
+    assert answer_of(result).endswith("w8")
+    if bot_type != "kimi":
+        assert result["thought"] == "t0 t1 t2"
+    assert all(answer_of(result).startswith(p) for p in progress)
+    assert {"input", "generation", "ttft"} <= set(bot.timings)
+
+
+def test_completion_signal_ends_wait_early():
+    """完成信号在生成结束后立即返回，不必等满文本稳定时间"""
+    timing = SiteTiming(first_token_delay=0.2, tokens_per_sec=50, answer_tokens=25)
+    bot = make_bot(FakeBrowser(timing), "deepseek")
+
+    bot.ask("q")
+
+    generation = timing.first_token_delay + timing.answer_tokens / timing.tokens_per_sec
+    assert bot.timings["generation"] < generation + 1.0
+
+
+def test_completion_signal_ignores_previous_round():
+    """每次提问新建的完成信号沿用标签页上的轮次，上一轮迟到的完成消息不会提前结束本轮"""
+    from adapters.completion_signal import BINDING_NAME, CompletionSignal
+
+    tab = FakeBrowser(FAST).new_tab("https://chat.deepseek.com/")
+    previous = CompletionSignal(tab, busy=["div.busy"], done=["div.done"])
+    previous.arm()
+    current = CompletionSignal(tab, busy=["div.busy"], done=["div.done"])
+    current.arm()
+
+    late = {"round": previous._round, "busy": False, "started": True, "done": True}
+    current._on_binding(name=BINDING_NAME, payload=json.dumps(late))
+    assert current._round != previous._round and not current.done
+
+    current._on_binding(name=BINDING_NAME, payload=json.dumps(dict(late, round=current._round)))
+    assert current.done
+
+
+def test_completion_signal_shares_binding_events():
+    """binding 每个标签页只注册一次，经 cdp_events 登记，不覆盖同一事件上的其他监听"""
+    from adapters.cdp_events import listen
+
+    browser = FakeBrowser(FAST)
+    bot = make_bot(browser, "deepseek")
+    other = []
+    listen(bot.tab, "Runtime.bindingCalled", lambda **params: other.append(params["name"]))
+
+    bot.ask("a")
+    bot.ask("b")
+
+    assert bot.tab.cdp_calls.count("Runtime.addBinding") == 1
+    assert other and bot.timings["generation"] < 2
+
+
+def test_polling_fallback_without_binding():
+    """Runtime binding 不可用时退回轮询页面状态"""
+    class NoBindingBrowser(FakeBrowser):
+        def run_cdp_fallback(self, tab, method, **kwargs):
+            if method == "Runtime.addBinding":
+                raise RuntimeError("binding disabled")
+            return {}
+
+    bot = make_bot(NoBindingBrowser(FAST), "kimi")
+    assert answer_of(bot.ask("q")).startswith("Echo: q")
+
+
+@pytest.fixture(scope="module")
+def chrome():
+    """无头 Chrome（未安装 DrissionPage 或 Chrome 时跳过）"""
+    drission = pytest.importorskip("DrissionPage")
+    co = drission.ChromiumOptions().headless().auto_port()
+    co.set_argument('--no-sandbox')
+    try:
+        browser = drission.ChromiumPage(addr_or_opts=co)
+    except Exception as e:
+        pytest.skip(f"Chrome 不可用: {e}")
+    yield browser
+    browser.quit()
+
+
+@pytest.fixture(scope="module")
+def site_server():
+    from simulator import SiteServer
+
+    server = SiteServer(timing=SiteTiming(first_token_delay=0.2, tokens_per_sec=40, answer_tokens=12,
+                                          thought_tokens=4)).start()
+    yield server
+    server.stop()
+
+
+# 在模拟页面中输入问题并发送（与用户在输入框中回车相同）
+_SEND_JS = """
+const box = SITE_DOM.input();
+if (box.tagName === 'TEXTAREA') box.value = arguments[0]; else box.innerText = arguments[0];
+send();
+"""
+
+
+@pytest.mark.parametrize("bot_type", list(BOTS))
+def test_injected_scripts_on_real_page(chrome, site_server, bot_type):
+    """
+    注入的脚本在真实 Chrome 的模拟站点页面上执行（模拟浏览器的 run_js 只返回预设结果）:
+    完成信号观察器、提取函数（第二轮走 latest() 的增量查找）、健康探测
+    """
+    from simulator import SITE_PROFILES
+    from simulator.fake_browser import default_responder
+
+    tab = chrome.new_tab(site_server.url_for(bot_type))
+    try:
+        bot = BOTS[bot_type][0](tab=tab)
+        assert bot.probe() is None
+
+        for query in ("first", "second"):
+            assert bot._arm_completion_signal()
+            tab.run_js(_SEND_JS, query)
+            deadline = time.time() + 10
+            while not bot._signal.wait(0.2):
+                assert time.time() < deadline, "完成信号未触发"
+
+            thought, answer = default_responder(query, site_server.timing, SITE_PROFILES[bot_type]["thinking"])
+            assert bot._run_extractor() == {"thought": thought, "answer": answer}
+
+        tab.run_js("document.querySelectorAll(arguments[0].join(',')).forEach((e) => e.remove());",
+                   bot.INPUT_SELECTORS)
+        assert "找不到输入框" in bot.probe()
+    finally:
+        tab.close()
+
+
+def test_selector_cache_hits_on_second_request():
+    browser = FakeBrowser(FAST)
+    make_bot(browser, "yuanbao").ask("a")
+    make_bot(browser, "yuanbao").ask("b")
+
+    stats = YuanbaoBot.selector_cache.stats()
+    assert stats["input"]["hits"] >= 1
+    assert stats["send"]["hits"] >= 1
+
+
+def test_tab_pool_caps_concurrency_and_serves_everyone():
+    browser = FakeBrowser(FAST, new_tab_delay=0.05)
+    pool = TabPoolManager(browser, max_tabs_per_bot=2, acquire_timeout=10)
+    in_use, peak, served = [0], [0], []
+    lock = threading.Lock()
+
+    def work(i):
+        with pool.get_tab("deepseek") as tab_info:
+            with lock:
+                in_use[0] += 1
+                peak[0] = max(peak[0], in_use[0])
+            time.sleep(0.05)
+            with lock:
+                in_use[0] -= 1
+                served.append(i)
+
+    threads = [threading.Thread(target=work, args=(i,)) for i in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert sorted(served) == list(range(6))
+    assert peak[0] <= 2
+    assert len(browser.tabs) == 2
+    assert pool.get_stats()["deepseek"]["created"] == 2
+
+
+def test_tab_pool_spreads_tabs_across_browsers():
+    browsers = [FakeBrowser(FAST), FakeBrowser(FAST)]
+    pool = TabPoolManager(browsers, max_tabs_per_bot=2, min_tabs_per_bot=2)
+    pool.warm_up(["kimi", "deepseek"])
+    pool._worker.shutdown(wait=True)
+
+    assert [len(b.tabs) for b in browsers] == [2, 2]
+    assert [s["tabs"] for s in pool.get_browser_stats()] == [2, 2]
+
+
+def test_execute_chat_resumes_conversation():
+    """多轮对话：第二轮只发送新消息"""
+    pytest.importorskip("fastapi")
+    import main
+
+    browser = FakeBrowser(FAST)
+    main.tab_pool = TabPoolManager(browser, max_tabs_per_bot=1, acquire_timeout=10)
+    try:
+        first = [main.ChatMessage(role="user", content="q1")]
+        result = main.execute_chat("deepseek", main.build_query(first), messages=first)
+
+        second = first + [
+            main.ChatMessage(role="assistant", content=result["answer"]),
+            main.ChatMessage(role="user", content="q2"),
+        ]
+        main.execute_chat("deepseek", main.build_query(second), messages=second)
+    finally:
+        main.tab_pool = None
+
+    assert [query for _, query in browser.sent] == ["q1", "q2"]
+
+
+def test_retained_conversation_leaves_a_clean_tab(monkeypatch):
+    """保留对话的标签页不重置，但池中仍有干净的标签页，无关的新请求不在关键路径上开新对话"""
+    pytest.importorskip("fastapi")
+    import main
+
+    new_chats = []
+    new_chat = DeepSeekBot.new_chat
+    monkeypatch.setattr(DeepSeekBot, "new_chat",
+                        lambda self: new_chats.append(threading.current_thread().name) or new_chat(self))
+
+    def settle():
+        deadline = time.time() + 5
+        while time.time() < deadline:
+            stats = main.tab_pool.get_stats()["deepseek"]
+            if not stats["creating"] and not stats["resetting"] and stats["ready"]:
+                return stats
+            time.sleep(0.05)
+        raise AssertionError("标签页池未就绪")
+
+    browser = FakeBrowser(FAST)
+    main.tab_pool = TabPoolManager(browser, max_tabs_per_bot=2, min_tabs_per_bot=1, acquire_timeout=10,
+                                   reset_callback=main.reset_tab)
+    main.tab_pool.warm_up(["deepseek"])
+    try:
+        settle()
+        first = [main.ChatMessage(role="user", content="q1")]
+        main.execute_chat("deepseek", main.build_query(first), messages=first)
+        assert settle()["sessions"] == 1
+
+        other = [main.ChatMessage(role="user", content="other")]
+        answer = main.execute_chat("deepseek", main.build_query(other), messages=other)["answer"]
+        assert "MainThread" not in new_chats
+
+        # 已达上限：最久未用的对话在后台重置，较新的对话仍可续接
+        stats = settle()
+        assert stats["total"] == 2 and stats["sessions"] == 1
+        followup = other + [main.ChatMessage(role="assistant", content=answer),
+                            main.ChatMessage(role="user", content="more")]
+        main.execute_chat("deepseek", main.build_query(followup), messages=followup)
+    finally:
+        main.tab_pool = None
+
+    assert [query for _, query in browser.sent] == ["q1", "other", "more"]
+    assert "MainThread" not in new_chats
+
+
+def test_router_prefers_shorter_wait_and_drains_failing_backend():
+    """路由选择预计等待最短的后端，健康检查连续失败的后端不再分配新请求"""
+    httpx = pytest.importorskip("httpx")
+    import asyncio
+    from core import BackendRouter
+
+    queued = {"http://a": 4, "http://b": 0}
+    down = set()
+
+    def handler(request):
+        backend = f"{request.url.scheme}://{request.url.host}"
+        if backend in down:
+            raise httpx.ConnectError("refused", request=request)
+        if request.url.path == "/health":
+            return httpx.Response(200, json={"status": "healthy", "tab_pool": True})
+        if request.url.path == "/v1/pool/stats":
+            stats = {"total": 2, "in_use": 2, "queue_depth": queued[backend]}
+            return httpx.Response(200, json={"deepseek": stats, "browsers": []})
+        return httpx.Response(200, json={"backend": backend})
+
+    async def scenario():
+        router = BackendRouter(["http://a", "http://b"], transport=httpx.MockTransport(handler))
+        await router.poll()
+        first = router.pick("deepseek").url
+
+        down.add("http://b")
+        await router.poll()
+        await router.poll()
+        response = await router.forward("POST", "/v1/chat/completions", "deepseek", b"{}")
+        body = b"".join([chunk async for chunk in response.body_iterator])
+        await router.close()
+        return first, router.backends[1].state, response.headers["X-Backend"], body
+
+    first, state, served_by, body = asyncio.run(scenario())
+    assert first == "http://b"
+    assert state == "down"
+    assert served_by == "http://a"
+    assert b"http://a" in body
+
+
+def test_aimd_grows_when_saturated_and_halves_on_failure():
+    from core import AIMDController
+
+    controller = AIMDController("deepseek", initial=2, min_limit=1, max_limit=4, min_samples=2)
+    for _ in range(4):
+        controller.record_success(latency=1.0)
+    assert controller.limit == 2  # 未用满上限时不增加
+
+    controller.mark_saturated()
+    controller.record_success(latency=1.0)
+    controller.record_success(latency=1.0)
+    assert controller.limit == 3
+
+    started = time.time()
+    controller.record_failure("timeout", started)
+    controller.record_failure("error", started)  # 同一批请求只减一次
+    assert controller.limit == 1
+
+    controller.record_success(latency=5.0, started_at=time.time())
+    assert [h["reason"] for h in controller.stats()["history"]] == ["initial", "increase", "timeout"]
+
+
+def test_aimd_recovers_after_lasting_latency_shift():
+    """站点整体变慢后先减小上限，基线随新的延迟抬高，之后的健康请求让上限重新增长"""
+    from core import AIMDController
+
+    controller = AIMDController("lmarena", initial=4, min_limit=1, max_limit=4)
+    for _ in range(10):
+        controller.record_success(latency=1.0)
+
+    limits = []
+    for _ in range(50):
+        controller.mark_saturated()
+        controller.record_success(latency=3.0, started_at=time.time())
+        limits.append(controller.limit)
+
+    assert min(limits) < 4  # 先因变慢减小
+    assert controller.limit == 4
+    assert controller.stats()["baseline_latency"] > 2.5
+
+
+def test_admission_serves_by_priority_and_hands_over_abandoned_slots():
+    """准入按优先级分配；排队中取消的不占名额；已分到名额后才超时放弃的，名额转交下一个"""
+    import asyncio
+    from core import AIMDController, AdmissionLimiter
+
+    async def scenario():
+        limiter = AdmissionLimiter(AIMDController("kimi", initial=1, max_limit=3))
+        await limiter.acquire()
+        order = []
+
+        async def settle():
+            for _ in range(5):
+                await asyncio.sleep(0)
+
+        async def request(name, priority):
+            await limiter.acquire(priority)
+            order.append(name)
+
+        tasks = [asyncio.create_task(request(name, p)) for name, p in (("low", 2), ("high", 0), ("normal", 1))]
+        abandoned = asyncio.create_task(request("abandoned", 0))
+        await settle()
+        assert limiter.waiting == 4
+
+        abandoned.cancel()  # 排队中取消
+        await settle()
+        assert limiter.waiting == 3
+
+        limiter.release()   # 名额分给 high
+        tasks[1].cancel()   # 如同 wait_for 在名额到手后、任务恢复前超时
+        await settle()
+        assert order == ["normal"]  # high 放弃的名额转交给 normal
+
+        limiter.release()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        return order, limiter
+
+    order, limiter = asyncio.run(scenario())
+    assert order == ["normal", "low"]
+    assert limiter.active == 1 and limiter.waiting == 0
+
+
+def test_admission_wakes_waiters_when_limit_rises():
+    """控制器在工作线程中增大上限后，排队的请求立即获得名额，不必等到有请求结束"""
+    import asyncio
+    from core import AIMDController, AdmissionLimiter
+
+    async def scenario():
+        controller = AIMDController("kimi", initial=1, max_limit=3)
+        limiter = AdmissionLimiter(controller)
+        await limiter.acquire()
+        waiter = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        assert not waiter.done()
+
+        def succeed():
+            controller.mark_saturated()
+            controller.record_success(latency=1.0)
+
+        await asyncio.get_running_loop().run_in_executor(None, succeed)
+        await asyncio.wait_for(waiter, 1)
+        return controller, limiter
+
+    controller, limiter = asyncio.run(scenario())
+    assert controller.limit == 2 and limiter.active == 2
+
+
+def test_admit_chat_gives_up_queue_position_at_deadline():
+    """admit_chat 排队到截止时间仍未获得名额时返回 DeadlineExceeded，不留下排队条目"""
+    pytest.importorskip("fastapi")
+    import asyncio
+    import main
+    from core import DeadlineExceeded
+
+    limiter = main.admission["kimi"]
+
+    async def scenario():
+        held = [await limiter.acquire() for _ in range(limiter.limit)]
+        try:
+            with pytest.raises(DeadlineExceeded):
+                await main.admit_chat("kimi", "q", deadline=time.time() + 0.2)
+            assert limiter.waiting == 0
+        finally:
+            for _ in held:
+                limiter.release()
+
+    asyncio.run(scenario())
+    assert limiter.active == 0
+
+
+def test_batch_resumes_from_checkpoint(tmp_path):
+    """批处理中途停止后，新实例只执行尚无结果的请求，写了一半的结果行被截掉"""
+    import asyncio
+    import json
+    from core import BatchManager
+
+    lines = [{"custom_id": c, "method": "POST", "url": "/v1/chat/completions",
+              "body": {"model": "deepseek", "messages": [{"role": "user", "content": c}]}} for c in "abc"]
+    content = "\n".join(json.dumps(line) for line in lines).encode()
+    executed = []
+
+    async def execute(body):
+        query = body["messages"][0]["content"]
+        executed.append(query)
+        if query == "c" and len(executed) <= 3:
+            await asyncio.Event().wait()  # 第一个实例停在最后一条
+        return 200, {"answer": query}
+
+    async def wait_for(manager, batch_id, condition):
+        while not condition(manager.get_batch(batch_id)):
+            await asyncio.sleep(0.01)
+
+    async def scenario():
+        first = BatchManager(str(tmp_path), execute, concurrency=3)
+        file = first.create_file("eval.jsonl", content, "batch")
+        batch = first.create_batch(file["id"], "/v1/chat/completions")
+        await wait_for(first, batch["id"], lambda b: b["request_counts"]["completed"] == 2)
+        await first.close()
+        # 写最后一条时进程被杀：输出文件末尾留下半行
+        with open(first.file_path(first.batches[batch["id"]]["_output_file_id"]), "a", encoding="utf-8") as f:
+            f.write('{"custom_id": "c", "resp')
+
+        second = BatchManager(str(tmp_path), execute, concurrency=3)
+        await second.resume()
+        await wait_for(second, batch["id"], lambda b: b["status"] == "completed")
+        return second.get_batch(batch["id"]), second
+
+    batch, manager = asyncio.run(scenario())
+    assert sorted(executed) == ["a", "b", "c", "c"]
+    assert batch["request_counts"] == {"total": 3, "completed": 3, "failed": 0}
+    with open(manager.file_path(batch["output_file_id"]), encoding="utf-8") as f:
+        assert sorted(json.loads(line)["custom_id"] for line in f) == ["a", "b", "c"]
+
+
+def test_tab_pool_serves_higher_priority_first_and_drops_expired():
+    from core import DeadlineExceeded
+
+    pool = TabPoolManager(FakeBrowser(FAST), max_tabs_per_bot=1, acquire_timeout=10)
+    holder = pool.acquire_tab("kimi")
+    order, errors = [], []
+
+    def wait(name, priority, deadline=None):
+        try:
+            tab_info = pool.acquire_tab("kimi", priority=priority, deadline=deadline)
+        except DeadlineExceeded:
+            errors.append(name)
+            return
+        order.append(name)
+        pool.release_tab(tab_info)
+
+    threads = [
+        threading.Thread(target=wait, args=("low", 2)),
+        threading.Thread(target=wait, args=("expiring", 0, time.time() + 0.1)),
+        threading.Thread(target=wait, args=("high", 0)),
+    ]
+    for t in threads:
+        t.start()
+        time.sleep(0.02)
+    time.sleep(0.2)
+    pool.release_tab(holder)
+    for t in threads:
+        t.join()
+
+    assert order == ["high", "low"]
+    assert errors == ["expiring"]
+    assert pool.get_stats()["kimi"]["expired"] == 1
+
+
+def test_deadline_caps_response_wait():
+    """截止时间早于回答完成时，等待循环在截止时间停止"""
+    timing = SiteTiming(first_token_delay=0.1, tokens_per_sec=10, answer_tokens=100)
+    bot = make_bot(FakeBrowser(timing), "deepseek")
+    bot.deadline = time.time() + 1.0
+
+    start = time.time()
+    bot.ask("q")
+
+    assert bot.timed_out
+    assert time.time() - start < 2.0
+
+
+def test_expired_request_stops_generation_before_release():
+    """生成中到期：点击停止生成后再归还标签页"""
+    pytest.importorskip("fastapi")
+    import main
+    from core import DeadlineExceeded
+
+    timing = SiteTiming(first_token_delay=0.1, tokens_per_sec=10, answer_tokens=100)
+    browser = FakeBrowser(timing)
+    main.tab_pool = TabPoolManager(browser, max_tabs_per_bot=1, acquire_timeout=10)
+    try:
+        with pytest.raises(DeadlineExceeded):
+            main.execute_chat("deepseek", "q", deadline=time.time() + 1.0)
+        stats = main.tab_pool.get_stats()["deepseek"]
+    finally:
+        main.tab_pool = None
+
+    assert browser.stopped == [browser.tabs[0].tab_id]
+    assert stats["in_use"] == 0
+
+
+def test_timed_out_answer_is_not_cached_or_resumed(monkeypatch):
+    """等满最长等待时间的回答标记为截断：停止生成，不写入回答缓存，不作为可续接的对话"""
+    pytest.importorskip("fastapi")
+    import asyncio
+    import main
+    from adapters import deepseek_bot
+    from core import ResponseCache
+
+    monkeypatch.setattr(deepseek_bot, "MAX_WAIT_TIME", 1.0)
+    monkeypatch.setattr(main, "response_cache", ResponseCache())
+    timing = SiteTiming(first_token_delay=0.1, tokens_per_sec=10, answer_tokens=100)
+    browser = FakeBrowser(timing)
+    main.tab_pool = TabPoolManager(browser, max_tabs_per_bot=1, acquire_timeout=10)
+    messages = [main.ChatMessage(role="user", content="q")]
+    try:
+        result = asyncio.run(main.start_chat("deepseek", "q", messages=messages, cache_key="k").wait())
+        tab_info = main.tab_pool.pools["deepseek"][0]
+    finally:
+        main.tab_pool = None
+
+    assert result["finish_reason"] == "length"
+    assert main.build_response(result).choices[0].finish_reason == "length"
+    assert main.response_cache.get("k") is None
+    assert browser.stopped == [browser.tabs[0].tab_id]
+    assert tab_info.session_key is None
+
+
+def test_response_cache_lru_ttl_and_disk(tmp_path):
+    """内存层按 LRU 淘汰、按 TTL 过期；SQLite 层在重启（新实例）后仍可命中"""
+    from core import ResponseCache
+
+    cache = ResponseCache(max_entries=2, ttl=60)
+    cache.set("a", {"answer": "A"})
+    cache.set("b", {"answer": "B"})
+    assert cache.get("a") == {"answer": "A"}  # a 变为最近使用
+    cache.set("c", {"answer": "C"})
+    assert cache.get("b") is None and cache.get("a") and cache.get("c")
+    assert cache.stats()["evictions"] == 1
+
+    cache = ResponseCache(ttl=0.2)
+    cache.set("k", {"answer": "K"})
+    time.sleep(0.3)
+    assert cache.get("k") is None
+
+    db_path = str(tmp_path / "cache.db")
+    ResponseCache(db_path=db_path).set("k", {"answer": "K"})
+    restarted = ResponseCache(db_path=db_path)
+    assert restarted.get("k") == {"answer": "K"}
+    assert restarted.get("k") == {"answer": "K"}  # 已提升到内存层
+    assert restarted.stats()["disk_hits"] == 1 and restarted.stats()["hits"] == 1
+
+
+def test_chat_completions_cache_control(monkeypatch):
+    """接口的回答缓存：再次请求命中；no-cache 重新生成并刷新缓存；no-store 既不读也不写"""
+    pytest.importorskip("fastapi")
+    pytest.importorskip("httpx")
+    from fastapi.testclient import TestClient
+    import main
+    from core import ResponseCache
+
+    monkeypatch.setattr(main, "response_cache", ResponseCache())
+    browser = FakeBrowser(FAST)
+    main.tab_pool = TabPoolManager(browser, max_tabs_per_bot=1, acquire_timeout=10)
+    client = TestClient(main.app)
+
+    def ask(content, cache_control=None):
+        headers = {"Cache-Control": cache_control} if cache_control else {}
+        body = {"model": "deepseek", "messages": [{"role": "user", "content": content}]}
+        response = client.post("/v1/chat/completions", json=body, headers=headers)
+        assert response.status_code == 200
+        assert response.json()["choices"][0]["message"]["content"].startswith(f"Echo: {content}")
+        return response.headers["X-Cache"]
+
+    try:
+        assert ask("q") == "MISS"
+        assert ask("q") == "HIT"
+        assert len(browser.sent) == 1
+
+        assert ask("q", "no-cache") == "MISS"
+        assert len(browser.sent) == 2
+        assert main.response_cache.stats()["stores"] == 2
+
+        assert ask("other", "no-store") == "BYPASS"
+        assert ask("other") == "MISS"  # no-store 的回答没有写入
+        assert len(browser.sent) == 4
+    finally:
+        main.tab_pool = None
+
+
+def test_metrics_endpoint_exposes_phases_pool_and_cancellations():
+    """/metrics 抓取结果包含各阶段耗时直方图、标签页和队列指标、取消计数"""
+    pytest.importorskip("fastapi")
+    pytest.importorskip("httpx")
+    from fastapi.testclient import TestClient
+    import main
+    from adapters import GenerationCancelled
+
+    timing = SiteTiming(first_token_delay=0.1, tokens_per_sec=10, answer_tokens=100)
+    main.tab_pool = TabPoolManager(FakeBrowser(FAST), max_tabs_per_bot=1, acquire_timeout=10)
+    client = TestClient(main.app)
+    try:
+        body = {"model": "deepseek", "messages": [{"role": "user", "content": "q"}]}
+        assert client.post("/v1/chat/completions", json=body, headers={"Cache-Control": "no-store"}).status_code == 200
+
+        main.tab_pool = TabPoolManager(FakeBrowser(timing), max_tabs_per_bot=1, acquire_timeout=10)
+        cancel = threading.Event()
+        threading.Timer(0.5, cancel.set).start()
+        with pytest.raises(GenerationCancelled):
+            main.execute_chat("deepseek", "q", cancel_event=cancel)
+
+        response = client.get("/metrics")
+    finally:
+        main.tab_pool = None
+
+    assert response.status_code == 200
+    text = response.text
+    for phase in ("admission", "acquire", "ttft", "generation", "total"):
+        assert f'webllm_phase_seconds_count{{bot="deepseek",phase="{phase}"}}' in text
+    for gauge in ("webllm_tabs", "webllm_tabs_in_use", "webllm_queue_depth", "webllm_concurrency_limit"):
+        assert f'{gauge}{{bot="deepseek"}}' in text
+    assert 'webllm_cancellations_total{bot="deepseek",stage="generation"}' in text
+
+
+def test_cancel_stops_generation_and_frees_tab():
+    """取消后点击停止生成，立即归还标签页"""
+    pytest.importorskip("fastapi")
+    import main
+    from adapters import GenerationCancelled
+
+    timing = SiteTiming(first_token_delay=0.1, tokens_per_sec=10, answer_tokens=100)
+    browser = FakeBrowser(timing)
+    main.tab_pool = TabPoolManager(browser, max_tabs_per_bot=1, acquire_timeout=10)
+    cancel = threading.Event()
+    threading.Timer(0.5, cancel.set).start()
+    start = time.time()
+    try:
+        with pytest.raises(GenerationCancelled):
+            main.execute_chat("deepseek", "q", cancel_event=cancel)
+        stats = main.tab_pool.get_stats()["deepseek"]
+    finally:
+        main.tab_pool = None
+
+    assert time.time() - start < 2.0
+    assert browser.stopped == [browser.tabs[0].tab_id]
+    assert stats["in_use"] == 0
+
+
+def test_health_check_recycles_broken_tabs():
+    """巡检回收崩溃和掉登录的空闲标签页，并在后台补充"""
+    browser = FakeBrowser(FAST)
+    probe = lambda tab_info: BOTS[tab_info.bot_type][0](tab=tab_info.tab).probe()
+    pool = TabPoolManager(browser, max_tabs_per_bot=3, min_tabs_per_bot=3, health_callback=probe,
+                           maintenance_interval=0)
+    pool.warm_up(["deepseek"])
+    while pool.get_stats()["deepseek"]["total"] < 3:
+        time.sleep(0.01)
+    crashed, logged_out, healthy = [t.tab for t in pool.pools["deepseek"]]
+    crashed.crash()
+    logged_out.log_out()
+
+    assert pool.check_health() == 2
+    pool._worker.shutdown(wait=True)
+
+    stats = pool.get_stats()["deepseek"]
+    assert stats["unhealthy"] == 2
+    assert stats["total"] == 3 and stats["available"] == 3
+    assert crashed.closed and logged_out.closed and not healthy.closed
+    assert stats["tabs"][0]["health"] == "healthy"
+
+
+def test_health_check_skips_retained_conversations():
+    """巡检不暂停保留对话的标签页，续聊请求随时能拿到它"""
+    probed = []
+    pool = TabPoolManager(FakeBrowser(FAST), max_tabs_per_bot=2, maintenance_interval=0,
+                          health_callback=lambda tab_info: probed.append(tab_info))
+    session_tab, clean_tab = pool.acquire_tab("kimi"), pool.acquire_tab("kimi")
+    pool.bind_session(session_tab, "history")
+    pool.release_tab(session_tab)
+    pool.release_tab(clean_tab)
+
+    pool.check_health()
+
+    assert probed == [clean_tab]
+    assert pool.acquire_tab("kimi", session_key="history") is session_tab
+
+
+def test_memory_budget_evicts_heaviest_idle_tab():
+    """超出内存预算时先处理最重的空闲标签页：多余的关闭，保留的重新加载"""
+    pool = TabPoolManager(FakeBrowser(FAST), max_tabs_per_bot=3, min_tabs_per_bot=2, memory_budget_mb=100)
+    tabs = [pool.acquire_tab("kimi") for _ in range(3)]
+    for tab_info in tabs:
+        pool.release_tab(tab_info)
+    tabs[1].tab.leak(80)
+    tabs[2].tab.leak(40)
+    busy = pool.acquire_tab("kimi")
+
+    pool.sample_memory()
+    assert pool.get_stats()["kimi"]["tabs"][1]["js_heap_mb"] == 88.0
+    assert pool.enforce_memory_budget() == 1
+    assert tabs[1].tab.closed and not tabs[2].tab.closed
+
+    tabs[2].tab.leak(100)
+    pool.release_tab(busy)
+    pool.sample_memory()
+    assert pool.enforce_memory_budget() == 1  # 只剩预热数量，改为重新加载
+    pool._worker.shutdown(wait=True)
+
+    stats = pool.get_stats()["kimi"]
+    assert stats["evicted"] == 2 and stats["total"] == 2
+    assert tabs[2].tab.leaked == 0 and stats["available"] == 2
+
+
+def test_memory_budget_keeps_warm_tabs_across_browsers():
+    """多个浏览器都超出预算时，前面浏览器中关闭的标签页计入剩余数量，不会把某个模型的标签页全部关闭"""
+    pool = TabPoolManager([FakeBrowser(FAST), FakeBrowser(FAST)], max_tabs_per_bot=2, min_tabs_per_bot=1,
+                          memory_budget_mb=10)
+    tabs = [pool.acquire_tab("kimi") for _ in range(2)]
+    for tab_info in tabs:
+        pool.release_tab(tab_info)
+        tab_info.tab.leak(20)
+    assert {t.browser_id for t in tabs} == {0, 1}
+
+    pool.sample_memory()
+    assert pool.enforce_memory_budget() == 2
+    pool._worker.shutdown(wait=True)
+
+    assert sum(t.tab.closed for t in tabs) == 1
+    assert pool.get_stats()["kimi"]["total"] == 1
+
+
+def test_worn_tabs_are_reloaded():
+    """处理请求数或 DOM 节点数超过阈值的标签页重新加载，对话历史清空"""
+    pool = TabPoolManager(FakeBrowser(FAST), max_tabs_per_bot=1, max_requests_per_tab=2, max_dom_nodes=1000)
+    for query in ("a", "b"):
+        with pool.get_tab("deepseek") as tab_info:
+            BOTS["deepseek"][0](tab=tab_info.tab).ask(query)
+    assert pool.acquire_tab("deepseek") is tab_info  # 重新加载完成后才分配
+    assert tab_info.requests_served == 0 and tab_info.tab.site.history == []
+
+    for query in "cde":
+        BOTS["deepseek"][0](tab=tab_info.tab).ask(query)
+    pool.bind_session(tab_info, "conversation")
+    pool.release_tab(tab_info)
+    pool.sample_memory()
+    assert tab_info.dom_nodes == 1050
+    assert pool.recycle_worn_tabs() == 1
+    pool._worker.shutdown(wait=True)
+
+    stats = pool.get_stats()["deepseek"]
+    assert stats["recycled"] == 2 and stats["sessions"] == 0 and stats["created"] == 1
+
+
+def test_blocked_resources_are_not_downloaded():
+    """新标签页加载前设置资源拦截，之后的跳转同样生效，统计拦截数和实际下载量"""
+    from config import BLOCKED_URLS
+
+    browser = FakeBrowser(SiteTiming(bandwidth=10_000_000))
+    pool = TabPoolManager(browser, blocked_urls=BLOCKED_URLS)
+    tab_info = pool.acquire_tab("deepseek")
+    tab_info.tab.get(tab_info.url)
+
+    plain = FakeBrowser(browser.timing).new_tab("https://chat.deepseek.com/")
+    stats = pool.get_stats()["deepseek"]["tabs"][0]
+    assert stats["blocked"] == 8  # 每次加载拦下图片、字体和统计脚本
+    assert tab_info.loaded_bytes == tab_info.tab.loaded_bytes == 2 * 1_020_000
+    assert plain.loaded_bytes == 1_450_000
+
+
+def test_focus_free_tabs_never_take_focus():
+    """免焦点模式下并行的标签页不切到前台，新标签页开启焦点模拟"""
+    from adapters import base_bot
+    assert base_bot.FOCUS_FREE
+
+    browser = FakeBrowser(FAST)
+    pool = TabPoolManager(browser, max_tabs_per_bot=2, focus_free=True)
+    tabs = [pool.acquire_tab("yuanbao") for _ in range(2)]
+
+    def ask(tab_info):
+        bot = BOTS["yuanbao"][0](tab=tab_info.tab)
+        bot.activate()
+        bot.ask("q")
+
+    threads = [threading.Thread(target=ask, args=(t,)) for t in tabs]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(browser.sent) == 2
+    for tab in browser.tabs:
+        assert tab.activations == 0
+        assert tab.cdp_calls[0] == "Emulation.setFocusEmulationEnabled"
+        assert "Page.setWebLifecycleState" in tab.cdp_calls
+
+
+@pytest.mark.parametrize("bot_type", list(BOTS))
+def test_network_capture_reads_streamed_answer(bot_type, monkeypatch):
+    """网络捕获直接解析站点的流式响应，思考过程和回答按字段分开，不轮询页面；截获不到时退回读取页面"""
+    from adapters import base_bot
+    from simulator.fake_browser import default_responder
+    monkeypatch.setattr(base_bot, "CAPTURE_MODE", "network")
+    thought, answer = default_responder("你好", FAST, bot_type != "kimi")
+
+    for stream_content in (True, False):  # 不支持 streamResourceContent 时在响应结束后一次取回
+        browser = FakeBrowser(FAST, stream_content=stream_content)
+        bot = make_bot(browser, bot_type)
+        progress = []
+        bot.on_progress = lambda t, a: progress.append(a)
+
+        result = bot.ask("你好")
+
+        assert answer_of(result) == answer
+        if bot_type != "kimi":
+            assert result["thought"] == thought
+        assert not browser.tabs[0].site.extractors
+        assert progress and all(answer.startswith(p) for p in progress)
+        if stream_content:
+            assert len(progress) > 2
+        assert "ttft" in bot.timings
+
+    monkeypatch.setattr(base_bot, "CAPTURE_START_TIMEOUT", 0.3)
+    monkeypatch.setattr(BOTS[bot_type][0], "STREAM_URLS", ["*/no-such-api/*"])
+    browser = FakeBrowser(FAST)
+    bot = make_bot(browser, bot_type)
+    assert answer_of(bot.ask("你好")) == answer
+    assert browser.tabs[0].site.extractors
+
+
+def test_follower_keeps_generation_when_leader_leaves():
+    """合并到进行中请求的客户端在 admit_chat 返回前已登记，发起方随后断开不会取消该执行"""
+    pytest.importorskip("fastapi")
+    import asyncio
+    import main
+
+    browser = FakeBrowser(FAST)
+    main.tab_pool = TabPoolManager(browser, max_tabs_per_bot=1, acquire_timeout=10)
+
+    async def scenario():
+        leader = await main.admit_chat("deepseek", "q", flight_key="same-request")
+        follower = await main.admit_chat("deepseek", "q", flight_key="same-request")
+        assert follower is leader
+        leader.detach()
+        try:
+            return await follower.wait()
+        finally:
+            follower.detach()
+
+    try:
+        result = asyncio.run(scenario())
+    finally:
+        main.tab_pool = None
+
+    assert result["answer"].startswith("Echo: q")
+    assert len(browser.sent) == 1 and not browser.stopped
+
+
+def test_follower_does_not_inherit_tighter_deadline():
+    """进行中的相同请求截止时间更早时不合并：没有截止时间的请求单独执行并拿到完整回答"""
+    pytest.importorskip("fastapi")
+    import asyncio
+    import main
+    from core import DeadlineExceeded
+
+    slow = SiteTiming(first_token_delay=0.1, tokens_per_sec=10, answer_tokens=15)
+    browser = FakeBrowser(slow)
+    main.tab_pool = TabPoolManager(browser, max_tabs_per_bot=2, acquire_timeout=10)
+
+    async def scenario():
+        leader = await main.admit_chat("deepseek", "q", flight_key="same-request", deadline=time.time() + 1)
+        tighter = await main.admit_chat("deepseek", "q", flight_key="same-request", deadline=time.time() + 0.5)
+        patient = await main.admit_chat("deepseek", "q", flight_key="same-request")
+        assert tighter is leader and patient is not leader
+        try:
+            with pytest.raises(DeadlineExceeded):
+                await leader.wait()
+            return await patient.wait()
+        finally:
+            for stream in (leader, tighter, patient):
+                stream.detach()
+
+    try:
+        result = asyncio.run(scenario())
+    finally:
+        main.tab_pool = None
+
+    assert result["answer"].startswith("Echo: q")
+    assert len(browser.sent) == 2
+
+
+def test_chat_stream_survives_rerendered_text():
+    """页面渲染改写已轮询到的文本时，流式增量拼起来仍与最终回答一致，之后继续推送"""
+    import asyncio
+    from core import ChatStream
+
+    async def collect(stream):
+        return [(kind, payload) for kind, payload in [e async for e in stream] if kind != "done"]
+
+    stream = ChatStream()
+    stream.push("", "Hello *wor")  # 未闭合的强调标记先不发送
+    stream.push("", "Hello world, how")
+    stream.finish({"thought": "", "answer": "Hello world, how are you?"})
+    assert "".join(text for _, text in asyncio.run(collect(stream))) == "Hello world, how are you?"
+
+    stream = ChatStream()
+    stream.push("", "1. one\n2. tw")
+    stream.push("", "one\ntwo\nthree")   # 已发送的列表序号被渲染去掉，从共同前缀之后补发
+    stream.push("", "one\ntwo\nthree four")
+    stream.finish({"thought": "", "answer": "one\ntwo\nthree four"})
+    deltas = [text for _, text in asyncio.run(collect(stream))]
+    assert deltas == ["1. one\n2. tw", "one\ntwo\nthree", " four"]
+
+
+def test_chat_stream_keeps_streaming_plain_text_with_markdown_characters():
+    """只暂缓未闭合的 Markdown 标记：普通文本中的 < _ [ 不会让本段后续内容停止推送"""
+    import asyncio
+    from core import ChatStream
+
+    async def collect(stream):
+        return [payload for kind, payload in [e async for e in stream] if kind == "answer"]
+
+    stream = ChatStream()
+    text = ""
+    for piece in ("如果 a < b 则继续", "生成 my_var", " see [1] and", " **bo", "ld** done"):
+        text += piece
+        stream.push("", text)
+    stream.finish({"thought": "", "answer": text + "."})
+    assert asyncio.run(collect(stream)) == ["如果 a < b 则继续", "生成 my_var", " see [1] and", " ", "**bold** done", "."]
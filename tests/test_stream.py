@@ -0,0 +1,19 @@
+from openai import OpenAI
+
+client = OpenAI(base_url="http://127.0.0.1:8000/v1", api_key="not-needed")
+
+# 流式输出：边生成边打印
+stream = client.chat.completions.create(
+    model="deepseek",
+    messages=[{"role": "user", "content": "用三句话介绍一下长城"}],
+    stream=True
+)
+
+for chunk in stream:
+    delta = chunk.choices[0].delta
+    thought = getattr(delta, "reasoning_content", None)
+    if thought:
+        print(thought, end="", flush=True)
+    if delta.content:
+        print(delta.content, end="", flush=True)
+print()